@@ -1,5 +1,7 @@
 import streamlit as st
 
+from metrics_exporter import get_metrics_exporter
+
 LOGO_URL = "https://cdn.analogdata.ai/static/images/logo/ad_logo.png"
 
 # ---------------------------------------------------------------------------
@@ -15,5 +17,8 @@ dashboard = st.Page("pages/0_dashboard.py", title="Dashboard", icon="📊", defa
 publisher = st.Page("pages/1_publisher.py", title="Publisher", icon="📤")
 subscriber = st.Page("pages/2_subscriber.py", title="Subscriber", icon="📥")
 
+# Optional Prometheus endpoint on its own port when MQTT_METRICS_PORT is set; started once per process
+get_metrics_exporter()
+
 nav = st.navigation([dashboard, publisher, subscriber])
 nav.run()
@@ -0,0 +1,70 @@
+"""
+Ingest throughput: object ring buffer vs. columnar arena.
+
+Feeds N messages through each store's ``ingest`` path (what the
+subscriber's on_message does per message) with the topic index enabled,
+and reports sustained msgs/sec plus retained bytes per message
+(tracemalloc, store contents only).
+
+Usage:
+    python benchmarks/ingest_rate.py --count 500000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_store import ColumnarStore, RingBufferStore  # noqa: E402
+from topic_index import TopicIndex  # noqa: E402
+
+
+def _wire_messages(count: int, topics: int) -> list[tuple[str, bytes]]:
+    names = [sys.intern(f"sensors/device-{i:04d}/temperature") for i in range(topics)]
+    return [(names[i % topics], b'{"value": %d.5, "unit": "C"}' % (i % 100)) for i in range(count)]
+
+
+def _ingest_all(store, wire) -> float:
+    ingest, now = store.ingest, time.time()
+    t0 = time.perf_counter()
+    for topic, payload in wire:
+        ingest(topic, payload, 1, False, now)
+    return time.perf_counter() - t0
+
+
+def measure(cls, wire, max_messages: int) -> tuple[float, float]:
+    """Return (msgs/sec, bytes allocated per retained message) for ``cls``."""
+    # tracemalloc slows ingest down, so the rate comes from a separate untraced pass
+    tracemalloc.start()
+    store = cls(max_messages, 1 << 30, index=TopicIndex())
+    _ingest_all(store, wire)
+    allocated, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_msg = allocated / len(store)
+    del store
+    rate = len(wire) / _ingest_all(cls(max_messages, 1 << 30, index=TopicIndex()), wire)
+    return rate, per_msg
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=500_000)
+    parser.add_argument("--topics", type=int, default=100, help="Distinct topics in the stream")
+    parser.add_argument("--max-messages", type=int, default=200_000, help="Store capacity (eviction kicks in beyond)")
+    args = parser.parse_args()
+
+    # The object store keeps paho's payload bytes alive; the arena copies them
+    wire = _wire_messages(args.count, args.topics)
+    payload_obj = sum(sys.getsizeof(p) for _t, p in wire) / len(wire)
+
+    print(f"{args.count:,} messages, {args.topics} topics, capacity {args.max_messages:,}")
+    for name, cls, extra in (("objects ", RingBufferStore, payload_obj), ("columnar", ColumnarStore, 0.0)):
+        rate, per_msg = measure(cls, wire, args.max_messages)
+        print(f"{name}  {rate:10,.0f} msgs/s   {per_msg + extra:7.1f} B/msg retained")
+
+
+if __name__ == "__main__":
+    main()
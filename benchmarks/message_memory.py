@@ -0,0 +1,98 @@
+"""
+Memory per buffered message: legacy dataclass vs. compact MQTTMessage.
+
+Builds N messages the way each version's on_message does and reports the
+bytes allocated per message (tracemalloc) and the construction time.
+
+Usage:
+    python benchmarks/message_memory.py --count 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_store import MQTTMessage  # noqa: E402
+
+
+@dataclass
+class LegacyMQTTMessage:
+    """The message representation before compaction, kept here for comparison."""
+    topic: str
+    payload: str
+    qos: int
+    retain: bool
+    timestamp: str
+    seq: int = 0
+
+
+def _wire_messages(count: int, topics: int) -> list[tuple[bytes, bytes]]:
+    """(topic, payload) byte pairs as paho would hand them to on_message."""
+    return [
+        (f"sensors/device-{i % topics:04d}/temperature".encode(), b'{"value": %d.5, "unit": "C"}' % (i % 100))
+        for i in range(count)
+    ]
+
+
+def build_legacy(wire: list[tuple[bytes, bytes]]) -> list:
+    return [
+        LegacyMQTTMessage(
+            topic=topic.decode("utf-8"),
+            payload=payload.decode("utf-8", errors="replace"),
+            qos=1,
+            retain=False,
+            timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            seq=i,
+        )
+        for i, (topic, payload) in enumerate(wire)
+    ]
+
+
+def build_compact(wire: list[tuple[bytes, bytes]]) -> list:
+    return [
+        MQTTMessage(sys.intern(topic.decode("utf-8")), payload, 1, False, time.time(), seq=i)
+        for i, (topic, payload) in enumerate(wire)
+    ]
+
+
+def measure(builder, wire) -> tuple[float, float]:
+    """Return (bytes per message, seconds) for building the messages."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    messages = builder(wire)
+    elapsed = time.perf_counter() - t0
+    allocated, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages
+    return allocated / len(wire), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--topics", type=int, default=100, help="Distinct topics in the stream")
+    args = parser.parse_args()
+
+    # The wire payload bytes exist in both cases (paho allocates them); the
+    # compact message keeps that object alive while the legacy one drops it
+    wire = _wire_messages(args.count, args.topics)
+
+    legacy_per_msg, legacy_s = measure(build_legacy, wire)
+    compact_per_msg, compact_s = measure(build_compact, wire)
+    payload_bytes = sum(sys.getsizeof(p) for _t, p in wire) / len(wire)
+
+    print(f"{args.count:,} messages, {args.topics} topics")
+    print(f"legacy   {legacy_per_msg:7.1f} B/msg   {legacy_per_msg * args.count / 2**20:8.1f} MiB   build {legacy_s:.2f}s")
+    print(f"compact  {compact_per_msg + payload_bytes:7.1f} B/msg   "
+          f"{(compact_per_msg + payload_bytes) * args.count / 2**20:8.1f} MiB   build {compact_s:.2f}s"
+          f"   (incl. {payload_bytes:.0f} B retained payload bytes object)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Publish latency: pooled connection vs. a new client per message.
+
+Usage:
+    python benchmarks/publish_latency.py --host localhost --port 1883 --count 200 --qos 1
+    python benchmarks/publish_latency.py --local-broker   # in-process broker, no Mosquitto needed
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_broker import LocalBroker  # noqa: E402
+from mqtt_client import get_publisher_pool, publish_message  # noqa: E402
+
+
+def measure(host: str, port: int, count: int, qos: int, pooled: bool) -> list[float]:
+    """Return per-publish latencies in milliseconds."""
+    latencies = []
+    for i in range(count):
+        t0 = time.perf_counter()
+        publish_message(host, port, "bench/publish_latency", f"msg-{i}", qos=qos, pooled=pooled)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
+
+
+def summarize(label: str, latencies: list[float]) -> str:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (f"{label:<10} mean {statistics.mean(ordered):8.2f} ms   p50 {statistics.median(ordered):8.2f} ms"
+            f"   p95 {p95:8.2f} ms   max {ordered[-1]:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--qos", type=int, choices=[0, 1, 2], default=1)
+    parser.add_argument("--local-broker", action="store_true", help="Run against an in-process broker on loopback")
+    args = parser.parse_args()
+
+    broker = None
+    if args.local_broker:
+        broker = LocalBroker().start()
+        args.host, args.port = broker.host, broker.port
+
+    per_call = measure(args.host, args.port, args.count, args.qos, pooled=False)
+    pooled = measure(args.host, args.port, args.count, args.qos, pooled=True)
+    get_publisher_pool().close_all()
+    if broker is not None:
+        broker.stop()
+
+    print(f"{args.count} publishes, QoS {args.qos}, broker {args.host}:{args.port}")
+    print(summarize("per-call", per_call))
+    print(summarize("pooled", pooled))
+    print(f"speed-up  {statistics.mean(per_call) / statistics.mean(pooled):.1f}x (mean)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Benchmark suite: publish latency, bulk throughput, ingest rate, read cost
+and UI render cost, emitted as JSON for tracking regressions.
+
+Runs against the in-process LocalBroker by default, so results do not
+depend on network or a Mosquitto install; ``--broker host:port`` targets a
+real broker instead.
+
+Usage:
+    python benchmarks/suite.py --output bench.json
+    python benchmarks/suite.py --quick --only publish_latency,ingest_rate
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_publish import parallel_bulk_publish  # noqa: E402
+from local_broker import LocalBroker  # noqa: E402
+from message_store import ColumnarStore, RingBufferStore  # noqa: E402
+from mqtt_client import MQTTSubscriber, get_publisher_pool, publish_message  # noqa: E402
+from topic_index import TopicIndex  # noqa: E402
+
+SUITE_VERSION = 1
+
+
+def _percentiles(samples_ms: list[float]) -> dict:
+    ordered = sorted(samples_ms)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    return {
+        "mean_ms": statistics.mean(ordered),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": ordered[-1],
+    }
+
+
+def _wait_until(predicate: Callable[[], bool], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.002)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks — each returns a list of {"name", "params", "metrics"} results
+# ---------------------------------------------------------------------------
+
+def bench_publish_latency(host: str, port: int, quick: bool) -> list[dict]:
+    """Pooled publish_message round trip per QoS."""
+    count = 200 if quick else 2000
+    results = []
+    for qos in (0, 1, 2):
+        publish_message(host, port, "bench/latency", "warmup", qos=qos)
+        samples = []
+        for i in range(count):
+            t0 = time.perf_counter()
+            publish_message(host, port, "bench/latency", f"msg-{i}", qos=qos)
+            samples.append((time.perf_counter() - t0) * 1000)
+        results.append({"name": "publish_latency", "params": {"qos": qos, "count": count},
+                        "metrics": _percentiles(samples)})
+    get_publisher_pool().close_all()
+    return results
+
+
+def bench_bulk_publish(host: str, port: int, quick: bool) -> list[dict]:
+    """parallel_bulk_publish throughput across connection counts."""
+    count = 5_000 if quick else 50_000
+    items = [{"topic": f"bench/bulk/{i % 64}", "payload": f'{{"i": {i}}}', "qos": 1} for i in range(count)]
+    results = []
+    for connections in (1, 4):
+        result = parallel_bulk_publish(host, port, items, connections=connections, window=200)
+        results.append({
+            "name": "bulk_publish",
+            "params": {"count": count, "connections": connections, "qos": 1},
+            "metrics": {"msgs_per_sec": result.msgs_per_sec, "elapsed_s": result.elapsed, "failed": result.failed},
+        })
+    return results
+
+
+def _raw_publisher(host: str, port: int) -> socket.socket:
+    """A bare MQTT 3.1.1 connection, so the publisher side is never the bottleneck."""
+    def string(b: bytes) -> bytes:
+        return len(b).to_bytes(2, "big") + b
+
+    sock = socket.create_connection((host, port))
+    body = string(b"MQTT") + bytes([4, 0x02]) + (0).to_bytes(2, "big") + string(b"bench-raw-publisher")
+    sock.sendall(bytes([0x10, len(body)]) + body)
+    sock.recv(4)  # CONNACK
+    return sock
+
+
+def bench_ingest_rate(host: str, port: int, quick: bool) -> list[dict]:
+    """Messages/sec through the subscriber's on_message into each store."""
+    count = 50_000 if quick else 500_000
+    topics = [f"bench/ingest/device-{i:03d}".encode() for i in range(100)]
+    payload = b'{"value": 21.5, "unit": "C"}'
+    packets = []
+    for i in range(count):
+        topic = topics[i % len(topics)]
+        body = len(topic).to_bytes(2, "big") + topic + payload
+        packets.append(bytes([0x30, len(body)]) + body)
+    wire = b"".join(packets)
+
+    results = []
+    for store_name, store in (("columnar", ColumnarStore(count, 1 << 30, index=TopicIndex())),
+                              ("objects", RingBufferStore(count, 1 << 30, index=TopicIndex()))):
+        sub = MQTTSubscriber(store)
+        sub.start(host, port, ["bench/ingest/#"])
+        _wait_until(lambda: sub.active, 5)
+        time.sleep(0.2)  # let the SUBACK land before publishing
+        sock = _raw_publisher(host, port)
+        t0 = time.perf_counter()
+        sock.sendall(wire)
+        complete = _wait_until(lambda: store.stats().total_seen >= count, 120)
+        elapsed = time.perf_counter() - t0
+        sock.close()
+        sub.stop()
+        results.append({
+            "name": "ingest_rate",
+            "params": {"count": count, "store": store_name, "payload_bytes": len(payload)},
+            "metrics": {"msgs_per_sec": store.stats().total_seen / elapsed, "elapsed_s": elapsed,
+                        "received": store.stats().total_seen, "complete": complete},
+        })
+    return results
+
+
+def bench_read_cost(_host: str, _port: int, quick: bool) -> list[dict]:
+    """get_messages() (full copy) vs tail(100) as the buffer grows."""
+    sizes = (1_000, 10_000, 50_000) if quick else (1_000, 10_000, 50_000, 200_000)
+    payload = b'{"value": 21.5}'
+    results = []
+    for size in sizes:
+        store = ColumnarStore(size, 1 << 30, index=TopicIndex())
+        for i in range(size):
+            store.ingest(f"bench/read/{i % 100}", payload, 0, False, float(i))
+        sub = MQTTSubscriber(store)
+        repeats = max(3, 200_000 // size)
+        for label, read in (("get_messages", sub.get_messages), ("tail_100", lambda: sub.tail(100))):
+            samples = []
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                read()
+                samples.append((time.perf_counter() - t0) * 1000)
+            results.append({"name": "read_cost", "params": {"buffer_size": size, "read": label},
+                            "metrics": _percentiles(samples)})
+    return results
+
+
+def _render_cards(n: int, mode: str):
+    import time as _time
+    from datetime import datetime as _datetime
+
+    import streamlit as _st
+
+    from branding import message_card_html, render_message_card
+
+    now = _time.time()
+    rows = [(f"bench/render/{i % 10}", b'{"value": %d}' % i, 1, i % 7 == 0, now + i) for i in range(n)]
+    if mode == "cards":
+        # One st.markdown element per card (the pre-batching renderer)
+        for topic, payload, qos, retain, ts in rows:
+            render_message_card(topic, payload, qos, retain, _time.strftime("%Y-%m-%d %H:%M:%S"))
+    elif mode == "batched":
+        if rows:
+            _st.markdown("".join(message_card_html(topic, payload, qos, retain, _time.strftime("%Y-%m-%d %H:%M:%S"))
+                                 for topic, payload, qos, retain, ts in rows), unsafe_allow_html=True)
+    else:
+        _st.dataframe({"Time": [_datetime.fromtimestamp(r[4]) for r in rows], "Topic": [r[0] for r in rows],
+                       "Payload": [r[1].decode() for r in rows], "QoS": [r[2] for r in rows],
+                       "Retained": [r[3] for r in rows]}, hide_index=True)
+
+
+def bench_render_cost(_host: str, _port: int, quick: bool) -> list[dict]:
+    """One Streamlit script run rendering N messages (AppTest, no browser).
+
+    ``cards`` emits one element per message, ``batched`` one element for
+    all of them, ``table`` one ``st.dataframe``.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    def run_ms(n: int, mode: str) -> list[float]:
+        samples = []
+        for _ in range(3):
+            at = AppTest.from_function(_render_cards, args=(n, mode), default_timeout=120)
+            t0 = time.perf_counter()
+            at.run()
+            samples.append((time.perf_counter() - t0) * 1000)
+        return samples
+
+    # An empty run is the fixed cost of a script run; per-card cost is measured on top of it
+    baseline = statistics.median(run_ms(0, "cards"))
+    results = []
+    for mode in ("cards", "batched", "table"):
+        for n in (10, 100, 500) if quick else (10, 100, 500, 2000):
+            metrics = _percentiles(run_ms(n, mode))
+            metrics["baseline_ms"] = baseline
+            metrics["per_card_ms"] = max(0.0, metrics["p50_ms"] - baseline) / n
+            results.append({"name": "render_cost", "params": {"cards": n, "mode": mode}, "metrics": metrics})
+    return results
+
+
+BENCHMARKS: dict[str, Callable[[str, int, bool], list[dict]]] = {
+    "publish_latency": bench_publish_latency,
+    "bulk_publish": bench_bulk_publish,
+    "ingest_rate": bench_ingest_rate,
+    "read_cost": bench_read_cost,
+    "render_cost": bench_render_cost,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--broker", help="host:port of an external broker (default: in-process LocalBroker)")
+    parser.add_argument("--only", help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="Smaller counts, for CI smoke runs")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    broker = None
+    if args.broker:
+        host, _, port = args.broker.rpartition(":")
+        port = int(port)
+    else:
+        broker = LocalBroker().start()
+        host, port = broker.host, broker.port
+
+    results = []
+    try:
+        for name in selected:
+            print(f"running {name}…", file=sys.stderr)
+            t0 = time.perf_counter()
+            results.extend(BENCHMARKS[name](host, port, args.quick))
+            print(f"  done in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    report = {
+        "suite_version": SUITE_VERSION,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "broker": args.broker or "local",
+        "quick": args.quick,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,14 @@ Font: Google Outfit
 Theme: Light with amber/orange gradient accents
 """
 
+import html
+from collections.abc import Iterable, Sequence
+
 import streamlit as st
 
+from live_metrics import format_bytes
+from payload_view import KIND_LABELS, preview, sniff
+
 # Brand colors — official Analog Data design guidelines
 AMBER_500 = "#f59e0b"       # Primary gradient start
 ORANGE_400 = "#fb923c"      # Gradient middle
@@ -132,6 +138,12 @@ CUSTOM_CSS = """
         word-break: break-all;
         overflow-wrap: break-word;
     }
+    .stat-card .stat-sparkline {
+        display: block;
+        width: 100%;
+        height: 28px;
+        margin-top: 8px;
+    }
     .stat-card .stat-label {
         font-family: 'Outfit', sans-serif !important;
         font-size: 0.78rem;
@@ -175,6 +187,9 @@ CUSTOM_CSS = """
         word-break: break-all;
         border: 1px solid #f1f5f9;
     }
+    .msg-card .msg-truncated {
+        color: #94a3b8;
+    }
     .msg-card .msg-meta {
         font-family: 'Outfit', sans-serif !important;
         font-size: 0.72rem;
@@ -497,12 +512,29 @@ def render_footer():
     )
 
 
-def render_stat_card(value: str, label: str):
-    """Render a stat card with gradient value text."""
+def _sparkline_svg(values: Sequence[float]) -> str:
+    """Inline SVG polyline of ``values`` scaled to the card width, zero at the bottom."""
+    if len(values) < 2:
+        return ""
+    top = max(values) or 1
+    step = 100 / (len(values) - 1)
+    points = " ".join(f"{i * step:.1f},{28 - 26 * v / top:.1f}" for i, v in enumerate(values))
+    return (
+        '<svg class="stat-sparkline" viewBox="0 0 100 28" preserveAspectRatio="none">'
+        f'<polyline points="0,28 {points} 100,28" fill="{AMBER_300}" fill-opacity="0.35" stroke="none"/>'
+        f'<polyline points="{points}" fill="none" stroke="{AMBER_500}" stroke-width="1.5" '
+        'vector-effect="non-scaling-stroke"/></svg>'
+    )
+
+
+def render_stat_card(value: str, label: str, sparkline: Sequence[float] | None = None):
+    """Render a stat card with gradient value text and an optional sparkline underneath."""
+    spark = _sparkline_svg(sparkline) if sparkline else ""
     st.markdown(
         f"""
         <div class="stat-card">
             <div class="stat-value">{value}</div>
+            {spark}
             <div class="stat-label">{label}</div>
         </div>
         """,
@@ -534,21 +566,45 @@ def render_action_card(icon_key: str, title: str, description: str):
     )
 
 
-def render_message_card(topic: str, payload: str, qos: int, retain: bool, timestamp: str):
-    """Render a single MQTT message card."""
+def message_card_html(topic: str, payload: bytes, qos: int, retain: bool, timestamp: str) -> str:
+    """HTML for one message card, escaped and on a single line.
+
+    Only a preview of the payload is decoded and escaped (see
+    :func:`payload_view.preview`); the card also shows its kind and size.
+    Newlines become character references: a blank line inside the payload
+    would otherwise end Markdown's HTML block and leak the rest as text.
+    """
+    kind = sniff(payload)
+    text, truncated = preview(payload, kind)
     retain_badge = " · 📌 retained" if retain else ""
-    st.markdown(
-        f"""
-        <div class="msg-card">
-            <div class="msg-topic">{topic}</div>
-            <div class="msg-payload">{payload}</div>
-            <div class="msg-meta">QoS {qos}{retain_badge} · {timestamp}</div>
-        </div>
-        """,
-        unsafe_allow_html=True,
+    payload_html = html.escape(text).replace("\n", "&#10;")
+    if truncated:
+        payload_html += '<span class="msg-truncated"> …</span>'
+    return (
+        f'<div class="msg-card"><div class="msg-topic">{html.escape(topic)}</div>'
+        f'<div class="msg-payload">{payload_html}</div>'
+        f'<div class="msg-meta">QoS {qos}{retain_badge} · {KIND_LABELS[kind]} · {format_bytes(len(payload))}'
+        f' · {timestamp}</div></div>'
     )
 
 
+def render_message_card(topic: str, payload: bytes, qos: int, retain: bool, timestamp: str):
+    """Render a single MQTT message card."""
+    st.markdown(message_card_html(topic, payload, qos, retain, timestamp), unsafe_allow_html=True)
+
+
+def render_message_cards(messages: Iterable) -> int:
+    """Render message cards for ``messages`` as one Markdown element; returns how many.
+
+    One element per refresh instead of one per card keeps the Streamlit
+    delta and the browser's DOM work flat as the visible window grows.
+    """
+    cards = [message_card_html(m.topic, m.raw, m.qos, m.retain, m.timestamp) for m in messages]
+    if cards:
+        st.markdown("".join(cards), unsafe_allow_html=True)
+    return len(cards)
+
+
 def render_status_badge(active: bool, topic: str = ""):
     """Render an active/stopped status badge (pill style)."""
     if active:
@@ -0,0 +1,543 @@
+"""
+Pipelined bulk publishing.
+Each connection keeps a window of QoS 1/2 messages in flight and collects
+PUBACK/PUBCOMP asynchronously instead of waiting for each acknowledgement
+in turn. Large batches can be sharded across several connections, hashed
+by topic so per-topic order is preserved, and streamed from NDJSON/CSV
+files without holding the whole batch in memory.
+"""
+
+import csv
+import json
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+import zlib
+from collections.abc import Callable, Iterable, Iterator, Sized
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO
+
+import paho.mqtt.client as mqtt
+
+MAX_REPORTED_FAILURES = 1000
+# Accepted spellings of a retain flag in JSON and CSV items (compared lower-cased)
+RETAIN_TRUE = ("1", "true", "yes")
+RETAIN_FALSE = ("0", "false", "no", "")
+
+ProgressCallback = Callable[[int, int | None], None]
+# Called on the network thread with each message's publish-to-ack latency in seconds
+AckCallback = Callable[[float], None]
+
+
+@dataclass
+class BulkFailure:
+    index: int
+    topic: str
+    error: str
+
+
+@dataclass
+class BulkPublishResult:
+    total: int
+    succeeded: int
+    failed: int
+    elapsed: float
+    # Only the first MAX_REPORTED_FAILURES failures are kept; ``failed`` counts all
+    failures: list[BulkFailure] = field(default_factory=list)
+
+    @property
+    def msgs_per_sec(self) -> float:
+        return self.succeeded / self.elapsed if self.elapsed > 0 else 0.0
+
+
+@dataclass
+class InvalidRow:
+    """Placeholder yielded by a file source for a row that could not be parsed."""
+    error: str
+
+
+def _parse_retain(value: Any) -> bool:
+    """A retain flag as a bool; unrecognised values are rejected rather than guessed."""
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in RETAIN_TRUE:
+        return True
+    if text in RETAIN_FALSE:
+        return False
+    raise ValueError(f"invalid retain flag {value!r}")
+
+
+def parse_item(item: Any) -> tuple[str, str, int, bool]:
+    """Validate one bulk item and return (topic, payload, qos, retain)."""
+    if isinstance(item, InvalidRow):
+        raise ValueError(item.error)
+    if not isinstance(item, dict):
+        raise ValueError("item must be a JSON object")
+    topic = item.get("topic", "")
+    if not topic:
+        raise ValueError("missing topic")
+    qos = int(item.get("qos", 0))
+    if qos not in (0, 1, 2):
+        raise ValueError(f"invalid QoS {qos}")
+    return topic, str(item.get("payload", "")), qos, _parse_retain(item.get("retain", False))
+
+
+def _item_topic(item: Any) -> str:
+    return str(item.get("topic", "")) if isinstance(item, dict) else ""
+
+
+class FileItemSource:
+    """Iterates bulk items from an NDJSON or CSV byte stream, one row at a time.
+
+    CSV files need a header row with at least a ``topic`` column and may
+    also have ``payload``, ``qos`` and ``retain`` (1/0, true/false or
+    yes/no; anything else fails that row). ``bytes_read``, ``rows``
+    and ``invalid`` are updated as the source is consumed so callers can
+    report progress while publishing.
+    """
+
+    FORMATS = ("ndjson", "csv")
+
+    def __init__(self, fileobj: BinaryIO, fmt: str):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported format {fmt!r}, expected one of {self.FORMATS}")
+        self._fileobj = fileobj
+        self._fmt = fmt
+        self.bytes_read = 0
+        self.rows = 0
+        self.invalid = 0
+
+    def __iter__(self) -> Iterator[Any]:
+        return self._iter_ndjson() if self._fmt == "ndjson" else self._iter_csv()
+
+    def _lines(self) -> Iterator[bytes]:
+        for raw in self._fileobj:
+            self.bytes_read += len(raw)
+            yield raw
+
+    def _iter_ndjson(self) -> Iterator[Any]:
+        for lineno, raw in enumerate(self._lines(), 1):
+            line = raw.strip()
+            if not line:
+                continue
+            self.rows += 1
+            try:
+                yield json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                self.invalid += 1
+                yield InvalidRow(f"line {lineno}: {e}")
+
+    def _iter_csv(self) -> Iterator[Any]:
+        reader = csv.DictReader(raw.decode("utf-8", errors="replace") for raw in self._lines())
+        if reader.fieldnames is None or "topic" not in reader.fieldnames:
+            raise ValueError("CSV header must include a 'topic' column")
+        for row in reader:
+            self.rows += 1
+            if None in row:
+                self.invalid += 1
+                yield InvalidRow(f"line {reader.line_num}: too many fields")
+                continue
+            yield {
+                "topic": row.get("topic") or "",
+                "payload": row.get("payload") or "",
+                "qos": row.get("qos") or 0,
+                "retain": row.get("retain") or "",
+            }
+
+
+class _FailureLog:
+    """Counts every failure but only keeps the first ``limit`` for reporting."""
+
+    def __init__(self, limit: int = MAX_REPORTED_FAILURES):
+        self.limit = limit
+        self.count = 0
+        self.items: list[BulkFailure] = []
+
+    def add(self, failure: BulkFailure):
+        self.count += 1
+        if len(self.items) < self.limit:
+            self.items.append(failure)
+
+
+class _AckTracker:
+    """Maps paho message ids to item indexes and counts completed acks.
+
+    ``on_publish`` can fire on the network thread before ``publish()`` has
+    returned the mid to the sender, so early acks are parked (with their
+    arrival time) until the sender registers them.
+    """
+
+    def __init__(self, window: int, on_ack: AckCallback | None = None):
+        self.lock = threading.Lock()
+        self.window = threading.Semaphore(window)
+        self.pending: dict[int, tuple[int, str, float]] = {}
+        self.early: dict[int, float] = {}
+        self.acked = 0
+        self.on_ack = on_ack
+
+    def register(self, mid: int, index: int, topic: str, sent: float):
+        with self.lock:
+            acked_at = self.early.pop(mid, None)
+            if acked_at is None:
+                self.pending[mid] = (index, topic, sent)
+                return
+            self.acked += 1
+        self.window.release()
+        if self.on_ack is not None:
+            self.on_ack(acked_at - sent)
+
+    def on_publish(self, _client, _userdata, mid, _reason_code=None, _properties=None):
+        now = time.perf_counter()
+        with self.lock:
+            entry = self.pending.pop(mid, None)
+            if entry is None:
+                self.early[mid] = now
+                return
+            self.acked += 1
+        self.window.release()
+        if self.on_ack is not None:
+            self.on_ack(now - entry[2])
+
+
+def bulk_publish(
+    broker_host: str,
+    broker_port: int,
+    items: Iterable[Any],
+    window: int = 100,
+    timeout: float = 30.0,
+    username: str | None = None,
+    password: str | None = None,
+    on_progress: ProgressCallback | None = None,
+    progress_interval: float = 0.1,
+    on_ack: AckCallback | None = None,
+) -> BulkPublishResult:
+    """Publish ``items`` (dicts with topic/payload/qos/retain) on one connection.
+
+    At most ``window`` messages are unacknowledged at any time. Items that
+    fail validation or are not acknowledged within ``timeout`` seconds of
+    the last send are reported as failures. If the window stays full with
+    no acknowledgement for ``timeout`` seconds (a stalled broker or a dropped
+    connection), the remaining items are reported as failures unsent.
+    ``items`` is consumed lazily, so generators are published in constant
+    memory.
+
+    ``on_progress(acked, total)`` is called from the caller's thread,
+    driven by acknowledgements; ``total`` is None when ``items`` has no
+    length. ``on_ack(latency)`` is called on the network thread for every
+    acknowledged message.
+    """
+    total = len(items) if isinstance(items, Sized) else None
+    return _publish_indexed(
+        broker_host, broker_port, enumerate(items), total, window, timeout,
+        username, password, on_progress, progress_interval, on_ack,
+    )
+
+
+def shard_for_topic(topic: str, shards: int) -> int:
+    """Stable shard index for ``topic`` (same topic → same connection)."""
+    return zlib.crc32(topic.encode("utf-8")) % shards
+
+
+def parallel_bulk_publish(
+    broker_host: str,
+    broker_port: int,
+    items: Iterable[Any],
+    connections: int = 4,
+    use_processes: bool = False,
+    window: int = 100,
+    timeout: float = 30.0,
+    username: str | None = None,
+    password: str | None = None,
+    on_progress: ProgressCallback | None = None,
+    progress_interval: float = 0.1,
+    on_ack: AckCallback | None = None,
+) -> BulkPublishResult:
+    """Shard ``items`` by topic across ``connections`` pipelined connections.
+
+    Messages for one topic always go through the same connection in input
+    order, so per-topic ordering matches :func:`bulk_publish`. With threads
+    (the default) items are streamed to the shards through bounded queues.
+    ``use_processes`` sidesteps the GIL, but each shard's items are
+    materialised to send them to the worker process and progress is only
+    reported as whole shards finish, and ``on_ack`` is not called.
+    """
+    if connections <= 1:
+        return bulk_publish(broker_host, broker_port, items, window, timeout, username, password,
+                            on_progress, progress_interval, on_ack)
+    if use_processes:
+        return _publish_sharded_processes(broker_host, broker_port, items, connections, window, timeout,
+                                          username, password, on_progress, progress_interval)
+
+    total = len(items) if isinstance(items, Sized) else None
+    acked_by_shard = [0] * connections
+    queues: list[queue.Queue] = [queue.Queue(maxsize=max(2 * window, 256)) for _ in range(connections)]
+    last_report = 0.0
+
+    def report(force: bool = False):
+        nonlocal last_report
+        now = time.monotonic()
+        if on_progress is not None and (force or now - last_report >= progress_interval):
+            last_report = now
+            on_progress(sum(acked_by_shard), total)
+
+    def shard_progress(i: int) -> ProgressCallback:
+        def update(acked: int, _total: int | None):
+            acked_by_shard[i] = acked
+        return update
+
+    start = time.perf_counter()
+    consumed = 0
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="bulk-publish") as executor:
+        futures = [
+            executor.submit(_publish_from_queue, broker_host, broker_port, q, window, timeout,
+                            username, password, shard_progress(i), progress_interval, on_ack)
+            for i, q in enumerate(queues)
+        ]
+        try:
+            for index, item in enumerate(items):
+                q = queues[shard_for_topic(_item_topic(item), connections)]
+                while True:
+                    try:
+                        q.put((index, item), timeout=progress_interval)
+                        break
+                    except queue.Full:
+                        report()
+                consumed += 1
+                report()
+        finally:
+            for q in queues:
+                q.put(_END_OF_ITEMS)
+        pending = set(futures)
+        while pending:
+            _done, pending = wait(pending, timeout=progress_interval)
+            report()
+        results = [f.result() for f in futures]
+
+    for i, result in enumerate(results):
+        acked_by_shard[i] = result.succeeded
+    report(force=True)
+    return _merge_results(results, consumed, time.perf_counter() - start)
+
+
+def _publish_sharded_processes(
+    broker_host: str,
+    broker_port: int,
+    items: Iterable[Any],
+    connections: int,
+    window: int,
+    timeout: float,
+    username: str | None,
+    password: str | None,
+    on_progress: ProgressCallback | None,
+    progress_interval: float,
+) -> BulkPublishResult:
+    shards: list[list[tuple[int, Any]]] = [[] for _ in range(connections)]
+    total = 0
+    for index, item in enumerate(items):
+        shards[shard_for_topic(_item_topic(item), connections)].append((index, item))
+        total += 1
+    shards = [shard for shard in shards if shard]
+
+    start = time.perf_counter()
+    results: list[BulkPublishResult] = []
+    acked = 0
+    with ProcessPoolExecutor(max_workers=max(1, len(shards)),
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {
+            executor.submit(_publish_indexed, broker_host, broker_port, shard, len(shard), window, timeout,
+                            username, password): shard
+            for shard in shards
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=progress_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = _failed_result(futures[future], f"connection failed: {e}")
+                acked += result.succeeded
+                results.append(result)
+            if on_progress is not None:
+                on_progress(acked, total)
+
+    return _merge_results(results, total, time.perf_counter() - start)
+
+
+_END_OF_ITEMS = object()
+
+
+def _publish_from_queue(
+    broker_host: str,
+    broker_port: int,
+    q: queue.Queue,
+    window: int,
+    timeout: float,
+    username: str | None,
+    password: str | None,
+    on_progress: ProgressCallback | None,
+    progress_interval: float,
+    on_ack: AckCallback | None = None,
+) -> BulkPublishResult:
+    """Shard worker: publish ``(index, item)`` pairs from ``q`` until the end marker."""
+    def drain() -> Iterator[tuple[int, Any]]:
+        while (entry := q.get()) is not _END_OF_ITEMS:
+            yield entry
+
+    try:
+        return _publish_indexed(broker_host, broker_port, drain(), None, window, timeout,
+                                username, password, on_progress, progress_interval, on_ack)
+    except Exception as e:
+        # Keep draining so the dispatcher never blocks on this shard's queue
+        return _failed_result(drain(), f"connection failed: {e}")
+
+
+def _failed_result(items: Iterable[tuple[int, Any]], error: str) -> BulkPublishResult:
+    log = _FailureLog()
+    for index, item in items:
+        log.add(BulkFailure(index, _item_topic(item), error))
+    return BulkPublishResult(total=log.count, succeeded=0, failed=log.count, elapsed=0.0, failures=log.items)
+
+
+def _merge_results(results: list[BulkPublishResult], total: int, elapsed: float) -> BulkPublishResult:
+    failures = sorted((f for r in results for f in r.failures), key=lambda f: f.index)
+    return BulkPublishResult(
+        total=total,
+        succeeded=sum(r.succeeded for r in results),
+        failed=sum(r.failed for r in results),
+        elapsed=elapsed,
+        failures=failures[:MAX_REPORTED_FAILURES],
+    )
+
+
+def _acquire_window(tracker: _AckTracker, timeout: float, progress_interval: float,
+                    report: Callable[[], None]) -> bool:
+    """Take an in-flight slot, reporting progress while waiting.
+
+    Gives up (returns False) once no ack has arrived for ``timeout``
+    seconds; every ack restarts that deadline.
+    """
+    acked = tracker.acked
+    deadline = time.monotonic() + timeout
+    while not tracker.window.acquire(timeout=progress_interval):
+        report()
+        if tracker.acked != acked:
+            acked = tracker.acked
+            deadline = time.monotonic() + timeout
+        elif time.monotonic() >= deadline:
+            return False
+    return True
+
+
+def _publish_indexed(
+    broker_host: str,
+    broker_port: int,
+    items: Iterable[tuple[int, Any]],
+    total: int | None = None,
+    window: int = 100,
+    timeout: float = 30.0,
+    username: str | None = None,
+    password: str | None = None,
+    on_progress: ProgressCallback | None = None,
+    progress_interval: float = 0.1,
+    on_ack: AckCallback | None = None,
+) -> BulkPublishResult:
+    """Pipelined publish of ``(original_index, item)`` pairs on one connection."""
+    # One iterator throughout, so a stall only fails the items that were never taken
+    items = iter(items)
+    tracker = _AckTracker(window, on_ack)
+    failures = _FailureLog()
+    consumed = 0
+    connected = threading.Event()
+
+    def on_connect(_client, _userdata, _flags, reason_code, _properties=None):
+        if reason_code == 0 or str(reason_code) == "Success":
+            connected.set()
+
+    client = mqtt.Client(
+        callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+        client_id=f"ad-bulk-{uuid.uuid4().hex[:12]}",
+        clean_session=True,
+    )
+    if username:
+        client.username_pw_set(username, password)
+    client.max_inflight_messages_set(window)
+    client.max_queued_messages_set(0)
+    client.on_connect = on_connect
+    client.on_publish = tracker.on_publish
+
+    last_report = 0.0
+
+    def report(force: bool = False):
+        nonlocal last_report
+        now = time.monotonic()
+        if on_progress is not None and (force or now - last_report >= progress_interval):
+            last_report = now
+            on_progress(tracker.acked, total)
+
+    start = time.perf_counter()
+    client.connect(broker_host, broker_port, keepalive=60)
+    client.loop_start()
+    try:
+        if not connected.wait(timeout):
+            raise ConnectionError(f"No CONNACK from {broker_host}:{broker_port} within {timeout}s")
+
+        stalled = False
+        for index, item in items:
+            consumed += 1
+            try:
+                topic, payload, qos, retain = parse_item(item)
+            except (ValueError, TypeError) as e:
+                failures.add(BulkFailure(index, _item_topic(item), str(e)))
+                continue
+            if not _acquire_window(tracker, timeout, progress_interval, report):
+                # No ack for ``timeout`` seconds: the broker or connection stalled, give up on the rest
+                stalled = True
+                failures.add(BulkFailure(index, topic, "not sent: no acknowledgement within timeout"))
+                for index, item in items:
+                    consumed += 1
+                    failures.add(BulkFailure(index, _item_topic(item), "not sent: no acknowledgement within timeout"))
+                break
+            sent = time.perf_counter()
+            try:
+                info = client.publish(topic, payload, qos=qos, retain=retain)
+            except ValueError as e:
+                tracker.window.release()
+                failures.add(BulkFailure(index, topic, str(e)))
+                continue
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                tracker.window.release()
+                failures.add(BulkFailure(index, topic, mqtt.error_string(info.rc)))
+                continue
+            tracker.register(info.mid, index, topic, sent)
+            report()
+
+        deadline = time.monotonic() + (0 if stalled else timeout)
+        while time.monotonic() < deadline:
+            with tracker.lock:
+                if not tracker.pending:
+                    break
+            report()
+            time.sleep(min(progress_interval, 0.01))
+        with tracker.lock:
+            unacked = sorted(tracker.pending.values())
+            tracker.pending.clear()
+        for i, t, _sent in unacked:
+            failures.add(BulkFailure(i, t, "not acknowledged before timeout"))
+        elapsed = time.perf_counter() - start
+        report(force=True)
+    finally:
+        client.disconnect()
+        client.loop_stop()
+
+    return BulkPublishResult(
+        total=consumed,
+        succeeded=tracker.acked,
+        failed=failures.count,
+        elapsed=elapsed,
+        failures=sorted(failures.items, key=lambda f: f.index),
+    )
@@ -0,0 +1,307 @@
+"""
+Streaming export of captured messages to CSV, NDJSON and Parquet.
+Sources yield messages in chunks from the live buffer, the on-disk
+capture log or the SQLite history; writers consume the generator and
+never hold more than one chunk in memory. Readers stream exported files
+back into messages, e.g. for replay. Parquet needs pyarrow, which is
+optional.
+"""
+
+import base64
+import csv
+import io
+import json
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import BinaryIO
+
+from message_store import MQTTMessage
+from topic_index import is_wildcard
+from topic_trie import TopicTrie
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = pq = None
+
+HAS_PYARROW = pa is not None
+EXPORT_CHUNK = 5_000
+FORMATS = ["csv", "ndjson"] + (["parquet"] if HAS_PYARROW else [])
+
+ProgressCallback = Callable[[int], None]
+
+
+@dataclass
+class ExportResult:
+    rows: int
+    bytes_written: int
+    elapsed: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+
+# ---------------------------------------------------------------------------
+# Sources
+# ---------------------------------------------------------------------------
+
+def topic_predicate(topic_filter: str | None,
+                    subscription_filter: str | None = None) -> Callable[[str], bool] | None:
+    """Topic test with the subscriber page's filter semantics, cached per topic.
+
+    ``subscription_filter``, when given, must also match, always as an MQTT
+    filter (the page's subscription selector).
+    """
+    if not topic_filter and not subscription_filter:
+        return None
+    subscription = TopicTrie([subscription_filter]) if subscription_filter else None
+    if not topic_filter:
+        text_test = None
+    elif is_wildcard(topic_filter):
+        trie = TopicTrie([topic_filter])
+        text_test = lambda t: bool(trie.match(t))  # noqa: E731
+    else:
+        needle = topic_filter.lower()
+        text_test = lambda t: needle in t.lower()  # noqa: E731
+
+    def test(topic: str) -> bool:
+        return ((subscription is None or bool(subscription.match(topic)))
+                and (text_test is None or text_test(topic)))
+
+    cache: dict[str, bool] = {}
+
+    def matches(topic: str) -> bool:
+        hit = cache.get(topic)
+        if hit is None:
+            hit = cache[topic] = test(topic)
+        return hit
+
+    return matches
+
+
+def filter_messages(
+    messages: Iterable[MQTTMessage],
+    topic_filter: str | None = None,
+    start_ts: float | None = None,
+    end_ts: float | None = None,
+) -> Iterator[MQTTMessage]:
+    matches = topic_predicate(topic_filter)
+    for m in messages:
+        if start_ts is not None and m.ts < start_ts:
+            continue
+        if end_ts is not None and m.ts > end_ts:
+            continue
+        if matches is not None and not matches(m.topic):
+            continue
+        yield m
+
+
+def iter_since(since: Callable[[int, int], list[MQTTMessage]], chunk: int = EXPORT_CHUNK,
+               until: int | None = None) -> Iterator[MQTTMessage]:
+    """Walk a seq cursor API (a store's ``since``, the subscriber's
+    ``get_messages_since``) oldest first, ``chunk`` messages at a time.
+
+    Messages arriving during the walk are included up to seq ``until``
+    (all of them when None); evicted ones are skipped, as the cursor
+    guarantees.
+    """
+    cursor = 0
+    while True:
+        batch = since(cursor, chunk)
+        if not batch:
+            return
+        if until is not None and batch[-1].seq > until:
+            yield from (m for m in batch if m.seq <= until)
+            return
+        cursor = batch[-1].seq
+        yield from batch
+
+
+def iter_segment_log(log, chunk: int = EXPORT_CHUNK) -> Iterator[MQTTMessage]:
+    """Every record in a :class:`~segment_log.SegmentLog`, oldest first."""
+    index = log.first_index()
+    while True:
+        batch = log.read(index, chunk)
+        if not batch:
+            return
+        # Retention may have deleted segments under us; read() skips ahead
+        index = max(index, log.first_index()) + len(batch)
+        yield from batch
+
+
+# ---------------------------------------------------------------------------
+# Writers
+# ---------------------------------------------------------------------------
+
+_COLUMNS = ("timestamp", "ts", "topic", "qos", "retain", "payload", "payload_encoding")
+
+
+def _row(m: MQTTMessage) -> tuple:
+    """One export row in :data:`_COLUMNS` order; non-UTF-8 payloads are base64."""
+    try:
+        payload, encoding = m.raw.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        payload, encoding = base64.b64encode(m.raw).decode("ascii"), "base64"
+    ts = m.ts
+    return (datetime.fromtimestamp(ts).isoformat(timespec="milliseconds"), ts, m.topic, m.qos, m.retain,
+            payload, encoding)
+
+
+class _CountingWriter(io.RawIOBase):
+    """Binary sink wrapper that counts bytes written."""
+
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+        self.count = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._fileobj.write(b)
+        self.count += len(b)
+        return len(b)
+
+
+def write_csv(messages: Iterable[MQTTMessage], fileobj: BinaryIO,
+              on_progress: ProgressCallback | None = None) -> ExportResult:
+    return _write_text(messages, fileobj, on_progress, csv_format=True)
+
+
+def write_ndjson(messages: Iterable[MQTTMessage], fileobj: BinaryIO,
+                 on_progress: ProgressCallback | None = None) -> ExportResult:
+    return _write_text(messages, fileobj, on_progress, csv_format=False)
+
+
+def _write_text(messages, fileobj, on_progress, csv_format: bool) -> ExportResult:
+    t0 = time.perf_counter()
+    sink = _CountingWriter(fileobj)
+    text = io.TextIOWrapper(io.BufferedWriter(sink, 1024 * 1024), encoding="utf-8", newline="")
+    rows = 0
+    if csv_format:
+        writer = csv.writer(text)
+        writer.writerow(_COLUMNS)
+        write = writer.writerow
+    else:
+        dumps = json.JSONEncoder(ensure_ascii=False).encode
+        write = lambda r: text.write(dumps(dict(zip(_COLUMNS, r))) + "\n")  # noqa: E731
+    for m in messages:
+        write(_row(m))
+        rows += 1
+        if on_progress is not None and rows % EXPORT_CHUNK == 0:
+            on_progress(rows)
+    text.flush()
+    text.detach().detach()  # leave the caller's file open
+    return ExportResult(rows, sink.count, time.perf_counter() - t0)
+
+
+def write_parquet(messages: Iterable[MQTTMessage], fileobj: BinaryIO,
+                  on_progress: ProgressCallback | None = None,
+                  row_group: int = 64 * 1024) -> ExportResult:
+    """Parquet with binary payloads; one row group per ``row_group`` messages."""
+    if not HAS_PYARROW:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    schema = pa.schema([
+        ("ts", pa.timestamp("us")),
+        ("topic", pa.dictionary(pa.int32(), pa.string())),
+        ("qos", pa.int8()),
+        ("retain", pa.bool_()),
+        ("payload", pa.binary()),
+    ])
+    t0 = time.perf_counter()
+    sink = _CountingWriter(fileobj)
+    rows = 0
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        cols: tuple[list, ...] = ([], [], [], [], [])
+        for m in messages:
+            cols[0].append(int(m.ts * 1_000_000))
+            cols[1].append(m.topic)
+            cols[2].append(m.qos)
+            cols[3].append(m.retain)
+            cols[4].append(m.raw)
+            rows += 1
+            if len(cols[0]) >= row_group:
+                writer.write_batch(pa.record_batch(list(cols), schema=schema))
+                cols = ([], [], [], [], [])
+                if on_progress is not None:
+                    on_progress(rows)
+        if cols[0]:
+            writer.write_batch(pa.record_batch(list(cols), schema=schema))
+    return ExportResult(rows, sink.count, time.perf_counter() - t0)
+
+
+WRITERS = {"csv": write_csv, "ndjson": write_ndjson, "parquet": write_parquet}
+
+
+def export_messages(messages: Iterable[MQTTMessage], fmt: str, fileobj: BinaryIO,
+                    on_progress: ProgressCallback | None = None) -> ExportResult:
+    """Stream ``messages`` into ``fileobj`` as ``fmt`` (one of :data:`FORMATS`)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return WRITERS[fmt](messages, fileobj, on_progress)
+
+
+# ---------------------------------------------------------------------------
+# Readers — exported files back into messages, streamed
+# ---------------------------------------------------------------------------
+
+def format_from_name(name: str) -> str:
+    """Export format implied by a file name's extension."""
+    lower = name.lower()
+    if lower.endswith(".csv"):
+        return "csv"
+    if lower.endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    if lower.endswith(".parquet"):
+        return "parquet"
+    raise ValueError(f"Cannot tell the export format of {name!r}")
+
+
+def _payload(value: str, encoding: str) -> bytes:
+    return base64.b64decode(value) if encoding == "base64" else value.encode("utf-8")
+
+
+def read_csv(fileobj: BinaryIO) -> Iterator[MQTTMessage]:
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    try:
+        for seq, row in enumerate(csv.DictReader(text), 1):
+            yield MQTTMessage(row["topic"], _payload(row["payload"], row["payload_encoding"]), int(row["qos"]),
+                              row["retain"] == "True", float(row["ts"]), seq)
+    finally:
+        text.detach()  # leave the caller's file open
+
+
+def read_ndjson(fileobj: BinaryIO) -> Iterator[MQTTMessage]:
+    for seq, line in enumerate(fileobj, 1):
+        if not line.strip():
+            continue
+        r = json.loads(line)
+        yield MQTTMessage(r["topic"], _payload(r["payload"], r["payload_encoding"]), int(r["qos"]),
+                          bool(r["retain"]), float(r["ts"]), seq)
+
+
+def read_parquet(fileobj: BinaryIO, batch_size: int = EXPORT_CHUNK) -> Iterator[MQTTMessage]:
+    if not HAS_PYARROW:
+        raise RuntimeError("Reading Parquet requires pyarrow (pip install pyarrow)")
+    seq = 0
+    for batch in pq.ParquetFile(fileobj).iter_batches(batch_size=batch_size):
+        # Integer microseconds: naive timestamps would otherwise be read back as local time
+        ts_us = batch.column("ts").cast(pa.int64()).to_pylist()
+        columns = [batch.column(name).to_pylist() for name in ("topic", "qos", "retain", "payload")]
+        for ts, topic, qos, retain, payload in zip(ts_us, *columns):
+            seq += 1
+            yield MQTTMessage(topic, payload, qos, retain, ts / 1_000_000, seq)
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson, "parquet": read_parquet}
+
+
+def read_export(fileobj: BinaryIO, fmt: str) -> Iterator[MQTTMessage]:
+    """Stream the messages in an exported ``fmt`` file, in file order."""
+    if fmt not in READERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return READERS[fmt](fileobj)
@@ -0,0 +1,397 @@
+"""
+Device fleet simulator for broker load tests.
+Emulates many ESP8266-style devices (see docs/USAGE.md, section 6): each
+has its own client id, a retained online/offline status backed by a will,
+a command-topic subscription and a jittered publish schedule. All devices
+are plain MQTT 3.1.1 connections multiplexed on one asyncio event loop,
+so thousands of them cost one thread rather than one paho client and
+network thread each.
+
+Payload templates are literal text with placeholders:
+
+    {device}            the device's client id
+    {n}                 the device number
+    {seq}               the device's publish counter
+    {ts}                wall-clock send time (seconds since the epoch)
+    {rand:LO:HI}        uniform float with two decimals
+    {randint:LO:HI}     uniform integer
+    {choice:A|B|C}      one of the listed strings
+
+so JSON braces need no escaping: ``{"value": {rand:18:30}, "unit": "C"}``.
+"""
+
+import asyncio
+import contextlib
+import random
+import re
+import struct
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from local_broker import (
+    CONNACK, CONNECT, DISCONNECT, PINGREQ, PINGRESP, PUBACK, PUBLISH, SUBACK, SUBSCRIBE,
+    ProtocolError, _packet, _split_packet,
+)
+
+_U16 = struct.Struct("!H")
+
+DEFAULT_TEMPLATES = {
+    "temperature": '{"value": {rand:18:30}, "unit": "C"}',
+    "humidity": '{"value": {randint:30:80}, "unit": "%"}',
+}
+
+# Ack latencies kept for percentiles; older samples roll off
+LATENCY_SAMPLES = 100_000
+
+_PLACEHOLDER = re.compile(r"\{(device|n|seq|ts|rand|randint|choice)(?::([^{}]*))?\}")
+
+Renderer = Callable[[str, int, int], bytes]
+
+
+@dataclass
+class FleetConfig:
+    devices: int = 100
+    interval: float = 5.0                 # seconds between one device's publishes
+    jitter: float = 0.1                   # ± fraction of the interval, per publish
+    qos: int = 0                          # 0 or 1
+    topic_prefix: str = "sim"
+    client_prefix: str = "sim-esp8266"
+    templates: dict[str, str] = field(default_factory=lambda: dict(DEFAULT_TEMPLATES))
+    keepalive: int = 60
+    connect_rate: float = 500.0           # new connections per second while ramping up
+    status: bool = True                   # retained "online" + "offline" will on <device>/status
+    commands: bool = True                 # subscribe to <device>/led/command
+
+    @property
+    def msgs_per_sec(self) -> float:
+        """Nominal fleet-wide publish rate once every device is connected."""
+        return self.devices * len(self.templates) / self.interval if self.interval > 0 else 0.0
+
+
+@dataclass
+class FleetStats:
+    devices: int
+    connected: int
+    published: int
+    acked: int
+    received: int     # command messages delivered to devices
+    reconnects: int
+    errors: int
+    elapsed: float
+    last_error: str | None
+
+    @property
+    def msgs_per_sec(self) -> float:
+        return self.published / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def compile_template(template: str) -> Renderer:
+    """Turn a payload template into ``render(device, n, seq) -> bytes``.
+
+    Raises ValueError for malformed placeholder arguments, so bad templates
+    fail before any connection is opened.
+    """
+    parts: list[str | Callable[[str, int, int], str]] = []
+    pos = 0
+    for m in _PLACEHOLDER.finditer(template):
+        parts.append(template[pos:m.start()])
+        parts.append(_placeholder(m.group(1), m.group(2)))
+        pos = m.end()
+    parts.append(template[pos:])
+    parts = [p for p in parts if p != ""]
+    if all(isinstance(p, str) for p in parts):
+        constant = "".join(parts).encode("utf-8")
+        return lambda _device, _n, _seq: constant
+
+    def render(device: str, n: int, seq: int) -> bytes:
+        return "".join(p if isinstance(p, str) else p(device, n, seq) for p in parts).encode("utf-8")
+
+    return render
+
+
+def _placeholder(name: str, arg: str | None) -> Callable[[str, int, int], str]:
+    if name == "device":
+        return lambda device, _n, _seq: device
+    if name == "n":
+        return lambda _device, n, _seq: str(n)
+    if name == "seq":
+        return lambda _device, _n, seq: str(seq)
+    if name == "ts":
+        return lambda _device, _n, _seq: f"{time.time():.3f}"
+    if name == "choice":
+        options = (arg or "").split("|")
+        if not arg:
+            raise ValueError("{choice:...} needs at least one option")
+        return lambda _device, _n, _seq: random.choice(options)
+    try:
+        lo, hi = (arg or "").split(":")
+        if name == "randint":
+            lo_i, hi_i = int(lo), int(hi)
+            return lambda _device, _n, _seq: str(random.randint(lo_i, hi_i))
+        lo_f, hi_f = float(lo), float(hi)
+    except ValueError:
+        raise ValueError(f"{{{name}:LO:HI}} needs two numbers, got {arg!r}") from None
+    return lambda _device, _n, _seq: f"{random.uniform(lo_f, hi_f):.2f}"
+
+
+def _connect_packet(client_id: str, keepalive: int, will: tuple[bytes, bytes] | None) -> bytes:
+    def string(b: bytes) -> bytes:
+        return _U16.pack(len(b)) + b
+
+    flags = 0x02  # clean session
+    payload = string(client_id.encode("utf-8"))
+    if will is not None:
+        flags |= 0x04 | 0x08 | 0x20  # will, will QoS 1, will retain
+        payload += string(will[0]) + string(will[1])
+    return _packet(CONNECT, 0, string(b"MQTT") + bytes([4, flags]) + _U16.pack(keepalive) + payload)
+
+
+def _publish_packet(topic: bytes, payload: bytes, qos: int, pid: int, retain: bool = False) -> bytes:
+    body = _U16.pack(len(topic)) + topic + (_U16.pack(pid) if qos else b"") + payload
+    return _packet(PUBLISH, qos << 1 | int(retain), body)
+
+
+class FleetSimulator:
+    """Many simulated devices on one asyncio loop.
+
+    :meth:`start` runs the fleet on a private event loop in a daemon thread,
+    like :class:`~local_broker.LocalBroker`; :meth:`run` runs it on the
+    caller's loop instead. Devices that lose their connection reconnect
+    with exponential backoff. Counters are plain integers updated on the
+    loop thread and read without locking.
+    """
+
+    def __init__(self, host: str, port: int, config: FleetConfig | None = None):
+        self.host = host
+        self.port = port
+        self.config = config or FleetConfig()
+        if self.config.qos not in (0, 1):
+            raise ValueError("Simulated devices publish at QoS 0 or 1")
+        self._renderers = [(name, compile_template(t)) for name, t in self.config.templates.items()]
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = asyncio.Event()  # binds to whichever loop first waits on it
+        self._started = 0.0
+        self._stopped: float | None = None
+        self._connected = 0
+        self._published = 0
+        self._acked = 0
+        self._received = 0
+        self._reconnects = 0
+        self._errors = 0
+        self._last_error: str | None = None
+        self.ack_latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    async def run(self):
+        """Run every device until :meth:`stop` is called."""
+        self._started = time.perf_counter()
+        self._stopped = None
+        cfg = self.config
+        tasks = [asyncio.create_task(self._device(n, n / cfg.connect_rate if cfg.connect_rate > 0 else 0.0))
+                 for n in range(cfg.devices)]
+        try:
+            await self._stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._stopped = time.perf_counter()
+
+    def start(self) -> "FleetSimulator":
+        """Run on a background thread; returns immediately while devices ramp up."""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.call_soon(ready.set)
+            self._loop.run_until_complete(self.run())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="fleet-sim", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        """Disconnect every device (publishing "offline") and stop the loop."""
+        if self._loop is not None and self.running:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> FleetStats:
+        end = self._stopped if self._stopped is not None else time.perf_counter()
+        return FleetStats(
+            devices=self.config.devices,
+            connected=self._connected,
+            published=self._published,
+            acked=self._acked,
+            received=self._received,
+            reconnects=self._reconnects,
+            errors=self._errors,
+            elapsed=end - self._started if self._started else 0.0,
+            last_error=self._last_error,
+        )
+
+    # ------------------------------------------------------------------
+    # Devices
+    # ------------------------------------------------------------------
+
+    async def _device(self, n: int, delay: float):
+        cfg = self.config
+        client_id = f"{cfg.client_prefix}-{n:05d}"
+        base = f"{cfg.topic_prefix}/{client_id}"
+        topics = [(f"{base}/{name}".encode("utf-8"), render) for name, render in self._renderers]
+        status = f"{base}/status".encode("utf-8") if cfg.status else None
+        await asyncio.sleep(delay)  # ramp up instead of opening every socket at once
+        backoff = 1.0
+        seq = 0
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                writer.write(_connect_packet(client_id, cfg.keepalive, (status, b"offline") if status else None))
+                buf = bytearray(await asyncio.wait_for(reader.read(1 << 12), 10))
+                packet = _split_packet(buf, 0)
+                if packet is None or packet[0] != CONNACK or packet[2][1] != 0:
+                    raise ProtocolError(f"connection refused ({packet[2][1] if packet else 'no CONNACK'})")
+                del buf[:packet[3]]
+                backoff = 1.0
+                self._connected += 1
+                try:
+                    seq = await self._session(client_id, n, seq, base, topics, status, reader, writer, buf)
+                finally:
+                    self._connected -= 1
+            except asyncio.CancelledError:
+                if writer is not None:
+                    # Let the goodbye packets written by _session reach the socket
+                    writer.close()
+                    with contextlib.suppress(Exception):
+                        await asyncio.wait_for(writer.wait_closed(), 1.0)
+                raise
+            except (OSError, EOFError, ProtocolError, asyncio.TimeoutError, IndexError) as e:
+                self._errors += 1
+                self._last_error = f"{client_id}: {e or type(e).__name__}"
+            if writer is not None:
+                writer.close()
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+            backoff = min(backoff * 2, 30.0)
+            self._reconnects += 1
+
+    async def _session(self, client_id: str, n: int, seq: int, base: str, topics: list[tuple[bytes, Renderer]],
+                       status: bytes | None, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       buf: bytearray) -> int:
+        """One connected lifetime of a device; returns its publish counter."""
+        cfg = self.config
+        loop = asyncio.get_running_loop()
+        inflight: dict[int, float] = {}
+        next_pid = 0
+        if status is not None:
+            writer.write(_publish_packet(status, b"online", 1, 0xFFFF, retain=True))
+        if cfg.commands:
+            command = f"{base}/led/command".encode("utf-8")
+            writer.write(_packet(SUBSCRIBE, 0x02, _U16.pack(0xFFFE) + _U16.pack(len(command)) + command + b"\x00"))
+
+        reading = asyncio.create_task(self._read(reader, writer, buf, inflight))
+        reading.add_done_callback(lambda t: t.cancelled() or t.exception())  # retrieved even on shutdown
+        try:
+            # Spread each device's first publish across one interval
+            next_at = loop.time() + random.uniform(0, cfg.interval)
+            last_send = loop.time()
+            idle = cfg.keepalive / 2 if cfg.keepalive else float("inf")
+            while not reading.done():
+                now = loop.time()
+                if now < next_at:
+                    if now - last_send >= idle:
+                        writer.write(_packet(PINGREQ, 0, b""))
+                        last_send = now
+                    await asyncio.wait({reading}, timeout=min(next_at - now, idle))
+                    continue
+                for topic, render in topics:
+                    if cfg.qos:
+                        next_pid = next_pid % 0xFFF0 + 1  # ids above are reserved for status/subscribe
+                        inflight[next_pid] = time.perf_counter()
+                    writer.write(_publish_packet(topic, render(client_id, n, seq), cfg.qos, next_pid))
+                    self._published += 1
+                seq += 1
+                last_send = now
+                next_at += cfg.interval * (1 + random.uniform(-cfg.jitter, cfg.jitter))
+                if next_at < now:
+                    next_at = now  # fell behind; do not burst to catch up
+                if writer.transport.get_write_buffer_size() > 1 << 16:
+                    await writer.drain()
+        except asyncio.CancelledError:
+            # Shutting down: go offline the way a device would on a clean power-off
+            if status is not None:
+                writer.write(_publish_packet(status, b"offline", 0, 0, retain=True))
+            writer.write(_packet(DISCONNECT, 0, b""))
+            raise
+        finally:
+            reading.cancel()
+        reading.result()  # re-raise whatever ended the connection
+        return seq
+
+    async def _read(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, buf: bytearray,
+                    inflight: dict[int, float]):
+        timeout = self.config.keepalive * 1.5 if self.config.keepalive else None
+        while True:
+            pos = 0
+            while (packet := _split_packet(buf, pos)) is not None:
+                ptype, flags, body, pos = packet
+                if ptype == PUBACK:
+                    sent = inflight.pop(_U16.unpack_from(body)[0], None)
+                    if sent is not None:
+                        self._acked += 1
+                        self.ack_latencies.append(time.perf_counter() - sent)
+                elif ptype == PUBLISH:
+                    self._received += 1
+                    if flags & 0x06:
+                        (topic_len,) = _U16.unpack_from(body)
+                        writer.write(_packet(PUBACK, 0, body[2 + topic_len:4 + topic_len]))
+                elif ptype not in (SUBACK, PINGRESP):
+                    raise ProtocolError(f"unexpected packet type {ptype}")
+            del buf[:pos]
+            chunk = await asyncio.wait_for(reader.read(1 << 16), timeout)
+            if not chunk:
+                raise EOFError("connection closed by broker")
+            buf += chunk
+
+
+# ---------------------------------------------------------------------------
+# Global singleton — one fleet per app, survives Streamlit reruns
+# ---------------------------------------------------------------------------
+_fleet: FleetSimulator | None = None
+_fleet_lock = threading.Lock()
+
+
+def get_fleet() -> FleetSimulator | None:
+    """Return the app's running (or last) fleet, if one was started."""
+    return _fleet
+
+
+def start_fleet(host: str, port: int, config: FleetConfig) -> FleetSimulator:
+    """Stop any running fleet and start a new one."""
+    global _fleet
+    with _fleet_lock:
+        if _fleet is not None:
+            _fleet.stop()
+        _fleet = FleetSimulator(host, port, config).start()
+        return _fleet
+
+
+def stop_fleet():
+    with _fleet_lock:
+        if _fleet is not None:
+            _fleet.stop()
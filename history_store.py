@@ -0,0 +1,262 @@
+"""
+Queryable message history in SQLite.
+A background writer drains an in-memory queue into a WAL-mode database in
+batched transactions, so ``append`` never blocks the paho network thread.
+Topics are normalised into their own table; an index on (topic_id, ts)
+serves "filter X between T1 and T2" queries, and one on ts serves
+time-range queries across all topics.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import closing
+from dataclasses import dataclass
+from urllib.parse import quote
+
+from message_store import MQTTMessage
+from topic_index import is_wildcard
+from topic_trie import TopicTrie
+
+DEFAULT_BATCH_SIZE = 5_000
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_MAX_PENDING = 200_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS topics (
+    id    INTEGER PRIMARY KEY,
+    name  TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id        INTEGER PRIMARY KEY,
+    ts        REAL NOT NULL,
+    topic_id  INTEGER NOT NULL REFERENCES topics(id),
+    qos       INTEGER NOT NULL,
+    retain    INTEGER NOT NULL,
+    payload   BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_messages_topic_ts ON messages(topic_id, ts);
+CREATE INDEX IF NOT EXISTS ix_messages_ts ON messages(ts);
+"""
+
+
+@dataclass
+class HistoryStats:
+    written: int
+    dropped: int    # messages discarded because the writer fell too far behind
+    pending: int
+    error: str | None
+
+
+class HistoryStore:
+    """SQLite message history fed by a background batch writer.
+
+    Readers open their own short-lived connections; WAL mode lets them run
+    alongside the writer without blocking it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        retain_seconds: float | None = None,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retain_seconds = retain_seconds
+        self._pending: deque[tuple] = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._accepted = 0
+        self._written = 0
+        self._dropped = 0
+        self._lost = 0  # accepted but lost to a failed write
+        self._last_retention = 0.0
+        self._error: str | None = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: durable across process crashes, may lose the last batch on power loss
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._topic_ids: dict[str, int] = dict(self._conn.execute("SELECT name, id FROM topics"))
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def append(self, topic: str, payload: bytes, qos: int, retain: bool, ts: float, seq: int = 0):
+        if len(self._pending) >= self.max_pending:
+            self._dropped += 1
+            return
+        self._accepted += 1
+        self._pending.append((topic, payload, qos, retain, ts))
+        if len(self._pending) == self.batch_size:
+            self._wakeup.set()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything appended so far is committed (or dropped)."""
+        target = self._accepted
+        deadline = time.monotonic() + timeout
+        self._wakeup.set()
+        while self._written + self._lost < target:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout=10)
+
+    def stats(self) -> HistoryStats:
+        return HistoryStats(
+            written=self._written,
+            dropped=self._dropped + self._lost,
+            pending=len(self._pending),
+            error=self._error,
+        )
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                while self._pending:
+                    self._write_batch()
+                if self.retain_seconds and time.monotonic() - self._last_retention > 60:
+                    self._enforce_retention()
+                self._error = None
+            except sqlite3.Error as e:
+                self._error = str(e)
+            if self._stopping and not self._pending:
+                break
+        self._conn.close()
+
+    def _write_batch(self):
+        pending = self._pending
+        batch = [pending.popleft() for _ in range(min(len(pending), self.batch_size))]
+        topic_ids = self._topic_ids
+        rows = []
+        try:
+            with self._conn:
+                for topic, payload, qos, retain, ts in batch:
+                    topic_id = topic_ids.get(topic)
+                    if topic_id is None:
+                        topic_id = self._conn.execute("INSERT INTO topics(name) VALUES (?)", (topic,)).lastrowid
+                        topic_ids[topic] = topic_id
+                    rows.append((ts, topic_id, qos, int(retain), payload))
+                self._conn.executemany(
+                    "INSERT INTO messages(ts, topic_id, qos, retain, payload) VALUES (?, ?, ?, ?, ?)", rows,
+                )
+        except sqlite3.Error:
+            self._lost += len(batch)
+            # Topic ids assigned inside the rolled-back transaction are gone too
+            self._topic_ids = dict(self._conn.execute("SELECT name, id FROM topics"))
+            raise
+        self._written += len(batch)
+
+    def _enforce_retention(self):
+        self._last_retention = time.monotonic()
+        with self._conn:
+            self._conn.execute("DELETE FROM messages WHERE ts < ?", (time.time() - self.retain_seconds,))
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+
+    def topics(self) -> list[str]:
+        with self._reader() as conn:
+            return [name for (name,) in conn.execute("SELECT name FROM topics ORDER BY name")]
+
+    def query(
+        self,
+        topic_filter: str | None = None,
+        start_ts: float | None = None,
+        end_ts: float | None = None,
+        limit: int = 1000,
+    ) -> tuple[list[MQTTMessage], int]:
+        """Messages matching ``topic_filter`` in ``[start_ts, end_ts]``, newest first.
+
+        ``topic_filter`` follows the subscriber page's semantics: an MQTT
+        wildcard filter, or plain text matched as a substring. Returns the
+        newest ``limit`` messages and the total number that matched.
+        """
+        with self._reader() as conn:
+            clause, params = self._where(conn, topic_filter, start_ts, end_ts)
+            total = conn.execute(f"SELECT COUNT(*) FROM messages m {clause}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT m.id, m.ts, t.name, m.qos, m.retain, m.payload FROM messages m "
+                f"JOIN topics t ON t.id = m.topic_id {clause} ORDER BY m.ts DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [_to_message(row) for row in rows], total
+
+    def iter_query(
+        self,
+        topic_filter: str | None = None,
+        start_ts: float | None = None,
+        end_ts: float | None = None,
+        chunk: int = 5000,
+    ) -> Iterator[MQTTMessage]:
+        """Every matching message, oldest first, fetched ``chunk`` rows at a time."""
+        last_id = 0
+        while True:
+            with self._reader() as conn:
+                clause, params = self._where(conn, topic_filter, start_ts, end_ts)
+                # Keyset pagination on the rowid: each chunk is an index seek, not an OFFSET scan
+                clause = f"{clause} AND m.id > ?" if clause else "WHERE m.id > ?"
+                rows = conn.execute(
+                    f"SELECT m.id, m.ts, t.name, m.qos, m.retain, m.payload FROM messages m "
+                    f"JOIN topics t ON t.id = m.topic_id {clause} ORDER BY m.id LIMIT ?",
+                    params + [last_id, chunk],
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield from map(_to_message, rows)
+
+    @staticmethod
+    def _where(
+        conn: sqlite3.Connection, topic_filter: str | None, start_ts: float | None, end_ts: float | None,
+    ) -> tuple[str, list]:
+        """WHERE clause and parameters for a query."""
+        where, params = [], []
+        if topic_filter:
+            # The topics table is small; resolve the filter to ids in a subquery so the
+            # (topic_id, ts) index does the heavy lifting, however many topics match
+            if is_wildcard(topic_filter):
+                trie = TopicTrie([topic_filter])
+                conn.create_function("topic_matches", 1, lambda name: bool(trie.match(name)), deterministic=True)
+                where.append("m.topic_id IN (SELECT id FROM topics WHERE topic_matches(name))")
+            else:
+                where.append("m.topic_id IN (SELECT id FROM topics WHERE instr(lower(name), ?) > 0)")
+                params.append(topic_filter.lower())
+        if start_ts is not None:
+            where.append("m.ts >= ?")
+            params.append(start_ts)
+        if end_ts is not None:
+            where.append("m.ts <= ?")
+            params.append(end_ts)
+        return (f"WHERE {' AND '.join(where)}" if where else ""), params
+
+    def _reader(self) -> closing:
+        """A short-lived read-only connection; WAL readers never block the writer."""
+        # Escaped so "?", "#" or "%" in the path are not read as URI syntax
+        return closing(sqlite3.connect(f"file:{quote(str(self.path))}?mode=ro", uri=True, timeout=10))
+
+
+def _to_message(row: tuple) -> MQTTMessage:
+    row_id, ts, topic, qos, retain, payload = row
+    return MQTTMessage(topic, payload, qos, bool(retain), ts, row_id)
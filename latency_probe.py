@@ -0,0 +1,315 @@
+"""
+End-to-end latency probe: publish → broker → subscriber.
+Sequence-numbered probe messages are published on a reserved per-run topic
+through the pooled publisher (the same path as ``publish_message``) and
+matched when the attached :class:`~mqtt_client.MQTTSubscriber` receives
+them, before they reach its store. Latencies go into a log-linear
+histogram in the style of HdrHistogram: constant-time recording, fixed
+memory and ~1% relative precision however long the probe runs. Probes not
+seen within a timeout count as lost; probes arriving after a higher
+sequence number count as reordered.
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+from mqtt_client import get_publisher_pool
+from scheduled_publish import TokenBucket
+
+PROBE_TOPIC_PREFIX = "admqtt/probe/"
+DEFAULT_LOSS_TIMEOUT = 5.0
+# Recent latencies kept for the dashboard sparkline
+RECENT_SAMPLES = 120
+# Sequence numbers of expired probes remembered to tell late arrivals from duplicates
+MAX_EXPIRED = 100_000
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram in microseconds, HdrHistogram style.
+
+    Values below ``2**sub_bits`` µs get a bucket each; above that every
+    power of two is split into ``2**(sub_bits - 1)`` equal buckets, so a
+    recorded value is off by at most ``1 / 2**(sub_bits - 1)`` of itself
+    (under 1.6% with the default 7 bits). Values above ``max_seconds`` are
+    clamped into the last bucket; the true maximum is tracked separately.
+    """
+
+    def __init__(self, max_seconds: float = 60.0, sub_bits: int = 7):
+        self.sub_count = 1 << sub_bits
+        self.half = self.sub_count >> 1
+        self.sub_bits = sub_bits
+        self.max_value = int(max_seconds * 1_000_000)
+        self.counts = [0] * (self._index(self.max_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return self.sub_count + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def _upper(self, index: int) -> int:
+        """Highest value that lands in bucket ``index``."""
+        if index < self.sub_count:
+            return index
+        shift, offset = divmod(index - self.sub_count, self.half)
+        shift += 1
+        return ((offset + self.half + 1) << shift) - 1
+
+    def record(self, seconds: float):
+        value = max(0, int(seconds * 1_000_000))
+        self.counts[self._index(min(value, self.max_value))] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p: float) -> float:
+        """Value in seconds at or below which a fraction ``p`` of recorded values fall."""
+        if not self.count:
+            return 0.0
+        target = max(1, round(self.count * p))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self._upper(index), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count / 1_000_000 if self.count else 0.0
+
+
+@dataclass
+class ProbeStats:
+    sent: int
+    received: int
+    lost: int               # not received within the loss timeout
+    in_flight: int          # sent, still within the loss timeout
+    reordered: int          # arrived after a probe with a higher sequence number
+    duplicates: int
+    late: int               # arrived after being counted as lost
+    elapsed: float
+    min_ms: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    p999_ms: float
+    max_ms: float
+    recent_ms: list[float]  # last RECENT_SAMPLES latencies, oldest first
+    running: bool
+    error: str | None
+
+    @property
+    def loss_ratio(self) -> float:
+        settled = self.received + self.lost
+        return self.lost / settled if settled else 0.0
+
+    def latency_summary(self) -> dict | None:
+        """Latency percentiles in the shape the CLI reports everywhere."""
+        if not self.received:
+            return None
+        return {"count": self.received, "p50_ms": self.p50_ms, "p95_ms": self.p95_ms, "p99_ms": self.p99_ms,
+                "p999_ms": self.p999_ms, "max_ms": self.max_ms}
+
+
+class LatencyProbe:
+    """Publish ``rate`` probes/sec at ``qos`` and time their arrival at ``subscriber``.
+
+    The subscriber must be connected to the broker being measured; probes
+    are published to that same broker. Payloads are small JSON objects
+    (``probe``, ``seq``, ``ts``) padded with spaces to ``size`` bytes.
+    """
+
+    def __init__(
+        self,
+        subscriber,
+        rate: float = 10.0,
+        qos: int = 0,
+        size: int = 0,
+        loss_timeout: float = DEFAULT_LOSS_TIMEOUT,
+        username: str | None = None,
+        password: str | None = None,
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.subscriber = subscriber
+        self.rate = rate
+        self.qos = qos
+        self.size = size
+        self.loss_timeout = loss_timeout
+        self.username = username
+        self.password = password
+        self.run_id = uuid.uuid4().hex[:12]
+        self.topic = PROBE_TOPIC_PREFIX + self.run_id
+        self.histogram = LatencyHistogram()
+        self._lock = threading.Lock()
+        self._pending: OrderedDict[int, float] = OrderedDict()  # seq → perf_counter at send
+        self._expired: OrderedDict[int, None] = OrderedDict()
+        self._recent: deque[float] = deque(maxlen=RECENT_SAMPLES)
+        self._highest = -1
+        self._sent = 0
+        self._received = 0
+        self._lost = 0
+        self._reordered = 0
+        self._duplicates = 0
+        self._late = 0
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started = 0.0
+        self._finished: float | None = None
+        self._error: str | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "LatencyProbe":
+        self.subscriber.attach_probe(self)
+        self._thread = threading.Thread(target=self._run, name="latency-probe", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = None):
+        """Stop sending, give in-flight probes up to ``timeout`` (default: the loss timeout) to arrive."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+        deadline = time.perf_counter() + (self.loss_timeout if timeout is None else timeout)
+        while self._pending and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.subscriber.detach_probe(self)
+        with self._lock:
+            self._lost += len(self._pending)
+            self._pending.clear()
+        if self._finished is None:
+            self._finished = time.perf_counter()
+
+    def on_receive(self, topic: str, payload: bytes):
+        """Called on the subscriber's network thread for each message on :attr:`topic`."""
+        now = time.perf_counter()
+        try:
+            seq = int(json.loads(payload)["seq"])
+        except (ValueError, KeyError, TypeError):
+            return
+        with self._lock:
+            sent = self._pending.pop(seq, None)
+            if sent is None:
+                if seq in self._expired:
+                    del self._expired[seq]
+                    self._late += 1
+                else:
+                    self._duplicates += 1
+                return
+            self._received += 1
+            if seq < self._highest:
+                self._reordered += 1
+            else:
+                self._highest = seq
+            latency = now - sent
+            self.histogram.record(latency)
+            self._recent.append(latency * 1000)
+
+    def stats(self) -> ProbeStats:
+        end = self._finished if self._finished is not None else time.perf_counter()
+        with self._lock:
+            h = self.histogram
+            return ProbeStats(
+                sent=self._sent,
+                received=self._received,
+                lost=self._lost,
+                in_flight=len(self._pending),
+                reordered=self._reordered,
+                duplicates=self._duplicates,
+                late=self._late,
+                elapsed=end - self._started if self._started else 0.0,
+                min_ms=h.min / 1000,
+                mean_ms=h.mean * 1000,
+                p50_ms=h.percentile(0.50) * 1000,
+                p95_ms=h.percentile(0.95) * 1000,
+                p99_ms=h.percentile(0.99) * 1000,
+                p999_ms=h.percentile(0.999) * 1000,
+                max_ms=h.max / 1000,
+                recent_ms=list(self._recent),
+                running=self.running,
+                error=self._error,
+            )
+
+    def _expire(self, now: float):
+        """Count probes older than the loss timeout as lost (oldest first, so O(1) per probe)."""
+        cutoff = now - self.loss_timeout
+        with self._lock:
+            pending = self._pending
+            while pending:
+                seq, sent = next(iter(pending.items()))
+                if sent > cutoff:
+                    break
+                del pending[seq]
+                self._lost += 1
+                self._expired[seq] = None
+                if len(self._expired) > MAX_EXPIRED:
+                    self._expired.popitem(last=False)
+
+    def _run(self):
+        sub = self.subscriber
+        publisher = get_publisher_pool().get(sub.broker_host, sub.broker_port, self.username, self.password)
+        bucket = TokenBucket(self.rate, burst=1)
+        self._started = time.perf_counter()
+        seq = 0
+        try:
+            while not self._stopping.is_set():
+                bucket.wait(self._stopping.wait)
+                if self._stopping.is_set():
+                    break
+                payload = json.dumps({"probe": self.run_id, "seq": seq, "ts": time.time()})
+                if self.size:
+                    payload = payload.ljust(self.size)
+                with self._lock:
+                    self._pending[seq] = time.perf_counter()
+                publisher.publish(self.topic, payload, qos=self.qos, wait=False)
+                self._sent += 1
+                seq += 1
+                self._expire(time.perf_counter())
+        except Exception as e:
+            self._error = str(e)
+        finally:
+            self._finished = time.perf_counter()
+
+
+# ---------------------------------------------------------------------------
+# Global singleton — one probe per app, survives Streamlit reruns
+# ---------------------------------------------------------------------------
+_probe: LatencyProbe | None = None
+_probe_lock = threading.Lock()
+
+
+def get_probe() -> LatencyProbe | None:
+    """Return the running (or last) latency probe, if one was started."""
+    return _probe
+
+
+def start_probe(*args, **kwargs) -> LatencyProbe:
+    """Stop any running probe and start a new :class:`LatencyProbe`."""
+    global _probe
+    with _probe_lock:
+        if _probe is not None:
+            _probe.stop(timeout=0)
+        _probe = LatencyProbe(*args, **kwargs).start()
+        return _probe
+
+
+def stop_probe():
+    with _probe_lock:
+        if _probe is not None:
+            _probe.stop()
@@ -0,0 +1,234 @@
+"""
+Live ingest metrics for the background MQTT subscriber.
+Updated by the paho network thread on every message in constant time:
+per-second message and byte counters in a ring (sliding-window rates and
+sparklines), a sliding-window counter per topic, and a power-of-two
+payload size histogram. Nothing here ever looks at the stored messages,
+so reading the metrics costs the same with 100 or 10 million buffered.
+
+Like the message stores this is single-writer / multi-reader: readers
+take no lock and may see a message counted in one figure but not yet in
+another, which is fine for a live view.
+
+:class:`TimedLock` is a drop-in ``threading.Lock`` that adds up how long
+callers waited for it, per lock name, for the metrics exporter.
+"""
+
+import heapq
+import threading
+import time
+from dataclasses import dataclass
+
+HISTORY_SECONDS = 60
+RATE_WINDOWS = (1, 10, 60)
+# Window (s) of the per-topic rates
+TOPIC_RATE_WINDOW = 10
+# Topics tracked individually; messages on further topics are counted under OTHER_TOPICS
+MAX_TOPICS = 10_000
+OTHER_TOPICS = "(other topics)"
+# Payload size buckets: bucket k holds sizes with k significant bits, i.e. < 2**k bytes
+SIZE_BUCKETS = 33
+
+
+def format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:,.0f} {unit}" if unit == "B" else f"{n:,.1f} {unit}"
+        n /= 1024
+    return f"{n:,.1f} GB"
+
+
+@dataclass
+class LiveStats:
+    total: int
+    total_bytes: int
+    msg_rates: dict[int, float]     # window seconds → msgs/sec over the last complete seconds
+    byte_rates: dict[int, float]    # window seconds → bytes/sec
+    msgs_history: list[int]         # msgs per second, oldest first, last HISTORY_SECONDS
+    bytes_history: list[int]
+    top_topics: list[tuple[str, float, int]]  # (topic, msgs/sec, total), busiest first
+    topic_count: int
+    size_histogram: list[int]       # counts per SIZE_BUCKETS bucket
+    max_size: int
+    queue_depth: int = 0            # writes queued for recorders (capture log, history)
+    queue_dropped: int = 0          # recorder writes dropped after a queue filled up
+
+    @property
+    def mean_size(self) -> float:
+        return self.total_bytes / self.total if self.total else 0.0
+
+    def size_rows(self) -> list[tuple[str, int]]:
+        """``(label, count)`` per size bucket from the smallest to the largest seen."""
+        used = [k for k, count in enumerate(self.size_histogram) if count]
+        if not used:
+            return []
+        rows = []
+        for k in range(used[0], used[-1] + 1):
+            label = "0 B" if k == 0 else f"{format_bytes(2 ** (k - 1))} – {format_bytes(2 ** k - 1)}"
+            rows.append((label, self.size_histogram[k]))
+        return rows
+
+
+class LiveMetrics:
+    """Constant-time counters fed by :meth:`record` for each received message."""
+
+    def __init__(self, history: int = HISTORY_SECONDS, max_topics: int = MAX_TOPICS,
+                 topic_window: int = TOPIC_RATE_WINDOW):
+        self.history = history
+        self.max_topics = max_topics
+        self.topic_window = topic_window
+        self.reset()
+
+    def reset(self):
+        # One slot per wall-clock second; slot s % history holds second s
+        self._msgs = [0] * self.history
+        self._bytes = [0] * self.history
+        self._second = int(time.time())
+        self._sizes = [0] * SIZE_BUCKETS
+        self._max_size = 0
+        self._total = 0
+        self._total_bytes = 0
+        # topic → [window number, count in it, count in the window before, total]
+        self._topics: dict[str, list] = {}
+
+    def record(self, topic: str, nbytes: int, ts: float):
+        second = int(ts)
+        if second > self._second:
+            self._advance(second)
+        slot = self._second % self.history
+        self._msgs[slot] += 1
+        self._bytes[slot] += nbytes
+        self._sizes[min(nbytes.bit_length(), SIZE_BUCKETS - 1)] += 1
+        if nbytes > self._max_size:
+            self._max_size = nbytes
+        self._total += 1
+        self._total_bytes += nbytes
+
+        window = second // self.topic_window
+        entry = self._topics.get(topic)
+        if entry is None:
+            if len(self._topics) >= self.max_topics:
+                topic = OTHER_TOPICS
+                entry = self._topics.get(topic)
+            if entry is None:
+                entry = self._topics[topic] = [window, 0, 0, 0]
+        if entry[0] != window:
+            if window > entry[0]:
+                entry[2] = entry[1] if entry[0] == window - 1 else 0
+                entry[0] = window
+                entry[1] = 0
+            # else: clock stepped back; count it in the current window
+        entry[1] += 1
+        entry[3] += 1
+
+    def totals(self) -> tuple[int, int]:
+        """Messages and payload bytes recorded since the last reset."""
+        return self._total, self._total_bytes
+
+    def _advance(self, second: int):
+        """Zero the slots of the seconds skipped since the last message."""
+        for s in range(self._second + 1, min(second, self._second + self.history) + 1):
+            self._msgs[s % self.history] = 0
+            self._bytes[s % self.history] = 0
+        self._second = second
+
+    def _history(self, counters: list[int], now_second: int) -> list[int]:
+        """Per-second values for the ``history`` complete seconds before ``now_second``."""
+        latest, size = self._second, self.history
+        return [counters[s % size] if latest - size < s <= latest else 0
+                for s in range(now_second - size, now_second)]
+
+    def stats(self, top: int = 10, now: float | None = None) -> LiveStats:
+        now = time.time() if now is None else now
+        now_second = int(now)
+        msgs = self._history(self._msgs, now_second)
+        nbytes = self._history(self._bytes, now_second)
+        windows = [w for w in RATE_WINDOWS if w <= self.history]
+        topics = list(self._topics.items())
+        size = self.topic_window
+        current, elapsed = divmod(now, size)
+
+        def rate(item) -> float:
+            # Sliding-window estimate: this window's count plus the unexpired share of the last one
+            window, count, previous, _total = item[1]
+            if window == current:
+                return (count + previous * (1 - elapsed / size)) / size
+            if window == current - 1:
+                return count * (1 - elapsed / size) / size
+            return 0.0
+
+        busiest = heapq.nlargest(top, topics, key=rate)
+        return LiveStats(
+            total=self._total,
+            total_bytes=self._total_bytes,
+            msg_rates={w: sum(msgs[-w:]) / w for w in windows},
+            byte_rates={w: sum(nbytes[-w:]) / w for w in windows},
+            msgs_history=msgs,
+            bytes_history=nbytes,
+            top_topics=[(t, rate((t, e)), e[3]) for t, e in busiest],
+            topic_count=len(topics),
+            size_histogram=list(self._sizes),
+            max_size=self._max_size,
+        )
+
+
+# ---------------------------------------------------------------------------
+# Lock contention
+# ---------------------------------------------------------------------------
+@dataclass
+class LockStats:
+    acquired: int = 0
+    contended: int = 0        # acquisitions that had to wait
+    wait_seconds: float = 0.0
+
+
+_lock_stats: dict[str, LockStats] = {}
+_lock_stats_lock = threading.Lock()
+
+
+def lock_stats() -> dict[str, LockStats]:
+    """Accumulated acquisitions and wait time per :class:`TimedLock` name."""
+    return dict(_lock_stats)
+
+
+class TimedLock:
+    """``threading.Lock`` that records acquisitions and time spent waiting.
+
+    Uncontended acquisitions cost one non-blocking attempt; only a caller
+    that has to wait reads the clock. Locks created with the same name
+    share one :class:`LockStats`, updated while the lock is held.
+    """
+
+    __slots__ = ("_lock", "_stats")
+
+    def __init__(self, name: str):
+        self._lock = threading.Lock()
+        with _lock_stats_lock:
+            self._stats = _lock_stats.setdefault(name, LockStats())
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self._stats.acquired += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        if not self._lock.acquire(True, timeout):
+            return False
+        stats = self._stats
+        stats.acquired += 1
+        stats.contended += 1
+        stats.wait_seconds += time.perf_counter() - start
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *_exc):
+        self._lock.release()
@@ -0,0 +1,431 @@
+"""
+Minimal in-process MQTT broker for tests and benchmarks.
+Speaks MQTT 3.1.1 and 5.0 over loopback: CONNECT, SUBSCRIBE/UNSUBSCRIBE
+with ``+``/``#`` wildcards, PUBLISH at QoS 0/1/2, retained messages, will
+messages and keep-alive pings. Sessions are always clean and nothing is
+persisted; it is a stand-in for Mosquitto, not a replacement.
+
+Usage:
+    python local_broker.py --port 1883
+
+or from code::
+
+    with LocalBroker() as broker:
+        publish_message("127.0.0.1", broker.port, "a/b", "hello")
+"""
+
+import argparse
+import asyncio
+import struct
+import threading
+
+from topic_index import is_wildcard
+from topic_trie import TopicTrie, validate_filter
+
+# Control packet types (upper nibble of the fixed header)
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+_U16 = struct.Struct("!H")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _encode_varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, n = n & 0x7F, n >> 7
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return bytes(out)
+
+
+def _decode_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+        if shift > 21:
+            raise ProtocolError("malformed variable byte integer")
+
+
+def _packet(ptype: int, flags: int, body: bytes) -> bytes:
+    return bytes([ptype << 4 | flags]) + _encode_varint(len(body)) + body
+
+
+def _string(buf: bytes, pos: int) -> tuple[bytes, int]:
+    (n,) = _U16.unpack_from(buf, pos)
+    return buf[pos + 2:pos + 2 + n], pos + 2 + n
+
+
+def _skip_properties(buf: bytes, pos: int) -> int:
+    length, pos = _decode_varint(buf, pos)
+    return pos + length
+
+
+def _split_packet(buf: bytearray, pos: int) -> tuple[int, int, bytes, int] | None:
+    """The complete packet at ``buf[pos:]`` and where the next one starts, or None."""
+    if len(buf) - pos < 2:
+        return None
+    length = shift = 0
+    i = pos + 1
+    while True:
+        if i >= len(buf):
+            return None
+        byte = buf[i]
+        i += 1
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+        if shift > 21:
+            raise ProtocolError("malformed remaining length")
+    end = i + length
+    if end > len(buf):
+        return None
+    return buf[pos] >> 4, buf[pos] & 0x0F, bytes(buf[i:end]), end
+
+
+class _Session:
+    __slots__ = ("client_id", "version", "writer", "subscriptions", "next_id", "inbound_qos2", "will")
+
+    def __init__(self, client_id: str, version: int, writer: asyncio.StreamWriter):
+        self.client_id = client_id
+        self.version = version
+        self.writer = writer
+        self.subscriptions: dict[str, int] = {}  # filter → granted qos
+        self.next_id = 0
+        self.inbound_qos2: set[int] = set()  # PUBREC sent, waiting for PUBREL
+        self.will: tuple[str, bytes, int, bool] | None = None
+
+    def packet_id(self) -> int:
+        self.next_id = self.next_id % 0xFFFF + 1
+        return self.next_id
+
+
+class LocalBroker:
+    """Asyncio MQTT broker bound to loopback.
+
+    :meth:`start` runs it on a private event loop in a daemon thread, so it
+    can be used from synchronous code; ``port=0`` picks a free port,
+    available as :attr:`port` once started. :meth:`serve` runs it on the
+    caller's loop instead.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._sessions: dict[str, _Session] = {}
+        self._trie = TopicTrie()
+        self._subscribers: dict[str, dict[_Session, int]] = {}  # filter → session → qos
+        self._retained: dict[str, tuple[bytes, int]] = {}
+        self._server: asyncio.base_events.Server | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.messages_routed = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def serve(self):
+        """Bind the listening socket; returns once it accepts connections."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def start(self) -> "LocalBroker":
+        """Run on a background thread; returns once the port is bound."""
+        ready = threading.Event()
+        errors: list[BaseException] = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._loop.run_until_complete(self.serve())
+            except BaseException as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._shutdown())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="local-broker", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    async def _shutdown(self):
+        if self._server is not None:
+            self._server.close()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __enter__(self) -> "LocalBroker":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ------------------------------------------------------------------
+    # Connection handling
+    # ------------------------------------------------------------------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._tasks.add(asyncio.current_task())
+        session: _Session | None = None
+        clean_exit = False
+        buf = bytearray()
+        timeout: float | None = 10.0  # for the CONNECT packet
+        try:
+            while True:
+                # Read whatever is available and parse every complete packet in it;
+                # one wakeup per chunk rather than per packet keeps fan-in cheap
+                chunk = await asyncio.wait_for(reader.read(1 << 16), timeout)
+                if not chunk:
+                    return
+                buf += chunk
+                pos = 0
+                while True:
+                    packet = _split_packet(buf, pos)
+                    if packet is None:
+                        break
+                    ptype, flags, body, pos = packet
+                    if session is None:
+                        if ptype != CONNECT:
+                            return
+                        session, keepalive = self._connect(body, writer)
+                        # Spec: drop the client after 1.5 × keep-alive without any packet
+                        timeout = keepalive * 1.5 if keepalive else None
+                    elif ptype == DISCONNECT:
+                        clean_exit = True
+                        return
+                    else:
+                        self._dispatch(session, ptype, flags, body)
+                del buf[:pos]
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+        except (asyncio.TimeoutError, asyncio.CancelledError, ConnectionError,
+                ProtocolError, IndexError, struct.error, UnicodeDecodeError, ValueError):
+            pass
+        finally:
+            self._tasks.discard(asyncio.current_task())
+            if session is not None and self._sessions.get(session.client_id) is session:
+                self._drop_session(session, publish_will=not clean_exit)
+            writer.close()
+
+    def _dispatch(self, session: _Session, ptype: int, flags: int, body: bytes):
+        writer = session.writer
+        if ptype == PUBLISH:
+            self._on_publish(session, flags, body)
+        elif ptype == PUBACK or ptype == PUBCOMP:
+            pass  # outbound deliveries are fire-and-forget on this side
+        elif ptype == PUBREC:
+            writer.write(_packet(PUBREL, 0x02, body[:2]))
+        elif ptype == PUBREL:
+            (pid,) = _U16.unpack_from(body)
+            session.inbound_qos2.discard(pid)
+            writer.write(_packet(PUBCOMP, 0, body[:2]))
+        elif ptype == SUBSCRIBE:
+            self._on_subscribe(session, body)
+        elif ptype == UNSUBSCRIBE:
+            self._on_unsubscribe(session, body)
+        elif ptype == PINGREQ:
+            writer.write(_packet(PINGRESP, 0, b""))
+        else:
+            raise ProtocolError(f"unexpected packet type {ptype}")
+
+    def _connect(self, body: bytes, writer: asyncio.StreamWriter) -> tuple[_Session, int]:
+        _name, pos = _string(body, 0)
+        version, flags = body[pos], body[pos + 1]
+        (keepalive,) = _U16.unpack_from(body, pos + 2)
+        pos += 4
+        if version not in (4, 5):
+            # CONNACK "unacceptable protocol version" (3.1.1 code)
+            writer.write(_packet(CONNACK, 0, b"\x00\x01"))
+            raise ProtocolError(f"unsupported protocol level {version}")
+        if version == 5:
+            pos = _skip_properties(body, pos)
+        client_id_raw, pos = _string(body, pos)
+        client_id = client_id_raw.decode("utf-8") or f"auto-{id(writer):x}"
+        will = None
+        if flags & 0x04:
+            if version == 5:
+                pos = _skip_properties(body, pos)
+            will_topic, pos = _string(body, pos)
+            will_payload, pos = _string(body, pos)
+            will = (will_topic.decode("utf-8"), will_payload, (flags >> 3) & 3, bool(flags & 0x20))
+        # Username/password are accepted without checking
+
+        old = self._sessions.get(client_id)
+        if old is not None:
+            # Session takeover: the newer connection wins
+            self._drop_session(old, publish_will=False)
+            old.writer.close()
+        session = _Session(client_id, version, writer)
+        session.will = will
+        self._sessions[client_id] = session
+        writer.write(_packet(CONNACK, 0, b"\x00\x00\x00" if version == 5 else b"\x00\x00"))
+        return session, keepalive
+
+    def _drop_session(self, session: _Session, publish_will: bool):
+        del self._sessions[session.client_id]
+        for topic_filter in list(session.subscriptions):
+            self._remove_subscription(session, topic_filter)
+        if publish_will and session.will is not None:
+            topic, payload, qos, retain = session.will
+            self._route(topic, payload, qos, retain)
+
+    # ------------------------------------------------------------------
+    # Publish / subscribe
+    # ------------------------------------------------------------------
+
+    def _on_publish(self, session: _Session, flags: int, body: bytes):
+        qos, retain = (flags >> 1) & 3, bool(flags & 1)
+        topic_raw, pos = _string(body, 0)
+        pid = None
+        if qos:
+            (pid,) = _U16.unpack_from(body, pos)
+            pos += 2
+        if session.version == 5:
+            pos = _skip_properties(body, pos)
+        topic = topic_raw.decode("utf-8")
+        payload = body[pos:]
+        if qos == 1:
+            session.writer.write(_packet(PUBACK, 0, _U16.pack(pid)))
+        elif qos == 2:
+            session.writer.write(_packet(PUBREC, 0, _U16.pack(pid)))
+            if pid in session.inbound_qos2:
+                return  # duplicate of a message already routed
+            session.inbound_qos2.add(pid)
+        self._route(topic, payload, qos, retain)
+
+    def _route(self, topic: str, payload: bytes, qos: int, retain: bool):
+        if retain:
+            if payload:
+                self._retained[topic] = (payload, qos)
+            else:
+                self._retained.pop(topic, None)
+        # One delivery per session, at the highest QoS any of its matching filters granted
+        targets: dict[_Session, int] = {}
+        for topic_filter in self._trie.match_cached(topic):
+            for session, granted in self._subscribers[topic_filter].items():
+                if granted > targets.get(session, -1):
+                    targets[session] = granted
+        topic_bytes = topic.encode("utf-8")
+        for session, granted in targets.items():
+            self._deliver(session, topic_bytes, payload, min(qos, granted), False)
+        self.messages_routed += 1
+
+    def _deliver(self, session: _Session, topic: bytes, payload: bytes, qos: int, retain: bool):
+        parts = [_U16.pack(len(topic)), topic]
+        if qos:
+            parts.append(_U16.pack(session.packet_id()))
+        if session.version == 5:
+            parts.append(b"\x00")  # no properties
+        parts.append(payload)
+        session.writer.write(_packet(PUBLISH, qos << 1 | int(retain), b"".join(parts)))
+
+    def _on_subscribe(self, session: _Session, body: bytes):
+        (pid,) = _U16.unpack_from(body, 0)
+        pos = 2
+        if session.version == 5:
+            pos = _skip_properties(body, pos)
+        codes = bytearray()
+        new_filters = []
+        while pos < len(body):
+            raw, pos = _string(body, pos)
+            options = body[pos]
+            pos += 1
+            topic_filter = raw.decode("utf-8")
+            try:
+                validate_filter(topic_filter)
+            except ValueError:
+                codes.append(0x80 if session.version == 4 else 0x8F)
+                continue
+            qos = min(options & 3, 2)
+            if topic_filter not in self._subscribers:
+                self._subscribers[topic_filter] = {}
+                self._trie.add(topic_filter)
+            self._subscribers[topic_filter][session] = qos
+            session.subscriptions[topic_filter] = qos
+            codes.append(qos)
+            new_filters.append((topic_filter, qos))
+        ack = _U16.pack(pid) + (b"\x00" if session.version == 5 else b"") + bytes(codes)
+        session.writer.write(_packet(SUBACK, 0, ack))
+        for topic_filter, qos in new_filters:
+            if not is_wildcard(topic_filter):
+                # Exact filters (e.g. a device's own command topic) are a dict lookup,
+                # not a scan of every retained message
+                if topic_filter in self._retained:
+                    payload, retained_qos = self._retained[topic_filter]
+                    self._deliver(session, topic_filter.encode("utf-8"), payload, min(qos, retained_qos), True)
+                continue
+            matcher = TopicTrie([topic_filter])
+            for topic, (payload, retained_qos) in list(self._retained.items()):
+                if matcher.match(topic):
+                    self._deliver(session, topic.encode("utf-8"), payload, min(qos, retained_qos), True)
+
+    def _on_unsubscribe(self, session: _Session, body: bytes):
+        (pid,) = _U16.unpack_from(body, 0)
+        pos = 2
+        if session.version == 5:
+            pos = _skip_properties(body, pos)
+        codes = bytearray()
+        while pos < len(body):
+            raw, pos = _string(body, pos)
+            topic_filter = raw.decode("utf-8")
+            codes.append(0x00 if topic_filter in session.subscriptions else 0x11)
+            self._remove_subscription(session, topic_filter)
+        ack = _U16.pack(pid) + (b"\x00" + bytes(codes) if session.version == 5 else b"")
+        session.writer.write(_packet(UNSUBACK, 0, ack))
+
+    def _remove_subscription(self, session: _Session, topic_filter: str):
+        session.subscriptions.pop(topic_filter, None)
+        subscribers = self._subscribers.get(topic_filter)
+        if subscribers is None:
+            return
+        subscribers.pop(session, None)
+        if not subscribers:
+            del self._subscribers[topic_filter]
+            self._trie.remove(topic_filter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal local MQTT broker (loopback only)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    async def run():
+        broker = LocalBroker(args.host, args.port)
+        await broker.serve()
+        print(f"Local MQTT broker listening on {broker.host}:{broker.port}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,630 @@
-def main():
-    print("Hello from mymqtt!")
+"""
+Headless command line: ``mymqtt pub``, ``mymqtt sub``, ``mymqtt bench``,
+``mymqtt sim``, ``mymqtt replay`` and ``mymqtt probe``.
+Reuses the app's MQTT plumbing (mqtt_client, bulk_publish, local_broker)
+without Streamlit, for ingest and load generation on machines with no UI.
+Those modules are imported inside each command so ``--help`` and argument
+errors return immediately.
+
+Usage:
+    mymqtt pub -t sensors/{k}/temp --topics 100 -n 100000 -q 1 -c 4
+    mymqtt sub -t 'sensors/#' -d 60 --latency
+    mymqtt bench -n 200000 --size 256
+    mymqtt sim --devices 5000 --interval 5 --jitter 0.2 -d 300
+    mymqtt replay capture.ndjson -H staging --speed 10
+    mymqtt probe -H broker --rate 20 -q 1 -d 60 --max-p99 50
+"""
+
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+from collections.abc import Collection, Iterator
+
+DEFAULT_PAYLOAD = '{"i": {i}, "ts": {ts}}'
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _percentiles(samples: Collection[float]) -> dict | None:
+    """p50/p95/p99/max in milliseconds of latencies given in seconds."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    return {"count": len(ordered), "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+            "max_ms": ordered[-1] * 1000}
+
+
+class _Latencies:
+    """Latencies recorded into a fixed-size :class:`~latency_probe.LatencyHistogram`.
+
+    Memory stays constant however long a run lasts; ``record`` may be
+    called from several network threads at once.
+    """
+
+    def __init__(self):
+        from latency_probe import LatencyHistogram
+
+        self._histogram = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._histogram.record(seconds)
+
+    def summary(self) -> dict | None:
+        """Same shape as :func:`_percentiles`, within the histogram's ~1% precision."""
+        h = self._histogram
+        with self._lock:
+            if not h.count:
+                return None
+            return {"count": h.count, "p50_ms": h.percentile(0.50) * 1000, "p95_ms": h.percentile(0.95) * 1000,
+                    "p99_ms": h.percentile(0.99) * 1000, "max_ms": h.max / 1000}
+
+
+def _format_latency(label: str, stats: dict | None) -> str:
+    if stats is None:
+        return f"{label}: no samples"
+    return (f"{label}: p50 {stats['p50_ms']:.2f} ms  p95 {stats['p95_ms']:.2f} ms  "
+            f"p99 {stats['p99_ms']:.2f} ms  max {stats['max_ms']:.2f} ms  (n={stats['count']})")
+
+
+def _report(summary: dict, lines: list[str], as_json: bool):
+    """Print the exit summary: JSON on stdout, or readable lines on stderr."""
+    if as_json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for line in lines:
+            print(line, file=sys.stderr)
+
+
+class _StopOnSignal:
+    """First Ctrl-C (or SIGTERM) asks the command to wind down and report;
+    a second Ctrl-C aborts."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def __enter__(self) -> threading.Event:
+        self._previous = {sig: signal.signal(sig, self._handle) for sig in (signal.SIGINT, signal.SIGTERM)}
+        return self.event
+
+    def __exit__(self, *_exc):
+        for sig, handler in self._previous.items():
+            signal.signal(sig, handler)
+
+    def _handle(self, signum, _frame):
+        if self.event.is_set() and signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        self.event.set()
+
+
+def _generate(topic: str, payload: str, qos: int, retain: bool, count: int, rate: float, topics: int,
+              size: int, stop: threading.Event) -> Iterator[dict]:
+    """Bulk items from templates, paced by a token bucket to ``rate`` msg/s (0 = unpaced).
+
+    ``{k}`` in the topic is the message number modulo ``topics``; ``{i}``
+    and ``{ts}`` in the payload are the message number and the wall-clock
+    send time. ``size`` pads payloads with spaces to at least that many bytes.
+    """
+    from scheduled_publish import TokenBucket
+
+    has_k = "{k}" in topic
+    has_i = "{i}" in payload
+    has_ts = "{ts}" in payload
+    bucket = TokenBucket(rate) if rate else None
+    i = 0
+    while (not count or i < count) and not stop.is_set():
+        if bucket is not None:
+            bucket.wait(stop.wait)
+        body = payload
+        if has_i:
+            body = body.replace("{i}", str(i))
+        if has_ts:
+            body = body.replace("{ts}", f"{time.time():.6f}")
+        if len(body) < size:
+            body = body.ljust(size)
+        yield {"topic": topic.replace("{k}", str(i % topics)) if has_k else topic,
+               "payload": body, "qos": qos, "retain": retain}
+        i += 1
+
+
+class _Counter:
+    """Subscriber recorder counting messages and, optionally, printing them
+    and measuring latency from a ``"ts"`` field in JSON payloads."""
+
+    def __init__(self, limit: int = 0, echo: bool = False, latency: bool = False):
+        self.limit = limit
+        self.echo = echo
+        self.latencies: _Latencies | None = _Latencies() if latency else None
+        self.count = 0
+        self.bytes = 0
+        self.first_ts: float | None = None
+        self.last_ts: float | None = None
+        self.done = threading.Event()
+
+    def append(self, topic: str, payload: bytes, qos: int, retain: bool, ts: float, seq: int = 0):
+        self.count += 1
+        self.bytes += len(payload)
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        if self.echo:
+            sys.stdout.write(f"{topic} {payload.decode('utf-8', 'replace')}\n")
+        if self.latencies is not None and not retain:
+            try:
+                self.latencies.record(ts - float(json.loads(payload)["ts"]))
+            except (ValueError, TypeError, KeyError):
+                pass
+        if self.limit and self.count >= self.limit:
+            self.done.set()
+
+
+def _run_publish(args, host: str, port: int, stop: threading.Event, topic: str, payload: str):
+    """Publish per ``args`` and return (result, ack latencies)."""
+    from bulk_publish import parallel_bulk_publish
+
+    latencies = _Latencies()
+    last_line = 0.0
+
+    def progress(acked: int, _total: int | None):
+        nonlocal last_line
+        now = time.monotonic()
+        if not args.quiet and sys.stderr.isatty() and now - last_line >= 0.5:
+            last_line = now
+            print(f"\r  {acked} acked", end="", file=sys.stderr, flush=True)
+
+    items = _generate(topic, payload, args.qos, getattr(args, "retain", False), args.count, args.rate,
+                      args.topics, args.size, stop)
+    result = parallel_bulk_publish(host, port, items, connections=args.connections, window=args.window,
+                                   timeout=args.timeout, username=args.username, password=args.password,
+                                   on_progress=progress, on_ack=latencies.record)
+    if not args.quiet and sys.stderr.isatty():
+        print("\r", end="", file=sys.stderr)
+    return result, latencies
+
+
+# ---------------------------------------------------------------------------
+# Commands
+# ---------------------------------------------------------------------------
+
+def cmd_pub(args) -> int:
+    with _StopOnSignal() as stop:
+        result, latencies = _run_publish(args, args.host, args.port, stop, args.topic, args.message)
+    ack = latencies.summary()
+    for failure in result.failures[:5]:
+        print(f"failed #{failure.index} {failure.topic}: {failure.error}", file=sys.stderr)
+    _report(
+        {"command": "pub", "sent": result.total, "acked": result.succeeded, "failed": result.failed,
+         "elapsed_s": result.elapsed, "msgs_per_sec": result.msgs_per_sec, "ack_latency": ack},
+        [f"pub: {result.succeeded}/{result.total} acked, {result.failed} failed in {result.elapsed:.2f}s "
+         f"— {result.msgs_per_sec:,.0f} msg/s",
+         _format_latency("ack latency", ack)],
+        args.json,
+    )
+    return 1 if result.failed else 0
+
+
+def cmd_sub(args) -> int:
+    from metrics_exporter import MetricsExporter, get_metrics_exporter
+    from mqtt_client import get_capture_log, get_history_store, get_subscriber
+
+    counter = _Counter(args.count, args.verbose, args.latency)
+    sub = get_subscriber()
+    sub.add_recorder(counter)
+    try:
+        exporter = MetricsExporter(sub, args.metrics_port).start() if args.metrics_port else get_metrics_exporter()
+    except OSError as e:
+        print(f"sub: metrics endpoint: {e}", file=sys.stderr)
+        return 2
+    try:
+        sub.start(args.host, args.port, args.topic)
+    except ValueError as e:
+        print(f"sub: {e}", file=sys.stderr)
+        return 2
+    start = time.perf_counter()
+    with _StopOnSignal() as stop:
+        deadline = start + args.duration if args.duration else None
+        while not stop.is_set() and not counter.done.is_set():
+            if sub.error and not sub.active:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            counter.done.wait(0.1)
+    elapsed = time.perf_counter() - start
+    sub.stop()
+    if exporter is not None:
+        exporter.stop()
+    sys.stdout.flush()
+    for recorder in (get_capture_log(), get_history_store()):
+        if recorder is not None:
+            recorder.close()
+
+    stats = sub.get_store_stats()
+    rate = counter.count / elapsed if elapsed > 0 else 0.0
+    e2e = counter.latencies.summary() if counter.latencies is not None else None
+    lines = [f"sub: {counter.count} messages, {counter.bytes:,} bytes in {elapsed:.2f}s — {rate:,.0f} msg/s",
+             f"buffer: {stats.retained} retained, {stats.evicted} evicted"]
+    if counter.latencies is not None:
+        lines.append(_format_latency("end-to-end latency", e2e))
+    if sub.error:
+        lines.append(f"error: {sub.error}")
+    _report({"command": "sub", "received": counter.count, "bytes": counter.bytes, "elapsed_s": elapsed,
+             "msgs_per_sec": rate, "evicted": stats.evicted, "latency": e2e, "error": sub.error},
+            lines, args.json)
+    return 1 if sub.error and not counter.count else 0
+
+
+def cmd_bench(args) -> int:
+    """Publish through a broker into a subscriber in this process and report both ends."""
+    from local_broker import LocalBroker
+    from message_store import ColumnarStore
+    from mqtt_client import MQTTSubscriber
+    from topic_index import TopicIndex
+
+    broker = None
+    if args.host:
+        host, port = args.host, args.port
+    else:
+        broker = LocalBroker().start()
+        host, port = broker.host, broker.port
+
+    counter = _Counter(latency=True)
+    sub = MQTTSubscriber(ColumnarStore(max(args.count, 1), 1 << 30, index=TopicIndex()))
+    sub.add_recorder(counter)
+    try:
+        sub.start(host, port, [f"{args.prefix}/#"])
+        deadline = time.monotonic() + 10
+        while not sub.active and not sub.error and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if not sub.active:
+            print(f"bench: subscriber could not connect to {host}:{port}: {sub.error}", file=sys.stderr)
+            return 1
+        time.sleep(0.2)  # let the SUBACK land before publishing
+
+        with _StopOnSignal() as stop:
+            result, acks = _run_publish(args, host, port, stop, f"{args.prefix}/{{k}}", DEFAULT_PAYLOAD)
+            deadline = time.monotonic() + args.timeout
+            while counter.count < result.succeeded and time.monotonic() < deadline and not stop.is_set():
+                time.sleep(0.01)
+        received_elapsed = (counter.last_ts - counter.first_ts) if counter.count > 1 else 0.0
+    finally:
+        sub.stop()
+        if broker is not None:
+            broker.stop()
+
+    ack = acks.summary()
+    e2e = counter.latencies.summary()
+    sub_rate = counter.count / received_elapsed if received_elapsed > 0 else 0.0
+    _report(
+        {"command": "bench", "broker": f"{host}:{port}" if broker is None else "local",
+         "params": {"count": args.count, "size": args.size, "qos": args.qos, "connections": args.connections,
+                    "window": args.window, "topics": args.topics, "rate": args.rate},
+         "publish": {"acked": result.succeeded, "failed": result.failed, "elapsed_s": result.elapsed,
+                     "msgs_per_sec": result.msgs_per_sec, "ack_latency": ack},
+         "subscribe": {"received": counter.count, "msgs_per_sec": sub_rate, "latency": e2e}},
+        [f"publish: {result.succeeded} acked, {result.failed} failed in {result.elapsed:.2f}s "
+         f"— {result.msgs_per_sec:,.0f} msg/s",
+         _format_latency("ack latency", ack),
+         f"subscribe: {counter.count}/{result.succeeded} received — {sub_rate:,.0f} msg/s",
+         _format_latency("end-to-end latency", e2e)],
+        args.json,
+    )
+    return 0 if result.failed == 0 and counter.count >= result.succeeded else 1
+
+
+def cmd_sim(args) -> int:
+    """Run a simulated device fleet until --duration or Ctrl-C."""
+    from fleet_sim import DEFAULT_TEMPLATES, FleetConfig, FleetSimulator
+
+    templates = dict(DEFAULT_TEMPLATES)
+    if args.template:
+        templates = {}
+        for spec in args.template:
+            name, sep, template = spec.partition("=")
+            if not sep or not name:
+                print(f"sim: --template must be NAME=TEMPLATE, got {spec!r}", file=sys.stderr)
+                return 2
+            templates[name] = template
+    config = FleetConfig(
+        devices=args.devices, interval=args.interval, jitter=args.jitter, qos=args.qos,
+        topic_prefix=args.topic_prefix, client_prefix=args.client_prefix, templates=templates,
+        keepalive=args.keepalive, connect_rate=args.connect_rate,
+        status=not args.no_status, commands=not args.no_commands,
+    )
+    try:
+        fleet = FleetSimulator(args.host, args.port, config)
+    except ValueError as e:
+        print(f"sim: {e}", file=sys.stderr)
+        return 2
+    if not args.quiet:
+        print(f"sim: {config.devices} devices → {args.host}:{args.port}, "
+              f"nominal {config.msgs_per_sec:,.0f} msg/s", file=sys.stderr)
+    fleet.start()
+    with _StopOnSignal() as stop:
+        deadline = time.monotonic() + args.duration if args.duration else None
+        while not stop.wait(args.report_every):
+            if not args.quiet:
+                s = fleet.stats()
+                print(f"  {s.connected}/{s.devices} connected, {s.published:,} published "
+                      f"({s.msgs_per_sec:,.0f} msg/s), {s.errors} errors", file=sys.stderr)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+    fleet.stop()
+
+    s = fleet.stats()
+    ack = _percentiles(fleet.ack_latencies) if config.qos else None
+    lines = [f"sim: {s.devices} devices, {s.published:,} published in {s.elapsed:.1f}s — {s.msgs_per_sec:,.0f} msg/s",
+             f"acked {s.acked:,}, commands received {s.received:,}, reconnects {s.reconnects}, errors {s.errors}"]
+    if config.qos:
+        lines.append(_format_latency("ack latency", ack))
+    if s.last_error:
+        lines.append(f"last error: {s.last_error}")
+    _report({"command": "sim", "devices": s.devices, "published": s.published, "acked": s.acked,
+             "received": s.received, "reconnects": s.reconnects, "errors": s.errors, "elapsed_s": s.elapsed,
+             "msgs_per_sec": s.msgs_per_sec, "ack_latency": ack, "last_error": s.last_error},
+            lines, args.json)
+    return 0
+
+
+def cmd_replay(args) -> int:
+    """Replay an exported file, or the env-configured capture log or history, to a broker."""
+    from export import filter_messages, format_from_name, iter_segment_log, read_export
+    from mqtt_client import get_capture_log, get_history_store
+    from replay import Replayer
+
+    close = None
+    if args.file is not None:
+        try:
+            fileobj = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+            messages = read_export(fileobj, args.format or format_from_name(args.file))
+        except (OSError, ValueError) as e:
+            print(f"replay: {e}", file=sys.stderr)
+            return 2
+        close = fileobj.close
+        messages = filter_messages(messages, args.topic)
+    elif args.source == "capture":
+        capture = get_capture_log()
+        if capture is None:
+            print("replay: --from capture needs MQTT_CAPTURE_DIR", file=sys.stderr)
+            return 2
+        close = capture.close
+        messages = filter_messages(iter_segment_log(capture), args.topic)
+    else:
+        history = get_history_store()
+        if history is None:
+            print("replay: --from history needs MQTT_HISTORY_DB", file=sys.stderr)
+            return 2
+        close = history.close
+        messages = history.iter_query(args.topic)
+
+    if args.speed < 0:
+        print("replay: --speed must be positive, or 0 for as fast as possible", file=sys.stderr)
+        return 2
+    replayer = Replayer(messages, args.host, args.port, speed=args.speed, max_gap=args.max_gap, qos=args.qos,
+                        topic_prefix=args.topic_prefix, retain=not args.no_retain,
+                        username=args.username, password=args.password)
+    replayer.start()
+    with _StopOnSignal() as stop:
+        next_report = time.monotonic() + args.report_every
+        while replayer.running and not stop.wait(0.1):
+            if not args.quiet and time.monotonic() >= next_report:
+                next_report += args.report_every
+                s = replayer.stats()
+                print(f"  {s.sent:,} sent, {s.replayed_span:,.1f}s of traffic replayed", file=sys.stderr)
+    replayer.stop()
+    if close is not None:
+        close()
+
+    s = replayer.stats()
+    speed = f"{s.speed:g}x" if s.speed else "as fast as possible"
+    lines = [f"replay: {s.sent:,} sent ({speed}), {s.replayed_span:,.1f}s of traffic in {s.elapsed:.1f}s "
+             f"— {s.msgs_per_sec:,.0f} msg/s, {s.failed} failed"]
+    if s.error_count:
+        lines.append(f"timing error: mean {s.error_mean_ms:.2f} ms  p50 {s.error_p50_ms:.2f} ms  "
+                     f"p99 {s.error_p99_ms:.2f} ms  max {s.error_max_ms:.2f} ms")
+        width = max(len(label) for label, _ in s.histogram_rows())
+        for label, count in s.histogram_rows():
+            share = count / s.error_count
+            lines.append(f"  {label:>{width}}  {count:>9,}  {share:6.1%}  {'#' * round(share * 40)}".rstrip())
+    if s.error:
+        lines.append(f"error: {s.error}")
+    _report({"command": "replay", "sent": s.sent, "failed": s.failed, "speed": s.speed,
+             "replayed_span_s": s.replayed_span, "elapsed_s": s.elapsed, "msgs_per_sec": s.msgs_per_sec,
+             "timing_error": {"count": s.error_count, "mean_ms": s.error_mean_ms, "p50_ms": s.error_p50_ms,
+                              "p99_ms": s.error_p99_ms, "max_ms": s.error_max_ms,
+                              "histogram": dict(s.histogram_rows())} if s.error_count else None,
+             "error": s.error},
+            lines, args.json)
+    return 0 if s.error is None and s.failed == 0 else 1
+
+
+def cmd_probe(args) -> int:
+    """Measure publish → broker → subscribe latency, loss and reordering until --duration or Ctrl-C."""
+    from latency_probe import LatencyProbe
+    from mqtt_client import MQTTSubscriber
+
+    sub = MQTTSubscriber()
+    try:
+        probe = LatencyProbe(sub, rate=args.rate, qos=args.qos, size=args.size, loss_timeout=args.loss_timeout,
+                             username=args.username, password=args.password)
+    except ValueError as e:
+        print(f"probe: {e}", file=sys.stderr)
+        return 2
+    sub.start(args.host, args.port, [probe.topic])
+    deadline = time.monotonic() + 10
+    while not sub.active and not sub.error and time.monotonic() < deadline:
+        time.sleep(0.01)
+    if not sub.active:
+        print(f"probe: subscriber could not connect to {args.host}:{args.port}: {sub.error}", file=sys.stderr)
+        return 1
+    time.sleep(0.2)  # let the SUBACK land before the first probe
+
+    probe.start()
+    with _StopOnSignal() as stop:
+        deadline = time.monotonic() + args.duration if args.duration else None
+        next_report = time.monotonic() + args.report_every
+        while probe.running and not stop.wait(0.1):
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            if not args.quiet and now >= next_report:
+                next_report += args.report_every
+                s = probe.stats()
+                print(f"  {s.received:,}/{s.sent:,} received — p50 {s.p50_ms:.2f} ms  p99 {s.p99_ms:.2f} ms  "
+                      f"max {s.max_ms:.2f} ms, {s.lost} lost", file=sys.stderr)
+    probe.stop()
+    sub.stop()
+
+    s = probe.stats()
+    latency = s.latency_summary()
+    lines = [f"probe: {s.sent:,} sent at {args.rate:g}/s (QoS {args.qos}) to {args.host}:{args.port} over "
+             f"{s.elapsed:.1f}s",
+             _format_latency("end-to-end latency", latency) + (f"  p99.9 {s.p999_ms:.2f} ms" if latency else ""),
+             f"lost {s.lost} ({s.loss_ratio:.2%}), reordered {s.reordered}, duplicates {s.duplicates}, "
+             f"late {s.late}"]
+    failures = []
+    if args.max_p99 is not None and (latency is None or s.p99_ms > args.max_p99):
+        failures.append(f"p99 {s.p99_ms:.2f} ms exceeds {args.max_p99:g} ms" if latency else "no probes received")
+    if args.max_loss is not None and s.loss_ratio * 100 > args.max_loss:
+        failures.append(f"loss {s.loss_ratio:.2%} exceeds {args.max_loss:g}%")
+    if s.error:
+        failures.append(f"error: {s.error}")
+    lines.extend(f"FAIL: {f}" for f in failures)
+    _report({"command": "probe", "sent": s.sent, "received": s.received, "lost": s.lost,
+             "loss_ratio": s.loss_ratio, "reordered": s.reordered, "duplicates": s.duplicates, "late": s.late,
+             "elapsed_s": s.elapsed, "latency": latency, "failures": failures},
+            lines, args.json)
+    return 1 if failures or not s.received else 0
+
+
+# ---------------------------------------------------------------------------
+# Argument parsing
+# ---------------------------------------------------------------------------
+
+def _add_broker_args(parser: argparse.ArgumentParser, default_host: str | None = "localhost", auth: bool = True):
+    parser.add_argument("-H", "--host", default=default_host, help="Broker host (default: %(default)s)")
+    parser.add_argument("-p", "--port", type=int, default=1883, help="Broker port (default: %(default)s)")
+    if auth:
+        parser.add_argument("-u", "--username")
+        parser.add_argument("-P", "--password")
+    parser.add_argument("--json", action="store_true", help="Print the exit summary as JSON on stdout")
+
+
+def _add_load_args(parser: argparse.ArgumentParser, default_count: int):
+    parser.add_argument("-n", "--count", type=int, default=default_count,
+                        help="Messages to publish, 0 = until Ctrl-C (default: %(default)s)")
+    parser.add_argument("-q", "--qos", type=int, choices=(0, 1, 2), default=0 if default_count == 1 else 1)
+    parser.add_argument("--rate", type=float, default=0, help="Target msg/s across all connections (0 = max)")
+    parser.add_argument("--topics", type=int, default=1, help="Spread messages over N topics via {k}")
+    parser.add_argument("--size", type=int, default=0, help="Pad payloads to at least N bytes")
+    parser.add_argument("-c", "--connections", type=int, default=1, help="Parallel connections")
+    parser.add_argument("--window", type=int, default=100, help="Unacknowledged messages per connection")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for outstanding acks")
+    parser.add_argument("--quiet", action="store_true", help="No progress output")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="mymqtt", description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pub = commands.add_parser("pub", help="Publish messages (one, a fixed count, or a paced stream)")
+    _add_broker_args(pub)
+    pub.add_argument("-t", "--topic", required=True, help="Topic; {k} is replaced per --topics")
+    pub.add_argument("-m", "--message", default=DEFAULT_PAYLOAD,
+                     help="Payload template; {i} = message number, {ts} = send time (default: %(default)s)")
+    pub.add_argument("-r", "--retain", action="store_true")
+    _add_load_args(pub, default_count=1)
+    pub.set_defaults(handler=cmd_pub)
+
+    sub = commands.add_parser("sub", help="Subscribe and count (or print) messages; honours MQTT_* storage env vars")
+    _add_broker_args(sub, auth=False)
+    sub.add_argument("-t", "--topic", action="append", help="Topic filter, repeatable (default: #)")
+    sub.add_argument("-n", "--count", type=int, default=0, help="Exit after N messages")
+    sub.add_argument("-d", "--duration", type=float, default=0, help="Exit after N seconds")
+    sub.add_argument("-v", "--verbose", action="store_true", help="Print each message to stdout")
+    sub.add_argument("--latency", action="store_true",
+                     help='Measure end-to-end latency from a JSON "ts" field (as sent by mymqtt pub)')
+    sub.add_argument("--metrics-port", type=int, default=0,
+                     help="Serve Prometheus metrics on this port (default: MQTT_METRICS_PORT, if set)")
+    sub.set_defaults(handler=cmd_sub)
+
+    bench = commands.add_parser("bench", help="Publish into a subscriber in this process and report both ends")
+    _add_broker_args(bench, default_host=None)
+    bench.description = "Without --host an in-process LocalBroker is started."
+    bench.add_argument("--prefix", default="bench/cli", help="Topic prefix (default: %(default)s)")
+    _add_load_args(bench, default_count=100_000)
+    bench.set_defaults(handler=cmd_bench)
+
+    sim = commands.add_parser("sim", help="Simulate a fleet of ESP8266-style devices on one event loop")
+    _add_broker_args(sim, auth=False)
+    sim.add_argument("--devices", type=int, default=100, help="Number of devices (default: %(default)s)")
+    sim.add_argument("--interval", type=float, default=5.0, help="Seconds between a device's publishes")
+    sim.add_argument("--jitter", type=float, default=0.1, help="± fraction of the interval per publish")
+    sim.add_argument("-q", "--qos", type=int, choices=(0, 1), default=0)
+    sim.add_argument("--template", action="append", metavar="NAME=TEMPLATE",
+                     help="Per-device subtopic and payload template, repeatable "
+                          "(default: temperature and humidity readings)")
+    sim.add_argument("--topic-prefix", default="sim", help="Topics are PREFIX/<client id>/<name>")
+    sim.add_argument("--client-prefix", default="sim-esp8266", help="Client ids are PREFIX-00000, …")
+    sim.add_argument("--keepalive", type=int, default=60)
+    sim.add_argument("--connect-rate", type=float, default=500.0, help="New connections per second during ramp-up")
+    sim.add_argument("--no-status", action="store_true", help="Skip the retained online/offline status and will")
+    sim.add_argument("--no-commands", action="store_true", help="Skip the per-device command subscription")
+    sim.add_argument("-d", "--duration", type=float, default=0, help="Stop after N seconds (default: until Ctrl-C)")
+    sim.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress lines")
+    sim.add_argument("--quiet", action="store_true", help="No progress output")
+    sim.set_defaults(handler=cmd_sim)
+
+    replay = commands.add_parser("replay", help="Re-publish captured traffic with its original timing, or faster")
+    _add_broker_args(replay)
+    source = replay.add_mutually_exclusive_group(required=True)
+    source.add_argument("file", nargs="?", help="Exported .csv, .ndjson or .parquet file (- = stdin)")
+    source.add_argument("--from", dest="source", choices=("capture", "history"),
+                        help="Replay the MQTT_CAPTURE_DIR capture log or the MQTT_HISTORY_DB database instead")
+    replay.add_argument("--format", choices=("csv", "ndjson", "parquet"),
+                        help="File format (default: from the extension)")
+    replay.add_argument("-t", "--topic", help="Only replay topics matching this filter")
+    replay.add_argument("--speed", type=float, default=1.0,
+                        help="Timing multiplier, e.g. 0.5 or 10; 0 = as fast as possible (default: %(default)s)")
+    replay.add_argument("--max-gap", type=float, help="Shorten idle gaps longer than N seconds of original traffic")
+    replay.add_argument("-q", "--qos", type=int, choices=(0, 1, 2), help="Override the recorded QoS")
+    replay.add_argument("--topic-prefix", default="", help="Prepend to every replayed topic")
+    replay.add_argument("--no-retain", action="store_true", help="Clear recorded retain flags")
+    replay.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress lines")
+    replay.add_argument("--quiet", action="store_true", help="No progress output")
+    replay.set_defaults(handler=cmd_replay)
+
+    probe = commands.add_parser("probe", help="Measure end-to-end latency, loss and reordering through a broker")
+    _add_broker_args(probe)
+    probe.add_argument("--rate", type=float, default=10.0, help="Probes per second (default: %(default)s)")
+    probe.add_argument("-q", "--qos", type=int, choices=(0, 1, 2), default=0)
+    probe.add_argument("--size", type=int, default=0, help="Pad probe payloads to at least N bytes")
+    probe.add_argument("--loss-timeout", type=float, default=5.0,
+                       help="Seconds before an unanswered probe counts as lost (default: %(default)s)")
+    probe.add_argument("-d", "--duration", type=float, default=0, help="Stop after N seconds (default: until Ctrl-C)")
+    probe.add_argument("--max-p99", type=float, metavar="MS", help="Exit 1 if p99 latency exceeds MS milliseconds")
+    probe.add_argument("--max-loss", type=float, metavar="PCT", help="Exit 1 if more than PCT%% of probes are lost")
+    probe.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress lines")
+    probe.add_argument("--quiet", action="store_true", help="No progress output")
+    probe.set_defaults(handler=cmd_probe)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    if getattr(args, "topic", None) is None and args.command == "sub":
+        args.topic = ["#"]
+    return args.handler(args)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
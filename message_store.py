@@ -0,0 +1,558 @@
+"""
+Message stores used by the background MQTT subscriber.
+A store owns the retained messages plus the counters needed to size its
+memory budget. Every stored message gets a monotonically increasing
+sequence number so readers can pull incrementally with a cursor.
+
+Stores are single-writer / multi-reader: the paho network thread is the
+only writer, and readers never take the writer's lock, so a Streamlit
+rerun can never stall ingest.
+"""
+
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Protocol
+
+from topic_index import TopicIndex
+
+DEFAULT_MAX_MESSAGES = 50_000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class MQTTMessage:
+    """A received message, kept compact for large buffers.
+
+    The payload stays as raw bytes and the receive time as a float epoch;
+    ``payload`` and ``timestamp`` decode/format on access, so messages that
+    are never displayed never pay for it.
+    """
+
+    __slots__ = ("topic", "raw", "ts", "_flags", "seq")
+
+    def __init__(
+        self,
+        topic: str,
+        raw: bytes,
+        qos: int = 0,
+        retain: bool = False,
+        ts: float | None = None,
+        seq: int = 0,
+    ):
+        self.topic = topic
+        self.raw = raw
+        self.ts = time.time() if ts is None else ts
+        self._flags = qos | (4 if retain else 0)
+        self.seq = seq
+
+    @property
+    def qos(self) -> int:
+        return self._flags & 3
+
+    @property
+    def retain(self) -> bool:
+        return bool(self._flags & 4)
+
+    @property
+    def size(self) -> int:
+        return len(self.raw)
+
+    @property
+    def payload(self) -> str:
+        return self.raw.decode("utf-8", errors="replace")
+
+    @property
+    def timestamp(self) -> str:
+        return datetime.fromtimestamp(self.ts).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+    def __repr__(self) -> str:
+        return (f"MQTTMessage(topic={self.topic!r}, size={self.size}, qos={self.qos}, "
+                f"retain={self.retain}, ts={self.ts}, seq={self.seq})")
+
+
+@dataclass
+class StoreStats:
+    retained: int
+    total_seen: int
+    evicted: int
+    retained_bytes: int
+    max_messages: int
+    max_bytes: int
+
+
+class MessageStore(Protocol):
+    """Interface every subscriber message store implements."""
+
+    def append(self, message: Any, nbytes: int) -> None: ...
+
+    def ingest(self, topic: str, payload: bytes, qos: int, retain: bool, ts: float) -> int: ...
+
+    def since(self, after_seq: int, limit: int | None = None) -> list[Any]: ...
+
+    def tail(self, n: int) -> list[Any]: ...
+
+    def get(self, seq: int) -> Any | None: ...
+
+    def snapshot(self) -> list[Any]: ...
+
+    def set_limits(self, max_messages: int, max_bytes: int) -> None: ...
+
+    def clear(self) -> None: ...
+
+    def stats(self) -> StoreStats: ...
+
+    @property
+    def index(self) -> TopicIndex | None: ...
+
+    @property
+    def latest_seq(self) -> int: ...
+
+    def __len__(self) -> int: ...
+
+
+class RingBufferStore:
+    """Bounded FIFO store capped by message count and total payload bytes.
+
+    Messages live in a fixed array of ``(seq, message)`` slots indexed by
+    ``seq % capacity``. The writer publishes a message by advancing
+    ``_head`` after filling its slot; readers snapshot ``_head``/``_tail``
+    and validate each slot's seq so an entry overwritten mid-read is simply
+    skipped. With ``stamp_seq`` (the default) the seq is also written to
+    ``message.seq``; secondary stores sharing message objects turn it off.
+
+    An optional :class:`TopicIndex` is kept in step with appends and
+    evictions so topic-filtered reads never scan the whole buffer.
+
+    When either cap is exceeded the oldest messages are dropped and counted
+    as evicted. A single message larger than ``max_bytes`` is still kept so
+    the newest message is always visible.
+    """
+
+    def __init__(self, max_messages: int = DEFAULT_MAX_MESSAGES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 stamp_seq: bool = True, index: TopicIndex | None = None):
+        if max_messages < 1:
+            raise ValueError("max_messages must be at least 1")
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+        self._write_lock = threading.Lock()
+        self._stamp_seq = stamp_seq
+        self._index = index
+        self._max_bytes = max_bytes
+        self._slots: list[tuple[int, Any] | None] = [None] * max_messages
+        self._sizes: list[int] = [0] * max_messages
+        self._head = 1  # seq the next message will get
+        self._tail = 1  # oldest retained seq
+        self._bytes = 0
+        self._total_seen = 0
+        self._evicted = 0
+
+    @property
+    def max_messages(self) -> int:
+        return len(self._slots)
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def index(self) -> TopicIndex | None:
+        return self._index
+
+    @property
+    def latest_seq(self) -> int:
+        """Sequence number of the newest message (0 before the first one)."""
+        return self._head - 1
+
+    def append(self, message: Any, nbytes: int):
+        with self._write_lock:
+            seq = self._head
+            cap = len(self._slots)
+            while self._tail < seq and (seq - self._tail >= cap or self._bytes + nbytes > self._max_bytes):
+                self._drop_oldest()
+            idx = seq % cap
+            if self._stamp_seq:
+                message.seq = seq
+            self._slots[idx] = (seq, message)
+            self._sizes[idx] = nbytes
+            if self._index is not None:
+                self._index.add(message.topic, seq)
+            self._bytes += nbytes
+            self._total_seen += 1
+            self._head = seq + 1
+
+    def ingest(self, topic: str, payload: bytes, qos: int, retain: bool, ts: float) -> int:
+        """Store a received message from its fields; returns its seq."""
+        self.append(MQTTMessage(topic, payload, qos, retain, ts), len(payload))
+        return self.latest_seq
+
+    def set_limits(self, max_messages: int, max_bytes: int):
+        """Change the caps, evicting immediately if the store is over budget."""
+        if max_messages < 1 or max_bytes < 1:
+            raise ValueError("limits must be at least 1")
+        with self._write_lock:
+            self._max_bytes = max_bytes
+            while self._head - self._tail > max_messages or (
+                self._bytes > max_bytes and self._head - self._tail > 1
+            ):
+                self._drop_oldest()
+            if max_messages != len(self._slots):
+                old_slots, old_sizes = self._slots, self._sizes
+                old_cap = len(old_slots)
+                slots: list[tuple[int, Any] | None] = [None] * max_messages
+                sizes = [0] * max_messages
+                for seq in range(self._tail, self._head):
+                    slots[seq % max_messages] = old_slots[seq % old_cap]
+                    sizes[seq % max_messages] = old_sizes[seq % old_cap]
+                self._slots, self._sizes = slots, sizes
+
+    def since(self, after_seq: int, limit: int | None = None) -> list[Any]:
+        """Messages with ``seq > after_seq``, oldest first, at most ``limit``."""
+        head = self._head
+        start = max(after_seq + 1, self._tail)
+        end = head if limit is None else min(head, start + limit)
+        return self._read(start, end)
+
+    def tail(self, n: int) -> list[Any]:
+        """The newest ``n`` messages, oldest first."""
+        head = self._head
+        return self._read(max(self._tail, head - n), head)
+
+    def get(self, seq: int) -> Any | None:
+        """The message with this seq, or None if it was evicted."""
+        slots = self._slots
+        entry = slots[seq % len(slots)]
+        if entry is not None and entry[0] == seq:
+            return entry[1]
+        return None
+
+    def snapshot(self) -> list[Any]:
+        return self._read(self._tail, self._head)
+
+    def clear(self):
+        with self._write_lock:
+            if self._index is not None:
+                self._index.clear()
+            self._tail = self._head
+            self._slots = [None] * len(self._slots)
+            self._sizes = [0] * len(self._sizes)
+            self._bytes = 0
+
+    def stats(self) -> StoreStats:
+        return StoreStats(
+            retained=len(self),
+            total_seen=self._total_seen,
+            evicted=self._evicted,
+            retained_bytes=self._bytes,
+            max_messages=len(self._slots),
+            max_bytes=self._max_bytes,
+        )
+
+    def __len__(self) -> int:
+        return self._head - self._tail
+
+    def _read(self, start: int, end: int) -> list[Any]:
+        slots = self._slots
+        cap = len(slots)
+        out = []
+        for seq in range(start, end):
+            entry = slots[seq % cap]
+            if entry is not None and entry[0] == seq:
+                out.append(entry[1])
+        return out
+
+    def _drop_oldest(self):
+        idx = self._tail % len(self._slots)
+        entry = self._slots[idx]
+        self._tail += 1
+        self._slots[idx] = None
+        if self._index is not None and entry is not None:
+            self._index.evict(entry[1].topic, entry[0])
+        self._bytes -= self._sizes[idx]
+        self._evicted += 1
+
+
+@dataclass
+class ColumnSlice:
+    """Column arrays for a run of consecutive messages, oldest first."""
+    first_seq: int
+    ts: array
+    flags: array       # qos | retain << 2
+    topic_ids: array
+    sizes: array
+    topics: list[str]  # topic id → topic name
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+
+class ColumnarStore:
+    """Array-backed message arena for high-rate ingest.
+
+    Per-message fields live in ``array`` columns indexed by
+    ``seq % capacity`` (timestamp, qos/retain flags, interned topic id,
+    payload offset and length, ~25 bytes per message) and payloads are
+    copied into one contiguous circular ``bytearray``. Ingest allocates no
+    per-message Python objects; :class:`MQTTMessage` views are built only
+    for the messages a reader asks for. Columns and arena start small and
+    grow by doubling up to the configured caps.
+
+    Readers are lock-free: they copy what they need, then re-check that
+    the seqs are still retained, discarding anything evicted mid-read.
+    Columns can be wrapped zero-copy by NumPy (``np.frombuffer``) for
+    vectorized analysis via :meth:`column_slice`.
+    """
+
+    _INITIAL_MESSAGES = 1024
+    _INITIAL_ARENA = 1024 * 1024
+
+    def __init__(self, max_messages: int = DEFAULT_MAX_MESSAGES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 index: TopicIndex | None = None):
+        if max_messages < 1:
+            raise ValueError("max_messages must be at least 1")
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+        self._write_lock = threading.Lock()
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._index = index
+        self._topic_ids: dict[str, int] = {}
+        self._topic_names: list[str] = []
+        self._oversized: dict[int, bytes] = {}  # payloads larger than the whole arena
+        self._head = 1
+        self._tail = 1
+        self._arena_start = 0  # arena offset of the oldest payload
+        self._arena_used = 0
+        self._bytes = 0
+        self._total_seen = 0
+        self._evicted = 0
+        self._cols = self._allocate(min(max_messages, self._INITIAL_MESSAGES), min(max_bytes, self._INITIAL_ARENA))
+
+    @property
+    def max_messages(self) -> int:
+        return self._max_messages
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def index(self) -> TopicIndex | None:
+        return self._index
+
+    @property
+    def latest_seq(self) -> int:
+        return self._head - 1
+
+    def append(self, message: Any, nbytes: int):
+        self.ingest(message.topic, message.raw, message.qos, message.retain, message.ts)
+
+    def ingest(self, topic: str, payload: bytes, qos: int, retain: bool, ts: float) -> int:
+        size = len(payload)
+        with self._write_lock:
+            seq = self._head
+            while self._head - self._tail >= self._max_messages:
+                self._drop_oldest()
+            if self._head - self._tail >= len(self._cols[0]):
+                self._relayout(min(self._max_messages, 2 * len(self._cols[0])), len(self._cols[5]))
+
+            if size > self._max_bytes:
+                while self._head > self._tail:
+                    self._drop_oldest()
+                offset = -1
+                self._oversized[seq] = bytes(payload)
+            else:
+                while self._head > self._tail and self._bytes + size > self._max_bytes:
+                    self._drop_oldest()
+                arena_cap = len(self._cols[5])
+                if self._arena_used + size > arena_cap:
+                    self._relayout(len(self._cols[0]),
+                                   min(self._max_bytes, max(2 * arena_cap, self._arena_used + size)))
+                    arena_cap = len(self._cols[5])
+                offset = (self._arena_start + self._arena_used) % arena_cap
+                arena = self._cols[5]
+                first = min(size, arena_cap - offset)
+                arena[offset:offset + first] = payload[:first]
+                if first < size:
+                    arena[:size - first] = payload[first:]
+                self._arena_used += size
+
+            topic_id = self._topic_ids.get(topic)
+            if topic_id is None:
+                topic_id = self._topic_ids[topic] = len(self._topic_names)
+                self._topic_names.append(topic)
+
+            ts_col, flags_col, tid_col, off_col, len_col, _arena = self._cols
+            i = seq % len(ts_col)
+            ts_col[i] = ts
+            flags_col[i] = qos | (4 if retain else 0)
+            tid_col[i] = topic_id
+            off_col[i] = offset
+            len_col[i] = size
+            self._bytes += size
+            self._total_seen += 1
+            if self._index is not None:
+                self._index.add(topic, seq)
+            self._head = seq + 1
+            return seq
+
+    def set_limits(self, max_messages: int, max_bytes: int):
+        if max_messages < 1 or max_bytes < 1:
+            raise ValueError("limits must be at least 1")
+        with self._write_lock:
+            self._max_messages = max_messages
+            self._max_bytes = max_bytes
+            while self._head - self._tail > max_messages or (
+                self._bytes > max_bytes and self._head - self._tail > 1
+            ):
+                self._drop_oldest()
+            retained = self._head - self._tail
+            self._relayout(max(min(max_messages, self._INITIAL_MESSAGES), retained),
+                           max(min(max_bytes, self._INITIAL_ARENA), self._arena_used))
+
+    def since(self, after_seq: int, limit: int | None = None) -> list[MQTTMessage]:
+        head = self._head
+        start = max(after_seq + 1, self._tail)
+        end = head if limit is None else min(head, start + limit)
+        return self._read(start, end)
+
+    def tail(self, n: int) -> list[MQTTMessage]:
+        head = self._head
+        return self._read(max(self._tail, head - n), head)
+
+    def get(self, seq: int) -> MQTTMessage | None:
+        found = self._read(seq, seq + 1) if self._tail <= seq < self._head else []
+        return found[0] if found else None
+
+    def snapshot(self) -> list[MQTTMessage]:
+        return self._read(self._tail, self._head)
+
+    def column_slice(self, after_seq: int = 0, limit: int | None = None) -> ColumnSlice:
+        """Copies of the metadata columns for messages after ``after_seq``."""
+        while True:
+            cols = self._cols
+            head = self._head
+            start = max(after_seq + 1, self._tail)
+            end = head if limit is None else min(head, start + limit)
+            ts_col, flags_col, tid_col, _off_col, len_col, _arena = cols
+            cap = len(ts_col)
+            out = [array(c.typecode) for c in (ts_col, flags_col, tid_col, len_col)]
+            if end > start:
+                a, b = start % cap, end % cap
+                for src, dst in zip((ts_col, flags_col, tid_col, len_col), out):
+                    if a < b:
+                        dst.extend(src[a:b])
+                    else:
+                        dst.extend(src[a:])
+                        dst.extend(src[:b])
+            if cols is self._cols:
+                # Drop any prefix that was evicted while copying
+                skip = max(0, self._tail - start)
+                if skip:
+                    out = [col[skip:] for col in out]
+                    start += skip
+                return ColumnSlice(start, out[0], out[1], out[2], out[3], list(self._topic_names))
+
+    def clear(self):
+        with self._write_lock:
+            if self._index is not None:
+                self._index.clear()
+            self._tail = self._head
+            self._arena_start = 0
+            self._arena_used = 0
+            self._bytes = 0
+            self._oversized = {}
+
+    def stats(self) -> StoreStats:
+        return StoreStats(
+            retained=len(self),
+            total_seen=self._total_seen,
+            evicted=self._evicted,
+            retained_bytes=self._bytes,
+            max_messages=self._max_messages,
+            max_bytes=self._max_bytes,
+        )
+
+    def __len__(self) -> int:
+        return self._head - self._tail
+
+    @staticmethod
+    def _allocate(messages: int, arena_bytes: int) -> tuple:
+        return (
+            array("d", bytes(8 * messages)),   # receive timestamp (epoch seconds)
+            array("B", bytes(messages)),       # qos | retain << 2
+            array("I", bytes(4 * messages)),   # topic id
+            array("q", bytes(8 * messages)),   # payload offset in the arena, -1 if oversized
+            array("I", bytes(4 * messages)),   # payload length
+            bytearray(arena_bytes),
+        )
+
+    def _read(self, start: int, end: int) -> list[MQTTMessage]:
+        while True:
+            cols = self._cols
+            ts_col, flags_col, tid_col, off_col, len_col, arena = cols
+            cap, arena_cap = len(ts_col), len(arena)
+            names = self._topic_names
+            oversized = self._oversized
+            rows = []
+            for seq in range(start, end):
+                i = seq % cap
+                offset, size = off_col[i], len_col[i]
+                if offset < 0:
+                    payload = oversized.get(seq)
+                    if payload is None:
+                        continue
+                elif offset + size <= arena_cap:
+                    payload = bytes(arena[offset:offset + size])
+                else:
+                    payload = bytes(arena[offset:]) + bytes(arena[:offset + size - arena_cap])
+                rows.append((seq, names[tid_col[i]], payload, flags_col[i], ts_col[i]))
+            if cols is self._cols:
+                break
+        # Anything evicted while we were copying may have been overwritten
+        tail = self._tail
+        return [MQTTMessage(topic, payload, flags & 3, bool(flags & 4), ts, seq)
+                for seq, topic, payload, flags, ts in rows if seq >= tail]
+
+    def _drop_oldest(self):
+        ts_col, _flags, tid_col, off_col, len_col, arena = self._cols
+        seq = self._tail
+        i = seq % len(ts_col)
+        size = len_col[i]
+        self._tail += 1
+        if off_col[i] < 0:
+            self._oversized.pop(seq, None)
+        else:
+            self._arena_used -= size
+            self._arena_start = (self._arena_start + size) % len(arena) if self._arena_used else 0
+        self._bytes -= size
+        self._evicted += 1
+        if self._index is not None:
+            self._index.evict(self._topic_names[tid_col[i]], seq)
+
+    def _relayout(self, messages: int, arena_bytes: int):
+        """Copy the retained messages into freshly sized columns, payloads packed from offset 0."""
+        old = self._cols
+        new = self._allocate(messages, arena_bytes)
+        old_cap, new_cap = len(old[0]), messages
+        old_arena, new_arena = old[5], new[5]
+        old_arena_cap = len(old_arena)
+        write = 0
+        for seq in range(self._tail, self._head):
+            i, j = seq % old_cap, seq % new_cap
+            for col in range(3):
+                new[col][j] = old[col][i]
+            offset, size = old[3][i], old[4][i]
+            new[4][j] = size
+            if offset < 0:
+                new[3][j] = -1
+                continue
+            new[3][j] = write
+            first = min(size, old_arena_cap - offset)
+            new_arena[write:write + first] = old_arena[offset:offset + first]
+            if first < size:
+                new_arena[write + first:write + size] = old_arena[:size - first]
+            write += size
+        self._arena_start = 0
+        self._cols = new
@@ -0,0 +1,185 @@
+"""
+Prometheus / OpenMetrics text endpoint for the subscriber and publishers.
+Serves ``/metrics`` from a small threaded HTTP server on its own port,
+separate from Streamlit's. Every value comes from counters the MQTT code
+already keeps up to date (filter counts, store and recorder statistics,
+live metrics totals, publish outcomes, lock wait times), so a scrape
+costs the same however many messages are buffered and never reads or
+locks the message store.
+
+Enabled in the app by setting ``MQTT_METRICS_PORT``; the ``mymqtt sub``
+command takes ``--metrics-port``.
+"""
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from latency_probe import get_probe
+from live_metrics import lock_stats
+from mqtt_client import MQTTSubscriber, get_publish_counts, get_publisher_pool, get_subscriber
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_METRICS_HOST = "0.0.0.0"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Family:
+    """One metric family: HELP/TYPE header plus samples, rendered in exposition format."""
+
+    def __init__(self, name: str, kind: str, help_text: str):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.samples: list[tuple[str, dict[str, str], float]] = []
+
+    def add(self, value: float, suffix: str = "", **labels: str):
+        self.samples.append((suffix, labels, value))
+        return self
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples:
+            label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+            label_text = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}{suffix}{label_text} {float(value)!r}")
+        return "\n".join(lines)
+
+
+def collect(subscriber: MQTTSubscriber) -> list[_Family]:
+    """Snapshot every exported metric from pre-aggregated counters."""
+    families = []
+
+    def family(name: str, kind: str, help_text: str) -> _Family:
+        f = _Family(name, kind, help_text)
+        families.append(f)
+        return f
+
+    sub = subscriber
+    family("mqtt_subscriber_active", "gauge", "1 while the subscriber is running (connected or reconnecting)").add(
+        int(sub.active))
+    family("mqtt_subscriber_connected", "gauge", "1 while the subscriber's broker connection is up").add(
+        int(sub.connected))
+    family("mqtt_subscriber_reconnects_total", "counter", "Reconnections after the first connect").add(
+        sub.reconnects)
+
+    received, received_bytes = sub.get_live_totals()
+    family("mqtt_subscriber_messages_received_total", "counter",
+           "Messages received since the subscriber started").add(received)
+    family("mqtt_subscriber_bytes_received_total", "counter",
+           "Payload bytes received since the subscriber started").add(received_bytes)
+
+    per_filter = family("mqtt_subscriber_filter_messages_total", "counter", "Messages matched per topic filter")
+    for topic_filter, count in sub.get_filter_counts().items():
+        per_filter.add(count, filter=topic_filter)
+
+    store = sub.get_store_stats()
+    family("mqtt_subscriber_buffer_messages", "gauge", "Messages held in the subscriber buffer").add(store.retained)
+    family("mqtt_subscriber_buffer_bytes", "gauge", "Payload bytes held in the subscriber buffer").add(
+        store.retained_bytes)
+    evicted = family("mqtt_subscriber_evicted_total", "counter",
+                     "Messages evicted from a bounded buffer; filter=\"\" is the main buffer")
+    evicted.add(store.evicted, filter="")
+    for topic_filter, buf_stats in sub.get_filter_buffer_stats().items():
+        evicted.add(buf_stats.evicted, filter=topic_filter)
+
+    pending = family("mqtt_recorder_pending", "gauge", "Messages queued for a background writer")
+    dropped = family("mqtt_recorder_dropped_total", "counter", "Messages a background writer dropped while behind")
+    for name, recorder_stats in sub.get_recorder_stats().items():
+        pending.add(recorder_stats.pending, recorder=name)
+        dropped.add(recorder_stats.dropped, recorder=name)
+
+    published = family("mqtt_publish_total", "counter",
+                       "Single-message publishes by QoS and result (success, failure, or sent without waiting)")
+    for (qos, result), count in sorted(get_publish_counts().items()):
+        published.add(count, qos=str(qos), result=result)
+    family("mqtt_publisher_pool_connections", "gauge", "Pooled publisher connections").add(len(get_publisher_pool()))
+
+    acquired = family("mqtt_lock_acquisitions_total", "counter", "Lock acquisitions")
+    contended = family("mqtt_lock_contended_total", "counter", "Lock acquisitions that had to wait")
+    waited = family("mqtt_lock_wait_seconds_total", "counter", "Time spent waiting for a lock")
+    for name, stats in sorted(lock_stats().items()):
+        acquired.add(stats.acquired, lock=name)
+        contended.add(stats.contended, lock=name)
+        waited.add(stats.wait_seconds, lock=name)
+
+    probe = get_probe()
+    if probe is not None:
+        ps = probe.stats()
+        latency = family("mqtt_probe_latency_seconds", "summary", "End-to-end publish to receive latency of probes")
+        for quantile, value_ms in (("0.5", ps.p50_ms), ("0.95", ps.p95_ms), ("0.99", ps.p99_ms),
+                                   ("0.999", ps.p999_ms)):
+            latency.add(value_ms / 1000, quantile=quantile)
+        latency.add(ps.mean_ms / 1000 * ps.received, suffix="_sum")
+        latency.add(ps.received, suffix="_count")
+        family("mqtt_probe_sent_total", "counter", "Latency probes sent").add(ps.sent)
+        family("mqtt_probe_lost_total", "counter", "Latency probes not received within the loss timeout").add(ps.lost)
+        family("mqtt_probe_reordered_total", "counter", "Latency probes received out of order").add(ps.reordered)
+    return families
+
+
+def render(subscriber: MQTTSubscriber) -> str:
+    return "\n".join(f.render() for f in collect(subscriber)) + "\n"
+
+
+class MetricsExporter:
+    """Serve :func:`render` for ``subscriber`` on ``http://host:port/metrics`` from a daemon thread."""
+
+    def __init__(self, subscriber: MQTTSubscriber, port: int, host: str = DEFAULT_METRICS_HOST):
+        self.subscriber = subscriber
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = render(exporter.subscriber).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                pass  # scrapes every few seconds would flood the app's log
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def start(self) -> "MetricsExporter":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# ---------------------------------------------------------------------------
+# Global singleton — one endpoint per process, survives Streamlit reruns
+# ---------------------------------------------------------------------------
+_exporter: MetricsExporter | None = None
+_exporter_lock = threading.Lock()
+
+
+def get_metrics_exporter() -> MetricsExporter | None:
+    """Start the exporter for the global subscriber on first call, or None unless MQTT_METRICS_PORT is set."""
+    global _exporter
+    port = os.environ.get("MQTT_METRICS_PORT")
+    if not port:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            host = os.environ.get("MQTT_METRICS_HOST", DEFAULT_METRICS_HOST)
+            _exporter = MetricsExporter(get_subscriber(), int(port), host).start()
+        return _exporter
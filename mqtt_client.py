@@ -4,31 +4,79 @@ Uses a global singleton pattern so the background subscriber persists
 across Streamlit reruns and page switches.
 """
 
+import os
 import paho.mqtt.client as mqtt
+import sys
 import threading
 import time
-from datetime import datetime
-from dataclasses import dataclass, field
+import uuid
+from typing import Any
 
+from history_store import HistoryStore
+from live_metrics import LiveMetrics, LiveStats, TimedLock
+from message_store import (
+    DEFAULT_MAX_BYTES, DEFAULT_MAX_MESSAGES, ColumnarStore, MessageStore, MQTTMessage, RingBufferStore, StoreStats,
+)
+from segment_log import DEFAULT_RETAIN_BYTES, DEFAULT_SEGMENT_BYTES, SegmentLog
+from topic_index import TopicIndex, topic_matches_pattern
+from topic_trie import TopicTrie, validate_filter
 
-@dataclass
-class MQTTMessage:
-    topic: str
-    payload: str
-    qos: int
-    retain: bool
-    timestamp: str
+DEFAULT_FILTER_BUFFER_MESSAGES = 5_000
+DEFAULT_FILTER_BUFFER_BYTES = 16 * 1024 * 1024
+POOLED_MAX_INFLIGHT = 1000
+
+# (qos, result) → publishes; result is "success", "failure" or "sent" (handed off without waiting)
+_publish_counts: dict[tuple[int, str], int] = {}
+_publish_counts_lock = threading.Lock()
+
+
+def _count_publish(qos: int, result: str):
+    with _publish_counts_lock:
+        _publish_counts[qos, result] = _publish_counts.get((qos, result), 0) + 1
+
+
+def get_publish_counts() -> dict[tuple[int, str], int]:
+    """Single-message publishes since startup by (qos, result); bulk publishing is not included."""
+    with _publish_counts_lock:
+        return dict(_publish_counts)
 
 
 class MQTTSubscriber:
-    """Persistent background MQTT subscriber with thread-safe message storage."""
+    """Persistent background MQTT subscriber with thread-safe message storage.
+
+    The paho network thread is the only writer to the store; readers use
+    sequence-number cursors and never block ingest.
+
+    Several topic filters can be active at once. Each incoming message is
+    matched against a topic trie to record which filters it belongs to;
+    filters can be added or removed without reconnecting and may keep
+    their own bounded buffer. The trie and buffer map are replaced, never
+    mutated, so the network thread always sees a consistent snapshot.
 
-    def __init__(self):
+    Recorders (e.g. an on-disk :class:`~segment_log.SegmentLog`) receive
+    every message as well; their ``append`` must not block.
+
+    An attached latency probe receives the messages on its own topic
+    instead of the store.
+
+    Throughput, per-topic rates and payload sizes are kept incrementally
+    by :class:`~live_metrics.LiveMetrics`, so :meth:`get_live_stats` never
+    touches the store.
+    """
+
+    def __init__(self, store: MessageStore | None = None):
         self._client: mqtt.Client | None = None
-        self._messages: list[MQTTMessage] = []
-        self._lock = threading.Lock()
+        self._store: MessageStore = store if store is not None else RingBufferStore(index=TopicIndex())
         self._active = False
-        self._topic = ""
+        self._trie = TopicTrie()
+        self._filter_counts: dict[str, int] = {}
+        self._filter_buffers: dict[str, RingBufferStore] = {}
+        self._filters_lock = TimedLock("subscriber_filters")
+        self._recorders: tuple = ()
+        self._metrics = LiveMetrics()
+        self._probe = None
+        self._connects = 0
+        self._reconnects = 0
         self._error: str | None = None
         self._broker_host = ""
         self._broker_port = 1883
@@ -37,9 +85,25 @@ class MQTTSubscriber:
     def active(self) -> bool:
         return self._active
 
+    @property
+    def connected(self) -> bool:
+        """True while the network connection is up (``active`` also covers reconnecting)."""
+        client = self._client
+        return client is not None and client.is_connected()
+
+    @property
+    def reconnects(self) -> int:
+        """Successful connections beyond the first one of each :meth:`start`, since startup."""
+        return self._reconnects
+
     @property
     def topic(self) -> str:
-        return self._topic
+        """All subscribed filters, comma separated."""
+        return ", ".join(self._trie)
+
+    @property
+    def topics(self) -> list[str]:
+        return list(self._trie)
 
     @property
     def error(self) -> str | None:
@@ -53,48 +117,235 @@ class MQTTSubscriber:
     def broker_port(self) -> int:
         return self._broker_port
 
+    @property
+    def latest_seq(self) -> int:
+        """Sequence number of the newest stored message (0 if none yet)."""
+        return self._store.latest_seq
+
     def get_messages(self) -> list[MQTTMessage]:
-        with self._lock:
-            return list(self._messages)
+        """Copy of every retained message. Prefer the cursor APIs in the UI."""
+        return self._store.snapshot()
+
+    def get_messages_since(self, seq: int, limit: int | None = None) -> list[MQTTMessage]:
+        """Messages newer than ``seq``, oldest first, at most ``limit`` of them."""
+        return self._store.since(seq, limit)
+
+    def get_message(self, seq: int) -> MQTTMessage | None:
+        """The stored message with this seq, or None once it has been evicted."""
+        return self._store.get(seq)
+
+    def tail(self, n: int) -> list[MQTTMessage]:
+        """The newest ``n`` messages, oldest first."""
+        return self._store.tail(n)
+
+    def find_messages(self, patterns: list[str], limit: int,
+                      topic_filter: str | None = None) -> tuple[list[MQTTMessage], int]:
+        """Newest ``limit`` messages whose topic matches every pattern, newest first.
+
+        A pattern is either an MQTT filter (``+``/``#``) or plain text matched
+        as a case-insensitive substring. ``topic_filter``, such as one of
+        :attr:`topics`, is always matched as an MQTT filter, so ``a/b`` means
+        exactly that topic. Also returns the total number of retained
+        matches. Uses the store's topic index when it has one.
+        """
+        index = self._store.index
+        if index is None:
+            trie = TopicTrie([topic_filter]) if topic_filter else None
+            matches = [m for m in reversed(self._store.snapshot())
+                       if (trie is None or trie.match(m.topic))
+                       and all(topic_matches_pattern(p, m.topic) for p in patterns)]
+            return matches[:limit], len(matches)
+        if topic_filter:
+            topics = set(index.match_filter(topic_filter))
+        else:
+            topics = set(index.match_topics(patterns[0]))
+            patterns = patterns[1:]
+        for p in patterns:
+            topics.intersection_update(index.match_topics(p))
+        topics = list(topics)
+        found = (self._store.get(seq) for seq in index.newest(topics, limit))
+        return [m for m in found if m is not None], index.count(topics)
 
     def get_message_count(self) -> int:
-        with self._lock:
-            return len(self._messages)
+        """Number of messages currently retained in the store.
+
+        This is only the retained count; evicted messages are not included.
+        Use :meth:`get_store_stats` for the total number of messages seen.
+        """
+        return len(self._store)
+
+    def get_live_stats(self, top: int = 10) -> LiveStats:
+        """Rates, sparkline history, the ``top`` busiest topics and payload sizes."""
+        stats = self._metrics.stats(top)
+        for rs in self.get_recorder_stats().values():
+            stats.queue_depth += rs.pending
+            stats.queue_dropped += rs.dropped
+        return stats
+
+    def get_live_totals(self) -> tuple[int, int]:
+        """Messages and payload bytes received since :meth:`start`, without building a snapshot."""
+        return self._metrics.totals()
+
+    def get_recorder_stats(self) -> dict[str, Any]:
+        """``stats()`` of each recorder that has one (capture log, history), by class name.
+
+        Those stats carry at least ``pending`` and ``dropped``.
+        """
+        return {type(r).__name__: r.stats() for r in self._recorders if hasattr(r, "stats")}
+
+    def get_filter_buffer_stats(self) -> dict[str, StoreStats]:
+        return {f: buf.stats() for f, buf in self._filter_buffers.items()}
+
+    def get_store_stats(self) -> StoreStats:
+        """Retained, total-seen and evicted counters for sizing the buffer."""
+        return self._store.stats()
+
+    def set_store_limits(self, max_messages: int, max_bytes: int):
+        """Resize the message buffer (count and payload-byte caps)."""
+        self._store.set_limits(max_messages, max_bytes)
 
     def clear_messages(self):
-        with self._lock:
-            self._messages.clear()
+        self._store.clear()
+        for buf in self._filter_buffers.values():
+            buf.clear()
+
+    def add_recorder(self, recorder):
+        """Also hand every message to ``recorder.append(topic, payload, qos, retain, ts, seq)``."""
+        with self._filters_lock:
+            self._recorders = self._recorders + (recorder,)
+
+    def remove_recorder(self, recorder):
+        with self._filters_lock:
+            self._recorders = tuple(r for r in self._recorders if r is not recorder)
+
+    def attach_probe(self, probe):
+        """Subscribe to ``probe.topic`` and hand its messages to ``probe.on_receive(topic, payload)``."""
+        self._probe = probe
+        self.add_topic(probe.topic)
+
+    def detach_probe(self, probe):
+        if self._probe is probe:
+            self._probe = None
+            self.remove_topic(probe.topic)
 
-    def start(self, broker_host: str, broker_port: int, topic: str):
-        """Start subscribing to a topic in the background."""
+    def get_filter_counts(self) -> dict[str, int]:
+        """Messages received per subscribed filter since it was added."""
+        return dict(self._filter_counts)
+
+    def is_filter_buffered(self, topic_filter: str) -> bool:
+        return topic_filter in self._filter_buffers
+
+    def get_filter_messages(self, topic_filter: str, n: int) -> list[MQTTMessage]:
+        """The newest ``n`` messages from a filter's own buffer, oldest first."""
+        buf = self._filter_buffers.get(topic_filter)
+        return buf.tail(n) if buf is not None else []
+
+    def add_topic(self, topic_filter: str, buffered: bool = False):
+        """Subscribe to another filter on the live connection."""
+        validate_filter(topic_filter)
+        with self._filters_lock:
+            if topic_filter not in self._trie:
+                trie = TopicTrie(self._trie)
+                trie.add(topic_filter)
+                self._filter_counts.setdefault(topic_filter, 0)
+                self._trie = trie
+                client = self._client
+                if client is not None and client.is_connected():
+                    client.subscribe(topic_filter)
+        self.set_filter_buffer(topic_filter, buffered)
+
+    def remove_topic(self, topic_filter: str):
+        """Unsubscribe from one filter without touching the others."""
+        with self._filters_lock:
+            if topic_filter not in self._trie:
+                return
+            trie = TopicTrie(self._trie)
+            trie.remove(topic_filter)
+            self._trie = trie
+            self._filter_counts.pop(topic_filter, None)
+            self._filter_buffers = {f: b for f, b in self._filter_buffers.items() if f != topic_filter}
+            client = self._client
+            if client is not None and client.is_connected():
+                client.unsubscribe(topic_filter)
+
+    def set_filter_buffer(self, topic_filter: str, enabled: bool):
+        """Give a filter its own bounded buffer (or drop it)."""
+        with self._filters_lock:
+            if enabled == (topic_filter in self._filter_buffers) or topic_filter not in self._trie:
+                return
+            buffers = dict(self._filter_buffers)
+            if enabled:
+                buffers[topic_filter] = RingBufferStore(
+                    DEFAULT_FILTER_BUFFER_MESSAGES, DEFAULT_FILTER_BUFFER_BYTES, stamp_seq=False,
+                )
+            else:
+                del buffers[topic_filter]
+            self._filter_buffers = buffers
+
+    def start(self, broker_host: str, broker_port: int, topic: str | list[str]):
+        """Start subscribing to one or more topic filters in the background."""
         self.stop()
 
+        filters = [topic] if isinstance(topic, str) else list(topic)
+        for f in filters:
+            validate_filter(f)
+        if self._probe is not None and self._probe.topic not in filters:
+            filters.append(self._probe.topic)
+
         self._broker_host = broker_host
         self._broker_port = broker_port
-        self._topic = topic
         self._error = None
+        with self._filters_lock:
+            self._trie = TopicTrie(filters)
+            self._filter_counts = {f: 0 for f in filters}
+            self._filter_buffers = {}
 
-        with self._lock:
-            self._messages.clear()
+        self._store.clear()
+        self._metrics.reset()
+        self._connects = 0
+        metrics = self._metrics
 
         def on_connect(_client, _userdata, _flags, reason_code, _properties=None):
             if reason_code == 0 or str(reason_code) == "Success":
-                _client.subscribe(topic)
+                # Re-subscribe everything on every (re)connect: clean sessions forget them
+                current = self.topics
+                if current:
+                    _client.subscribe([(f, 0) for f in current])
+                self._connects += 1
+                if self._connects > 1:
+                    self._reconnects += 1
                 self._active = True
             else:
                 self._error = f"Connect failed: {reason_code}"
                 self._active = False
 
         def on_message(_client, _userdata, msg, _properties=None, _reason_code=None):
-            m = MQTTMessage(
-                topic=msg.topic,
-                payload=msg.payload.decode("utf-8", errors="replace"),
-                qos=msg.qos,
-                retain=bool(msg.retain),
-                timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
-            )
-            with self._lock:
-                self._messages.append(m)
+            # Interned topics share one string across every message on that topic
+            topic = sys.intern(msg.topic)
+            probe = self._probe
+            if probe is not None and topic == probe.topic:
+                probe.on_receive(topic, msg.payload)
+                return
+            matched = self._trie.match_cached(topic)
+            payload = msg.payload
+            ts = time.time()
+            seq = self._store.ingest(topic, payload, msg.qos, msg.retain, ts)
+            metrics.record(topic, len(payload), ts)
+            for recorder in self._recorders:
+                recorder.append(topic, payload, msg.qos, msg.retain, ts, seq)
+            counts, buffers = self._filter_counts, self._filter_buffers
+            m = None
+            for f in matched:
+                try:
+                    counts[f] += 1
+                except KeyError:
+                    pass  # filter removed while the message was in flight
+                buf = buffers.get(f)
+                if buf is not None:
+                    # Only per-filter buffers hold message objects
+                    if m is None:
+                        m = MQTTMessage(topic, payload, msg.qos, msg.retain, ts, seq)
+                    buf.append(m, len(payload))
 
         def on_disconnect(_client, _userdata, _flags, reason_code, _properties=None):
             if self._active:
@@ -128,6 +379,144 @@ class MQTTSubscriber:
         self._active = False
 
 
+class PooledPublisher:
+    """Long-lived publisher connection that reconnects lazily on the next publish."""
+
+    def __init__(
+        self,
+        broker_host: str,
+        broker_port: int,
+        username: str | None = None,
+        password: str | None = None,
+        keepalive: int = 60,
+    ):
+        self._broker_host = broker_host
+        self._broker_port = broker_port
+        self._username = username
+        self._password = password
+        self._keepalive = keepalive
+        self._client: mqtt.Client | None = None
+        self._connected = threading.Event()
+        self._connect_lock = TimedLock("publisher_connect")
+        self.last_used = time.monotonic()
+
+    @property
+    def connected(self) -> bool:
+        return self._client is not None and self._client.is_connected()
+
+    def publish(self, topic: str, payload: str | bytes, qos: int = 0, retain: bool = False,
+                timeout: float = 10.0, wait: bool = True) -> mqtt.MQTTMessageInfo:
+        """Publish and wait until the broker has acknowledged it (per QoS).
+
+        With ``wait=False`` the message is handed to the network thread and
+        its ``MQTTMessageInfo`` returned at once, for callers that pace
+        sends themselves and collect acknowledgements later.
+        """
+        self.last_used = time.monotonic()
+        try:
+            info = self._ensure_connected(timeout).publish(topic, payload, qos=qos, retain=retain)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                # Connection dropped since the last publish; retry once on a fresh one
+                self.close()
+                info = self._ensure_connected(timeout).publish(topic, payload, qos=qos, retain=retain)
+            if wait:
+                info.wait_for_publish(timeout)
+                if not info.is_published():
+                    raise TimeoutError(f"Publish to {topic} not acknowledged within {timeout}s")
+        except Exception:
+            _count_publish(qos, "failure")
+            raise
+        _count_publish(qos, "success" if wait else "sent")
+        return info
+
+    def close(self):
+        with self._connect_lock:
+            self._close_locked()
+
+    def _ensure_connected(self, timeout: float) -> mqtt.Client:
+        with self._connect_lock:
+            client = self._client
+            if client is not None and client.is_connected():
+                return client
+            self._close_locked()
+
+            def on_connect(_client, _userdata, _flags, reason_code, _properties=None):
+                if reason_code == 0 or str(reason_code) == "Success":
+                    self._connected.set()
+
+            def on_disconnect(_client, _userdata, _flags, reason_code, _properties=None):
+                self._connected.clear()
+
+            client = mqtt.Client(
+                callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                client_id=f"ad-publisher-{uuid.uuid4().hex[:12]}",
+                clean_session=True,
+            )
+            if self._username:
+                client.username_pw_set(self._username, self._password)
+            # Room for pipelined callers (publish(wait=False)): once paho's in-flight window
+            # is full it queues QoS 1/2 messages while QoS 0 ones go straight out, reordering them
+            client.max_inflight_messages_set(POOLED_MAX_INFLIGHT)
+            client.on_connect = on_connect
+            client.on_disconnect = on_disconnect
+            client.connect(self._broker_host, self._broker_port, keepalive=self._keepalive)
+            client.loop_start()
+            self._client = client
+            if not self._connected.wait(timeout):
+                self._close_locked()
+                raise ConnectionError(f"No CONNACK from {self._broker_host}:{self._broker_port} within {timeout}s")
+            return client
+
+    def _close_locked(self):
+        client, self._client = self._client, None
+        self._connected.clear()
+        if client is not None:
+            try:
+                client.disconnect()
+                client.loop_stop()
+            except Exception:
+                pass
+
+
+class PublisherPool:
+    """Publisher connections keyed by (host, port, credentials), shared by all sessions."""
+
+    def __init__(self, keepalive: int = 60, idle_timeout: float = 600.0):
+        self._keepalive = keepalive
+        self._idle_timeout = idle_timeout
+        self._publishers: dict[tuple, PooledPublisher] = {}
+        self._lock = TimedLock("publisher_pool")
+
+    def get(self, broker_host: str, broker_port: int, username: str | None = None,
+            password: str | None = None) -> PooledPublisher:
+        key = (broker_host, broker_port, username, password)
+        with self._lock:
+            self._reap_idle()
+            pub = self._publishers.get(key)
+            if pub is None:
+                pub = PooledPublisher(broker_host, broker_port, username, password, keepalive=self._keepalive)
+                self._publishers[key] = pub
+            pub.last_used = time.monotonic()
+            return pub
+
+    def close_all(self):
+        with self._lock:
+            publishers = list(self._publishers.values())
+            self._publishers.clear()
+        for pub in publishers:
+            pub.close()
+
+    def __len__(self) -> int:
+        return len(self._publishers)
+
+    def _reap_idle(self):
+        cutoff = time.monotonic() - self._idle_timeout
+        for key, pub in list(self._publishers.items()):
+            if pub.last_used < cutoff:
+                del self._publishers[key]
+                pub.close()
+
+
 def publish_message(
     broker_host: str,
     broker_port: int,
@@ -135,19 +524,44 @@ def publish_message(
     payload: str,
     qos: int = 0,
     retain: bool = False,
+    username: str | None = None,
+    password: str | None = None,
+    pooled: bool = True,
+    timeout: float = 10.0,
 ):
-    """Publish a single MQTT message (blocking, short-lived client)."""
+    """Publish a single MQTT message (blocking until acknowledged).
+
+    Uses a pooled long-lived connection by default; ``pooled=False`` opens
+    a short-lived client for this one message. Raises TimeoutError if the
+    message is not acknowledged within ``timeout`` seconds.
+    """
+    if pooled:
+        get_publisher_pool().get(broker_host, broker_port, username, password).publish(
+            topic, payload, qos=qos, retain=retain, timeout=timeout,
+        )
+        return
+
     client = mqtt.Client(
         callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
         client_id=f"ad-publisher-{int(time.time() * 1000) % 100000}",
         clean_session=True,
     )
-    client.connect(broker_host, broker_port, keepalive=60)
-    client.loop_start()
-    info = client.publish(topic, payload, qos=qos, retain=retain)
-    info.wait_for_publish()
-    client.loop_stop()
-    client.disconnect()
+    if username:
+        client.username_pw_set(username, password)
+    try:
+        client.connect(broker_host, broker_port, keepalive=60)
+        client.loop_start()
+        info = client.publish(topic, payload, qos=qos, retain=retain)
+        info.wait_for_publish(timeout)
+        if not info.is_published():
+            raise TimeoutError(f"Publish to {topic} not acknowledged within {timeout}s")
+    except Exception:
+        _count_publish(qos, "failure")
+        raise
+    finally:
+        client.disconnect()
+        client.loop_stop()
+    _count_publish(qos, "success")
 
 
 def test_connection(broker_host: str, broker_port: int) -> tuple[bool, str]:
@@ -165,7 +579,7 @@ def test_connection(broker_host: str, broker_port: int) -> tuple[bool, str]:
 
 
 # ---------------------------------------------------------------------------
-# Global singleton — survives Streamlit reruns and page navigation
+# Global singletons — survive Streamlit reruns and page navigation
 # ---------------------------------------------------------------------------
 _subscriber_instance: MQTTSubscriber | None = None
 _subscriber_lock = threading.Lock()
@@ -176,5 +590,70 @@ def get_subscriber() -> MQTTSubscriber:
     global _subscriber_instance
     with _subscriber_lock:
         if _subscriber_instance is None:
-            _subscriber_instance = MQTTSubscriber()
+            # MQTT_STORE=objects keeps one MQTTMessage per message instead of the columnar arena
+            store_cls = RingBufferStore if os.environ.get("MQTT_STORE") == "objects" else ColumnarStore
+            store = store_cls(
+                max_messages=int(os.environ.get("MQTT_MAX_MESSAGES", DEFAULT_MAX_MESSAGES)),
+                max_bytes=int(os.environ.get("MQTT_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                index=TopicIndex(),
+            )
+            _subscriber_instance = MQTTSubscriber(store)
+            capture = get_capture_log()
+            if capture is not None:
+                _subscriber_instance.add_recorder(capture)
+            history = get_history_store()
+            if history is not None:
+                _subscriber_instance.add_recorder(history)
         return _subscriber_instance
+
+
+_capture_log: SegmentLog | None = None
+_capture_lock = threading.Lock()
+
+
+def get_capture_log() -> SegmentLog | None:
+    """Return the on-disk capture log, or None unless MQTT_CAPTURE_DIR is set."""
+    global _capture_log
+    directory = os.environ.get("MQTT_CAPTURE_DIR")
+    if not directory:
+        return None
+    with _capture_lock:
+        if _capture_log is None:
+            retain_hours = float(os.environ.get("MQTT_CAPTURE_RETAIN_HOURS", 0))
+            _capture_log = SegmentLog(
+                directory,
+                segment_bytes=int(os.environ.get("MQTT_CAPTURE_SEGMENT_BYTES", DEFAULT_SEGMENT_BYTES)),
+                retain_bytes=int(os.environ.get("MQTT_CAPTURE_RETAIN_BYTES", DEFAULT_RETAIN_BYTES)),
+                retain_seconds=retain_hours * 3600 or None,
+            )
+        return _capture_log
+
+
+_history_store: HistoryStore | None = None
+_history_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore | None:
+    """Return the SQLite message history, or None unless MQTT_HISTORY_DB is set."""
+    global _history_store
+    path = os.environ.get("MQTT_HISTORY_DB")
+    if not path:
+        return None
+    with _history_lock:
+        if _history_store is None:
+            retain_hours = float(os.environ.get("MQTT_HISTORY_RETAIN_HOURS", 0))
+            _history_store = HistoryStore(path, retain_seconds=retain_hours * 3600 or None)
+        return _history_store
+
+
+_publisher_pool: PublisherPool | None = None
+_publisher_pool_lock = threading.Lock()
+
+
+def get_publisher_pool() -> PublisherPool:
+    """Return the global publisher connection pool."""
+    global _publisher_pool
+    with _publisher_pool_lock:
+        if _publisher_pool is None:
+            _publisher_pool = PublisherPool()
+        return _publisher_pool
@@ -1,5 +1,7 @@
 import streamlit as st
-from branding import render_header, render_footer, render_stat_card, render_action_card, render_status_badge, render_message_card, CUSTOM_CSS
+from branding import render_header, render_footer, render_stat_card, render_action_card, render_status_badge, render_message_cards, CUSTOM_CSS
+from latency_probe import get_probe, start_probe, stop_probe
+from live_metrics import format_bytes
 from mqtt_client import get_subscriber, test_connection
 
 render_header("MQTT Topic Manager")
@@ -24,7 +26,8 @@ with st.sidebar:
     sub = get_subscriber()
     if sub.active:
         render_status_badge(True, sub.topic)
-        st.caption(f"{sub.get_message_count()} messages collected")
+        stats = sub.get_store_stats()
+        st.caption(f"{stats.retained} messages retained ({stats.total_seen} seen)")
     else:
         render_status_badge(False)
 
@@ -34,17 +37,101 @@ with st.sidebar:
 sub = get_subscriber()
 
 # Stat cards row
-c1, c2, c3, c4 = st.columns(4)
+stats = sub.get_store_stats()
+c1, c2, c3, c4, c5 = st.columns(5)
 with c1:
     status_text = "Active" if sub.active else "Inactive"
     render_stat_card(status_text, "Subscriber")
 with c2:
-    render_stat_card(str(sub.get_message_count()), "Messages")
+    render_stat_card(str(stats.retained), "Retained")
 with c3:
-    render_stat_card(sub.topic if sub.topic else "None", "Topic")
+    render_stat_card(str(stats.total_seen), "Total Seen")
 with c4:
+    render_stat_card(sub.topic if sub.topic else "None", "Topic")
+with c5:
     render_stat_card(f"{broker_host}:{int(broker_port)}", "Broker")
 
+if stats.evicted:
+    st.caption(
+        f"{stats.evicted} older messages evicted — buffer holds at most {stats.max_messages} messages "
+        f"/ {stats.max_bytes // (1024 * 1024)} MB of payload."
+    )
+
+# Live throughput — incremental counters kept by the subscriber, never a scan of the buffer
+live = sub.get_live_stats(top=10)
+st.markdown("### Live Throughput")
+l1, l2, l3, l4, l5 = st.columns(5)
+with l1:
+    render_stat_card(f"{live.msg_rates[1]:,.0f}", "Msgs / sec", live.msgs_history)
+with l2:
+    render_stat_card(f"{format_bytes(live.byte_rates[1])}/s", "Bytes / sec", live.bytes_history)
+with l3:
+    render_stat_card(f"{live.msg_rates[10]:,.1f} · {live.msg_rates[60]:,.1f}", "Avg msgs/sec 10 s · 60 s")
+with l4:
+    render_stat_card(format_bytes(live.mean_size), f"Mean payload (max {format_bytes(live.max_size)})")
+with l5:
+    render_stat_card(f"{live.queue_depth:,}", "Write queue depth")
+
+if live.total:
+    t_col, s_col = st.columns(2)
+    with t_col:
+        st.markdown(f"**Busiest topics** ({live.topic_count:,} seen)")
+        st.dataframe(
+            [{"Topic": t, "Msgs/sec": round(rate, 2), "Total": total} for t, rate, total in live.top_topics],
+            hide_index=True, use_container_width=True,
+        )
+    with s_col:
+        st.markdown("**Payload sizes**")
+        st.dataframe([{"Size": label, "Messages": count} for label, count in live.size_rows()],
+                     hide_index=True, use_container_width=True)
+if live.queue_dropped:
+    st.caption(f"{live.queue_dropped:,} messages dropped by the capture/history writers after their queues filled.")
+
+# End-to-end latency probe — publish → broker → this subscriber
+st.markdown("### End-to-End Latency")
+probe = get_probe()
+probing = probe is not None and probe.running
+p1, p2, p3 = st.columns([2, 2, 3])
+with p1:
+    probe_rate = st.number_input("Probes / sec", value=10.0, min_value=0.1, max_value=1000.0, step=1.0,
+                                 key="probe_rate", disabled=probing)
+with p2:
+    probe_qos = st.selectbox("Probe QoS", [0, 1, 2], key="probe_qos", disabled=probing)
+with p3:
+    st.write("")
+    st.write("")
+    if probing:
+        if st.button("⏹ Stop probe", use_container_width=True):
+            stop_probe()
+            st.rerun()
+    elif st.button("▶ Start probe", type="primary", use_container_width=True, disabled=not sub.active,
+                   help=None if sub.active else "Start the subscriber first; probes go through its broker"):
+        start_probe(sub, rate=probe_rate, qos=probe_qos)
+        st.rerun()
+
+if probe is not None:
+    ps = probe.stats()
+    q1, q2, q3, q4, q5 = st.columns(5)
+    with q1:
+        render_stat_card(f"{ps.p50_ms:.2f} ms", "p50", ps.recent_ms)
+    with q2:
+        render_stat_card(f"{ps.p95_ms:.2f} ms", "p95")
+    with q3:
+        render_stat_card(f"{ps.p99_ms:.2f} ms", "p99")
+    with q4:
+        render_stat_card(f"{ps.max_ms:.2f} ms", "Max")
+    with q5:
+        render_stat_card(f"{ps.loss_ratio:.2%}", f"Lost ({ps.lost:,}) · reordered {ps.reordered:,}")
+    st.caption(
+        f"{ps.received:,} of {ps.sent:,} probes received on `{probe.topic}` at QoS {probe.qos}, "
+        f"p99.9 {ps.p999_ms:.2f} ms, {ps.in_flight} in flight, {ps.duplicates} duplicates, {ps.late} late."
+    )
+    if ps.error:
+        st.error(f"Probe stopped: {ps.error}")
+
+if st.button("↻ Refresh"):
+    st.rerun()
+
 st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
 
 # Quick actions
@@ -75,12 +162,11 @@ st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
 # Recent messages preview
 st.markdown("### Recent Messages")
 
-messages = sub.get_messages()
+messages = sub.tail(5)
 if messages:
-    for m in reversed(messages[-5:]):
-        render_message_card(m.topic, m.payload, m.qos, m.retain, m.timestamp)
-    if len(messages) > 5:
-        st.caption(f"Showing last 5 of {len(messages)} messages. Open the Subscriber page for full view.")
+    render_message_cards(reversed(messages))
+    if stats.retained > 5:
+        st.caption(f"Showing last 5 of {stats.retained} messages. Open the Subscriber page for full view.")
 else:
     st.info("No messages yet. Start the subscriber from the Subscriber page, then publish something.")
 
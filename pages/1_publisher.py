@@ -1,7 +1,10 @@
 import streamlit as st
 import json
 from branding import render_header, render_footer, render_status_badge, CUSTOM_CSS
+from bulk_publish import FileItemSource, parallel_bulk_publish
+from fleet_sim import DEFAULT_TEMPLATES, FleetConfig, get_fleet, start_fleet, stop_fleet
 from mqtt_client import publish_message, get_subscriber, test_connection
+from scheduled_publish import get_scheduled_publisher, start_scheduled_publisher, stop_scheduled_publisher
 
 render_header("MQTT Publisher")
 
@@ -25,7 +28,8 @@ with st.sidebar:
     sub = get_subscriber()
     if sub.active:
         render_status_badge(True, sub.topic)
-        st.caption(f"{sub.get_message_count()} messages collected")
+        stats = sub.get_store_stats()
+        st.caption(f"{stats.retained} messages retained ({stats.total_seen} seen)")
     else:
         render_status_badge(False)
 
@@ -126,34 +130,199 @@ with st.expander("📦 Bulk Publish — Send multiple messages at once"):
         {"topic": "alerts/fire", "payload": "ALERT: smoke detected", "qos": 1, "retain": True},
     ], indent=2)
 
-    bulk_json = st.text_area("Messages (JSON array)", value=bulk_default, height=200, key="bulk_json")
+    bulk_source = st.radio("Source", ["JSON array", "Upload file (NDJSON / CSV)"], horizontal=True,
+                           key="bulk_source")
+    if bulk_source == "JSON array":
+        bulk_json = st.text_area("Messages (JSON array)", value=bulk_default, height=200, key="bulk_json")
+    else:
+        bulk_file = st.file_uploader(
+            "Messages file", type=["ndjson", "jsonl", "csv"], key="bulk_file",
+            help="NDJSON: one {\"topic\", \"payload\", \"qos\", \"retain\"} object per line. "
+                 "CSV: header row with topic,payload,qos,retain columns. Rows are streamed, not loaded at once.",
+        )
+
+    bw1, bw2, bw3 = st.columns(3)
+    with bw1:
+        bulk_window = st.number_input("In-flight window", value=100, min_value=1, max_value=10000, key="bulk_window",
+                                      help="Maximum number of QoS 1/2 messages awaiting acknowledgement per connection")
+    with bw2:
+        bulk_connections = st.number_input("Connections", value=1, min_value=1, max_value=32, key="bulk_connections",
+                                           help="Shard messages by topic across this many connections; "
+                                                "per-topic order is preserved")
+    with bw3:
+        bulk_processes = st.checkbox("Use processes", value=False, key="bulk_processes",
+                                     help="Run each connection in its own process instead of a thread")
 
     if st.button("🚀 Bulk Publish", type="primary", use_container_width=True):
-        try:
-            items = json.loads(bulk_json)
-            if not isinstance(items, list):
-                st.error("Payload must be a JSON array.")
+        progress = st.progress(0, text="Publishing…")
+
+        if bulk_source == "JSON array":
+            try:
+                items = json.loads(bulk_json)
+                if not isinstance(items, list):
+                    st.error("Payload must be a JSON array.")
+                    st.stop()
+            except json.JSONDecodeError as e:
+                st.error(f"Invalid JSON: {e}")
                 st.stop()
-        except json.JSONDecodeError as e:
-            st.error(f"Invalid JSON: {e}")
+
+            def on_progress(acked: int, total: int | None):
+                progress.progress(acked / total if total else 1.0, text=f"Acknowledged {acked}/{total}")
+        else:
+            if bulk_file is None:
+                st.warning("Choose a file to publish.")
+                st.stop()
+            file_size = bulk_file.size or 1
+            items = FileItemSource(bulk_file, "csv" if bulk_file.name.lower().endswith(".csv") else "ndjson")
+
+            def on_progress(acked: int, _total: int | None):
+                progress.progress(
+                    min(items.bytes_read / file_size, 1.0),
+                    text=f"Acknowledged {acked:,} · {items.rows:,} rows read · {items.invalid:,} invalid "
+                         f"· {items.bytes_read / (1024 * 1024):.1f}/{file_size / (1024 * 1024):.1f} MB",
+                )
+
+        try:
+            result = parallel_bulk_publish(broker_host, int(broker_port), items,
+                                           connections=int(bulk_connections), use_processes=bulk_processes,
+                                           window=int(bulk_window), on_progress=on_progress)
+        except Exception as e:
+            st.error(f"Bulk publish failed: {e}")
             st.stop()
 
-        progress = st.progress(0, text="Publishing…")
-        success_count = 0
-        for idx, item in enumerate(items):
-            topic = item.get("topic", "")
-            payload = item.get("payload", "")
-            qos = item.get("qos", 0)
-            retain = item.get("retain", False)
-            if not topic:
-                continue
+        success_count = result.succeeded
+        for failure in result.failures[:20]:
+            st.error(f"Item {failure.index + 1} ({failure.topic}): {failure.error}")
+        if result.failed > 20:
+            st.caption(f"…and {result.failed - 20:,} more failures.")
+
+        st.success(f"Done — **{success_count}/{result.total}** messages published "
+                   f"in {result.elapsed:.2f}s ({result.msgs_per_sec:,.0f} msg/s).")
+
+# ---------------------------------------------------------------------------
+# Scheduled publish (collapsible)
+# ---------------------------------------------------------------------------
+with st.expander("⏱ Scheduled Publish — steady target rate for soak tests"):
+    scheduled = get_scheduled_publisher()
+    sched_running = scheduled is not None and scheduled.running
+    st.caption("Publishes on a background connection at a fixed rate, paced by a token bucket against an absolute "
+               "schedule, and keeps running across reruns and page switches. Placeholders: `{seq}` is the message "
+               "number, `{ts}` the send time, `{rand:LO:HI}` a random value.")
+
+    sched_topic = st.text_input("Topic", value="soak/test", key="sched_topic", disabled=sched_running)
+    sched_payload = st.text_area("Payload template", value='{"seq": {seq}, "ts": {ts}}', height=80,
+                                 key="sched_payload", disabled=sched_running)
+    sc1, sc2, sc3, sc4 = st.columns(4)
+    with sc1:
+        sched_rate = st.number_input("Target rate (msg/s)", value=500.0, min_value=0.1, step=100.0,
+                                     key="sched_rate", disabled=sched_running)
+    with sc2:
+        sched_burst = st.number_input("Burst (messages)", value=0, min_value=0, key="sched_burst",
+                                      disabled=sched_running,
+                                      help="Slots that can be caught up after a stall; older ones are skipped. "
+                                           "0 = 50 ms worth")
+    with sc3:
+        sched_duration = st.number_input("Duration (s)", value=0, min_value=0, key="sched_duration",
+                                         disabled=sched_running, help="0 = until stopped")
+    with sc4:
+        sched_qos = st.selectbox("QoS", options=[0, 1, 2], key="sched_qos", disabled=sched_running)
+
+    if sched_running:
+        if st.button("⏹ Stop schedule", use_container_width=True):
+            stop_scheduled_publisher()
+            st.rerun()
+    elif st.button("▶ Start schedule", type="primary", use_container_width=True):
+        if not sched_topic.strip():
+            st.warning("Topic cannot be empty.")
+        else:
             try:
-                publish_message(broker_host, int(broker_port), topic, str(payload), qos=qos, retain=retain)
-                success_count += 1
-            except Exception as e:
-                st.error(f"Item {idx + 1} ({topic}): {e}")
-            progress.progress((idx + 1) / len(items), text=f"Published {idx + 1}/{len(items)}")
+                start_scheduled_publisher(broker_host, int(broker_port), sched_topic, sched_payload,
+                                          float(sched_rate), qos=sched_qos, burst=sched_burst or None,
+                                          duration=float(sched_duration))
+                st.rerun()
+            except ValueError as e:
+                st.error(f"Invalid schedule: {e}")
+
+    if scheduled is not None:
+        sstats = scheduled.stats()
+        s1, s2, s3, s4 = st.columns(4)
+        achieved = sstats.recent_rate if sched_running else sstats.achieved_rate
+        s1.metric("Achieved rate", f"{achieved:,.1f} msg/s",
+                  delta=f"{achieved - sstats.target_rate:+,.1f} vs target", delta_color="off",
+                  help=f"Last second while running; {sstats.achieved_rate:,.1f} msg/s over the whole run")
+        s2.metric("Sent", f"{sstats.sent:,}", help=f"{sstats.acked:,} acknowledged, {sstats.failed:,} failed")
+        s3.metric("Jitter p50 / p99", f"{sstats.jitter_p50_ms:.2f} / {sstats.jitter_p99_ms:.2f} ms",
+                  help=f"Send time minus scheduled time; max {sstats.jitter_max_ms:.2f} ms")
+        s4.metric("Skipped slots", f"{sstats.skipped:,}",
+                  help="Schedule slots given up after falling more than the burst behind")
+        if sstats.error:
+            st.error(f"Scheduled publish stopped: {sstats.error}")
+        elif sstats.failed:
+            st.warning(f"{sstats.failed:,} sends failed (last: {sstats.last_failure}); the schedule kept going.")
+        if sched_running and st.button("↻ Refresh stats", use_container_width=True, key="sched_refresh"):
+            st.rerun()
+
+# ---------------------------------------------------------------------------
+# Device fleet simulator (collapsible)
+# ---------------------------------------------------------------------------
+# paho's select()-based loop cannot use descriptors above 1024, so fleets
+# run inside the app stay below that; larger ones belong in `mymqtt sim`
+MAX_UI_DEVICES = 900
+
+with st.expander("🛰 Device Fleet Simulator — emulate many ESP8266-style devices"):
+    fleet = get_fleet()
+    running = fleet is not None and fleet.running
+    st.caption("Every device has its own client id and connection, a retained online/offline status and a "
+               "command subscription, and publishes each template to `<prefix>/<client id>/<name>` on its own "
+               f"jittered schedule. All devices share one event loop. For more than {MAX_UI_DEVICES} devices "
+               "use `mymqtt sim` from a terminal.")
 
-        st.success(f"Done — **{success_count}/{len(items)}** messages published.")
+    fc1, fc2, fc3, fc4 = st.columns(4)
+    with fc1:
+        fleet_devices = st.number_input("Devices", value=100, min_value=1, max_value=MAX_UI_DEVICES,
+                                        key="fleet_devices", disabled=running)
+    with fc2:
+        fleet_interval = st.number_input("Interval (s)", value=5.0, min_value=0.05, step=0.5, key="fleet_interval",
+                                         disabled=running, help="Time between one device's publishes")
+    with fc3:
+        fleet_jitter = st.slider("Jitter", 0.0, 1.0, 0.1, 0.05, key="fleet_jitter", disabled=running,
+                                 help="Each interval varies by up to ± this fraction")
+    with fc4:
+        fleet_qos = st.selectbox("QoS", options=[0, 1], key="fleet_qos", disabled=running)
+    fleet_prefix = st.text_input("Topic prefix", value="sim", key="fleet_prefix", disabled=running)
+    fleet_templates = st.text_area(
+        "Payload templates (JSON object: subtopic → template)",
+        value=json.dumps(DEFAULT_TEMPLATES, indent=2), height=120, key="fleet_templates", disabled=running,
+        help="Placeholders: {device}, {n}, {seq}, {ts}, {rand:LO:HI}, {randint:LO:HI}, {choice:A|B|C}",
+    )
+
+    if running:
+        if st.button("⏹ Stop fleet", use_container_width=True):
+            stop_fleet()
+            st.rerun()
+    elif st.button("▶ Start fleet", type="primary", use_container_width=True):
+        try:
+            templates = json.loads(fleet_templates)
+            if not isinstance(templates, dict) or not all(isinstance(v, str) for v in templates.values()):
+                raise ValueError("Templates must be a JSON object of strings.")
+            config = FleetConfig(devices=int(fleet_devices), interval=float(fleet_interval), jitter=fleet_jitter,
+                                 qos=fleet_qos, topic_prefix=fleet_prefix, templates=templates)
+            start_fleet(broker_host, int(broker_port), config)
+            st.rerun()
+        except (json.JSONDecodeError, ValueError) as e:
+            st.error(f"Invalid fleet settings: {e}")
+
+    if fleet is not None:
+        stats = fleet.stats()
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Connected", f"{stats.connected}/{stats.devices}")
+        m2.metric("Published", f"{stats.published:,}")
+        m3.metric("Rate", f"{stats.msgs_per_sec:,.0f} msg/s",
+                  help=f"Nominal {fleet.config.msgs_per_sec:,.0f} msg/s once every device is connected")
+        m4.metric("Errors", stats.errors)
+        if stats.last_error:
+            st.caption(f"Last error: {stats.last_error}")
+        if running and st.button("↻ Refresh stats", use_container_width=True):
+            st.rerun()
 
 render_footer()
@@ -1,10 +1,29 @@
+import os
 import streamlit as st
+import tempfile
 import time
+from collections import deque
+from datetime import datetime, timedelta
 from branding import (
     render_header, render_footer, render_status_badge,
-    render_message_card, CUSTOM_CSS,
+    render_message_cards, message_card_html,
 )
-from mqtt_client import get_subscriber, test_connection
+from export import (
+    FORMATS, HAS_PYARROW, export_messages, filter_messages, format_from_name, iter_segment_log, iter_since,
+    read_export, topic_predicate,
+)
+from live_metrics import format_bytes
+from mqtt_client import (
+    DEFAULT_FILTER_BUFFER_MESSAGES, get_capture_log, get_history_store, get_subscriber, test_connection,
+)
+from payload_view import (
+    BINARY, HEX_PAGE_BYTES, JSON, JSON_PARSE_BYTES, KIND_LABELS, TEXT_PAGE_BYTES, hex_dump, page_count, preview,
+    sniff, text_page,
+)
+from replay import get_replayer, start_replay, stop_replay
+
+EXPORT_DIR = os.environ.get("MQTT_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "mqtt-exports"))
+LIVE_INTERVALS = [0.5, 1.0, 2.0, 5.0, 10.0]
 
 render_header("MQTT Subscriber")
 
@@ -12,7 +31,6 @@ render_header("MQTT Subscriber")
 # Sidebar — Broker settings
 # ---------------------------------------------------------------------------
 with st.sidebar:
-    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
     st.markdown("### Broker Settings")
     broker_host = st.text_input("Broker Host", value="test.mosquitto.org", key="broker_host")
     broker_port = st.number_input("Broker Port", value=1883, min_value=1, max_value=65535, key="broker_port")
@@ -26,11 +44,24 @@ with st.sidebar:
 
     st.divider()
     sub = get_subscriber()
-    if sub.active:
-        render_status_badge(True, sub.topic)
-        st.caption(f"{sub.get_message_count()} messages collected")
-    else:
-        render_status_badge(False)
+    st.markdown("### Live Updates")
+    live = st.toggle("Live refresh", value=False, key="live_refresh", disabled=not sub.active,
+                     help="Refresh only the message list and counters; the rest of the page stays as it is")
+    live_interval = st.select_slider("Every (s)", LIVE_INTERVALS, value=2.0, key="live_interval",
+                                     disabled=not sub.active)
+    # Fragments below rerun on this interval on their own, without a full-page rerun
+    live_every = live_interval if live and sub.active else None
+
+    @st.fragment(run_every=live_every)
+    def sidebar_counters():
+        if sub.active:
+            render_status_badge(True, sub.topic)
+            stats = sub.get_store_stats()
+            st.caption(f"{stats.retained} messages retained ({stats.total_seen} seen)")
+        else:
+            render_status_badge(False)
+
+    sidebar_counters()
 
 # ---------------------------------------------------------------------------
 # Subscriber controls
@@ -46,7 +77,8 @@ with col_ctrl:
         "Topic",
         value=sub.topic if sub.topic else "test/#",
         key="sub_topic",
-        help="Supports MQTT wildcards: `+` (single level), `#` (multi level)",
+        help="Supports MQTT wildcards: `+` (single level), `#` (multi level). "
+             "Separate several filters with commas.",
         disabled=sub.active,
     )
 
@@ -66,30 +98,82 @@ with col_ctrl:
         )
 
     if start_clicked:
-        if not sub_topic.strip():
+        filters = [f.strip() for f in sub_topic.split(",") if f.strip()]
+        if not filters:
             st.warning("Topic cannot be empty.")
         else:
-            sub.start(broker_host, int(broker_port), sub_topic)
-            time.sleep(0.3)
-            st.rerun()
+            try:
+                sub.start(broker_host, int(broker_port), filters)
+                time.sleep(0.3)
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
 
     if stop_clicked:
         sub.stop()
         st.rerun()
 
-with col_status:
-    st.markdown("### Status")
+    if sub.active:
+        st.markdown("#### Subscriptions")
+        counts = sub.get_filter_counts()
+        for f in sub.topics:
+            fc1, fc2, fc3, fc4 = st.columns([3, 1, 1, 1], vertical_alignment="center")
+            with fc1:
+                st.markdown(f"`{f}`")
+            with fc2:
+                st.caption(f"{counts.get(f, 0)} msgs")
+            with fc3:
+                buffered = st.checkbox("Buffer", value=sub.is_filter_buffered(f), key=f"buf_{f}",
+                                       help="Keep a separate buffer of recent messages for this filter")
+                if buffered != sub.is_filter_buffered(f):
+                    sub.set_filter_buffer(f, buffered)
+            with fc4:
+                if st.button("✕", key=f"rm_{f}", help=f"Unsubscribe from {f}"):
+                    sub.remove_topic(f)
+                    st.rerun()
+
+        add1, add2 = st.columns([3, 1], vertical_alignment="bottom")
+        with add1:
+            new_filter = st.text_input("Add filter", value="", key="sub_add_filter", placeholder="e.g. sensors/+/temp")
+        with add2:
+            if st.button("➕ Add", use_container_width=True) and new_filter.strip():
+                try:
+                    sub.add_topic(new_filter.strip())
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+
+    with st.expander("Buffer limits"):
+        limits = sub.get_store_stats()
+        lim1, lim2 = st.columns(2)
+        with lim1:
+            max_messages = st.number_input("Max messages", value=limits.max_messages,
+                                           min_value=1, step=1000, key="buf_max_messages")
+        with lim2:
+            max_mb = st.number_input("Max payload (MB)", value=max(1, limits.max_bytes // (1024 * 1024)),
+                                     min_value=1, step=16, key="buf_max_mb")
+        if st.button("Apply limits", use_container_width=True):
+            sub.set_store_limits(int(max_messages), int(max_mb) * 1024 * 1024)
+            st.rerun()
+        st.caption("Oldest messages are dropped once either limit is reached.")
+
+
+@st.fragment(run_every=live_every)
+def status_counters():
     if sub.active:
         render_status_badge(True, sub.topic)
+        stats = sub.get_store_stats()
         st.markdown(
             f"""
             <div class="stat-card" style="margin-top:0.5rem;">
-                <div class="stat-value">{sub.get_message_count()}</div>
-                <div class="stat-label">Messages Received</div>
+                <div class="stat-value">{stats.retained} / {stats.total_seen}</div>
+                <div class="stat-label">Retained / Received</div>
             </div>
             """,
             unsafe_allow_html=True,
         )
+        if stats.evicted:
+            st.caption(f"{stats.evicted} evicted · {stats.retained_bytes / (1024 * 1024):.1f} MB buffered")
         st.caption(f"Broker: `{sub.broker_host}:{sub.broker_port}`")
     else:
         render_status_badge(False)
@@ -97,6 +181,11 @@ with col_status:
             st.error(sub.error)
         st.caption("Click **Start Listening** to begin collecting messages.")
 
+
+with col_status:
+    st.markdown("### Status")
+    status_counters()
+
 st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
 
 # ---------------------------------------------------------------------------
@@ -104,55 +193,426 @@ st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
 # ---------------------------------------------------------------------------
 st.markdown("### Messages")
 
-ctrl1, ctrl2, ctrl3 = st.columns([1, 1, 2])
+ctrl1, ctrl2, _ = st.columns([1, 1, 2])
 with ctrl1:
     if st.button("🔄 Refresh", use_container_width=True):
         st.rerun()
 with ctrl2:
     if st.button("🗑 Clear All", use_container_width=True):
         sub.clear_messages()
+        st.session_state.pop("live_cards", None)
         st.rerun()
-with ctrl3:
-    auto_refresh = False
-    if sub.active:
-        auto_refresh = st.checkbox("Auto-refresh every 2s", value=False, key="auto_refresh")
 
 # ---------------------------------------------------------------------------
 # Message display
 # ---------------------------------------------------------------------------
-messages = sub.get_messages()
-msg_count = len(messages)
-
-if msg_count > 0:
-    st.caption(f"**{msg_count}** message(s) — newest first")
-
-    # Filter option
-    filter_topic = st.text_input("Filter by topic (contains)", value="", key="msg_filter",
-                                  placeholder="e.g. sensors")
-
-    displayed = 0
-    for m in reversed(messages):
-        if filter_topic and filter_topic.lower() not in m.topic.lower():
-            continue
-        render_message_card(m.topic, m.payload, m.qos, m.retain, m.timestamp)
-        displayed += 1
-        if displayed >= 100:
-            st.caption(f"Showing first 100 of {msg_count} messages. Use filter to narrow down.")
-            break
-
-    if displayed == 0 and filter_topic:
-        st.info(f"No messages matching **{filter_topic}**")
-else:
-    if sub.active:
-        st.info("Listening… No messages received yet. Publish something to see it here.")
+MAX_DISPLAYED = 100
+TABLE_PAGE_SIZES = [500, 1000, 5000]
+# Payload bytes shown per table row; the inspector below the list shows the rest
+TABLE_PREVIEW_BYTES = 200
+# New messages a filtered card view scans per refresh before it falls back to a topic index lookup
+LIVE_MAX_SCAN = 20_000
+
+
+def subscription_filter(view_filter: str) -> str | None:
+    return view_filter if view_filter != "All subscriptions" else None
+
+
+def message_window(view_filter: str, filter_topic: str, offset: int, limit: int) -> tuple[list, int]:
+    """Messages ``offset .. offset + limit`` of the current view, newest first, and the view's size."""
+    msg_count = sub.get_message_count()
+    if view_filter != "All subscriptions" and sub.is_filter_buffered(view_filter):
+        # The filter's own buffer is small; a plain scan is fine here
+        text_match = topic_predicate(filter_topic)
+        matches = [m for m in reversed(sub.get_filter_messages(view_filter, DEFAULT_FILTER_BUFFER_MESSAGES))
+                   if text_match is None or text_match(m.topic)]
+        return matches[offset:offset + limit], len(matches)
+    topic_filter = subscription_filter(view_filter)
+    if topic_filter or filter_topic:
+        # Topic index lookup: cost follows the matched set, not the buffer size
+        matches, total = sub.find_messages([filter_topic] if filter_topic else [], offset + limit, topic_filter)
+        return matches[offset:], total
+    # Retained seqs are contiguous, so any window is a direct range read
+    latest = sub.latest_seq
+    after = max(latest - msg_count, latest - offset - limit)
+    return list(reversed(sub.get_messages_since(after, max(0, latest - offset - after)))), msg_count
+
+
+def message_table(messages: list) -> dict[str, list]:
+    kinds = [sniff(m.raw) for m in messages]
+    return {
+        "Time": [datetime.fromtimestamp(m.ts) for m in messages],
+        "Topic": [m.topic for m in messages],
+        "Payload": [preview(m.raw, kind, TABLE_PREVIEW_BYTES)[0] for m, kind in zip(messages, kinds)],
+        "Kind": [KIND_LABELS[kind] for kind in kinds],
+        "Size": [m.size for m in messages],
+        "QoS": [m.qos for m in messages],
+        "Retained": [m.retain for m in messages],
+    }
+
+
+def card_html(m) -> str:
+    return message_card_html(m.topic, m.raw, m.qos, m.retain, m.timestamp)
+
+
+def live_cards(view_filter: str, filter_topic: str) -> tuple[list[tuple[int, str]], int]:
+    """``(seq, card HTML)`` for the newest MAX_DISPLAYED messages of the view, newest first, and the view's size.
+
+    The cards shown last time are kept in session state with the seq they
+    were read up to, so a refresh reads and formats only the messages that
+    arrived since; its cost follows the arrival rate, not the buffer size.
+    """
+    latest = sub.latest_seq
+    msg_count = sub.get_message_count()
+    topic_filter = subscription_filter(view_filter)
+    filtered = bool(topic_filter or filter_topic)
+    view = (view_filter, filter_topic)
+    state = st.session_state.get("live_cards")
+    if (state is None or state["view"] != view or latest < state["cursor"]
+            or (topic_filter and sub.is_filter_buffered(topic_filter))
+            or (filtered and latest - state["cursor"] > LIVE_MAX_SCAN)):
+        messages, total = message_window(view_filter, filter_topic, 0, MAX_DISPLAYED)
+        cards = deque(((m.seq, card_html(m)) for m in reversed(messages)), maxlen=MAX_DISPLAYED)
+    else:
+        cards = state["cards"]
+        # Unfiltered, only the newest MAX_DISPLAYED of the new messages can be shown
+        start = state["cursor"] if filtered else max(state["cursor"], latest - MAX_DISPLAYED)
+        # Built once per refresh and cached per topic, not matched from scratch per message
+        matches = topic_predicate(filter_topic, topic_filter)
+        for m in sub.get_messages_since(start, latest - start):
+            if matches is None or matches(m.topic):
+                cards.append((m.seq, card_html(m)))
+        # Drop cards whose messages were evicted or cleared since
+        oldest = latest - msg_count
+        while cards and cards[0][0] <= oldest:
+            cards.popleft()
+        total = sub.find_messages([filter_topic] if filter_topic else [], 0, topic_filter)[1] if filtered else msg_count
+    st.session_state["live_cards"] = {"view": view, "cursor": latest, "cards": cards}
+    return list(reversed(cards)), total
+
+
+def message_label(seq: int) -> str:
+    m = sub.get_message(seq)
+    return f"{m.timestamp} · {m.topic} · {format_bytes(m.size)}" if m is not None else f"#{seq} (evicted)"
+
+
+def inspect_payload(seqs: list[int]):
+    """Full payload of one listed message, one page of text or hex at a time."""
+    seq = st.selectbox("Message", seqs, format_func=message_label, key="inspect_seq")
+    m = sub.get_message(seq) if seq is not None else None
+    if m is None:
+        st.caption("That message is no longer buffered.")
+        return
+    kind = sniff(m.raw)
+    page_bytes = HEX_PAGE_BYTES if kind == BINARY else TEXT_PAGE_BYTES
+    pages = page_count(m.size, page_bytes)
+    info1, info2 = st.columns([3, 1], vertical_alignment="bottom")
+    with info1:
+        page = 1
+        if pages > 1:
+            page = int(st.number_input(f"Page (of {pages:,}, {format_bytes(page_bytes)} each)", min_value=1,
+                                       max_value=pages, value=1, key=f"inspect_page_{seq}"))
+        st.caption(f"{KIND_LABELS[kind]} · {m.size:,} bytes · QoS {m.qos} · {m.topic}")
+    with info2:
+        ext = {JSON: "json", BINARY: "bin"}.get(kind, "txt")
+        # Deferred: the bytes are only read when the button is clicked
+        st.download_button("⬇ Download", data=lambda: m.raw, file_name=f"payload-{m.seq}.{ext}",
+                           use_container_width=True, key="inspect_download")
+    if kind == BINARY:
+        st.code(hex_dump(m.raw, (page - 1) * page_bytes, page_bytes), language=None)
+    elif kind == JSON and m.size <= JSON_PARSE_BYTES:
+        st.json(m.payload)
+    else:
+        st.code(text_page(m.raw, page - 1, page_bytes), language="json" if kind == JSON else None,
+                wrap_lines=True)
+
+
+@st.fragment(run_every=live_every)
+def message_pane():
+    msg_count = sub.get_message_count()
+    if msg_count > 0:
+        st.caption(f"**{msg_count}** message(s) — newest first")
+
+        # Filter options
+        view1, view2, view3 = st.columns([2, 4, 1])
+        with view1:
+            view_filter = st.selectbox("Subscription", ["All subscriptions"] + sub.topics, key="msg_view_filter")
+        with view2:
+            filter_topic = st.text_input("Filter by topic (contains or MQTT wildcard)", value="", key="msg_filter",
+                                         placeholder="e.g. sensors or sensors/+/temp").strip()
+        with view3:
+            view_mode = st.radio("View", ["Cards", "Table"], key="msg_view_mode", horizontal=True)
+
+        if view_mode == "Table":
+            # Paged, virtualized grid: the browser only draws the rows in view, and only one page is read
+            page1, page2 = st.columns([1, 3])
+            with page1:
+                page_size = st.selectbox("Rows per page", TABLE_PAGE_SIZES, index=1, key="msg_page_size")
+            _, match_count = message_window(view_filter, filter_topic, 0, 0)
+            pages = max(1, -(-match_count // page_size))
+            with page2:
+                page = st.number_input(f"Page (of {pages:,}, newest first)", min_value=1, max_value=pages, value=1,
+                                       key="msg_page")
+            rows, match_count = message_window(view_filter, filter_topic, (int(page) - 1) * page_size, page_size)
+            st.dataframe(
+                message_table(rows), hide_index=True, use_container_width=True, height=560,
+                column_config={"Time": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm:ss.SSS")},
+            )
+            displayed = len(rows)
+            seqs = [m.seq for m in rows]
+            if match_count > page_size:
+                st.caption(f"{match_count:,} matching messages across {pages:,} pages.")
+        else:
+            cards, match_count = live_cards(view_filter, filter_topic)
+            # One element for the whole window instead of one per card
+            if cards:
+                st.markdown("".join(html for _, html in cards), unsafe_allow_html=True)
+            displayed = len(cards)
+            seqs = [seq for seq, _ in cards]
+            if match_count > displayed:
+                st.caption(f"Showing newest {displayed} of {match_count} matching messages. "
+                           "Use filter to narrow down, or the Table view to page through all of them.")
+
+        if displayed == 0 and filter_topic:
+            st.info(f"No messages matching **{filter_topic}**")
+        # Off by default: the full payload is read and sent only while someone is looking at it
+        if displayed and st.toggle("🔍 Inspect a payload", key="inspect_on"):
+            inspect_payload(seqs)
     else:
-        st.info("Start the subscriber to begin collecting messages.")
+        if sub.active:
+            st.info("Listening… No messages received yet. Publish something to see it here.")
+        else:
+            st.info("Start the subscriber to begin collecting messages.")
+
+
+message_pane()
+
+# ---------------------------------------------------------------------------
+# Captured history (on-disk segment log)
+# ---------------------------------------------------------------------------
+capture = get_capture_log()
+if capture is not None:
+    st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
+    st.markdown("### Captured History")
+    HISTORY_PAGE_SIZE = 50
+    log_stats = capture.stats()
+    history_total = capture.count()
+    st.caption(
+        f"{history_total:,} messages on disk in {log_stats.segments} segment(s) · "
+        f"{log_stats.total_bytes / (1024 * 1024):.1f} MB · `{capture.directory}`"
+    )
+    if log_stats.dropped:
+        st.caption(f"⚠️ {log_stats.dropped:,} messages dropped (disk writer fell behind)")
+    if log_stats.error:
+        st.error(f"Capture write failed: {log_stats.error}")
+
+    if history_total:
+        pages = (history_total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+        page = st.number_input(f"Page (1 = newest, of {pages:,})", min_value=1, max_value=pages,
+                               value=1, step=1, key="history_page")
+        # Page through the memory-mapped segments; only this page is decoded
+        end = capture.first_index() + history_total - (int(page) - 1) * HISTORY_PAGE_SIZE
+        start = max(capture.first_index(), end - HISTORY_PAGE_SIZE)
+        render_message_cards(reversed(capture.read(start, end - start)))
 
 # ---------------------------------------------------------------------------
-# Auto-refresh
+# History query (SQLite)
 # ---------------------------------------------------------------------------
-if auto_refresh and sub.active:
-    time.sleep(2)
-    st.rerun()
+history = get_history_store()
+if history is not None:
+    st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
+    st.markdown("### History Query")
+    HISTORY_QUERY_LIMIT = 200
+    hist_stats = history.stats()
+    st.caption(f"{hist_stats.written:,} messages written to `{history.path}`"
+               + (f" · ⚠️ {hist_stats.dropped:,} dropped" if hist_stats.dropped else ""))
+    if hist_stats.error:
+        st.error(f"History write failed: {hist_stats.error}")
+
+    # Default to the last few minutes, with the end rounded up so "now" is included
+    default_end = (datetime.now() + timedelta(minutes=1)).replace(second=0, microsecond=0)
+    default_start = default_end - timedelta(minutes=5)
+    hq1, hq2, hq3, hq4 = st.columns([2, 1, 1, 1])
+    with hq1:
+        hist_filter = st.text_input("Topic filter", value="", key="hist_filter",
+                                    placeholder="e.g. sensors/+/temp (blank = all topics)").strip()
+    with hq2:
+        hist_date = st.date_input("Date", value=default_start.date(), key="hist_date")
+    with hq3:
+        hist_from = st.time_input("From", value=default_start.time(), key="hist_from", step=60)
+    with hq4:
+        hist_to = st.time_input("To", value=default_end.time(), key="hist_to", step=60)
+
+    if st.button("🔎 Query History", use_container_width=True):
+        start_dt = datetime.combine(hist_date, hist_from)
+        end_dt = datetime.combine(hist_date, hist_to)
+        if end_dt <= start_dt:
+            end_dt += timedelta(days=1)  # window crosses midnight
+        results, total = history.query(hist_filter or None, start_dt.timestamp(), end_dt.timestamp(),
+                                       limit=HISTORY_QUERY_LIMIT)
+        st.caption(f"**{total:,}** message(s) between {start_dt:%H:%M} and {end_dt:%H:%M} — newest first")
+        render_message_cards(results)
+        if total > len(results):
+            st.caption(f"Showing newest {len(results)} of {total:,}. Narrow the window or filter to see more.")
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+EXPORT_DOWNLOAD_LIMIT = 200 * 1024 * 1024  # larger files stay on disk only
+
+export_sources = {"Live buffer": "live"}
+if capture is not None:
+    export_sources["Captured history (disk)"] = "capture"
+if history is not None:
+    export_sources["History database"] = "history"
+
+with st.expander("⬇ Export messages"):
+    ex1, ex2 = st.columns(2)
+    with ex1:
+        export_source = st.radio("Source", list(export_sources), key="export_source", horizontal=True)
+    with ex2:
+        export_format = st.selectbox("Format", FORMATS, key="export_format",
+                                     help=None if HAS_PYARROW else "Install pyarrow to enable Parquet export")
+    export_filter = st.text_input("Topic filter", value=st.session_state.get("msg_filter", ""), key="export_filter",
+                                  placeholder="blank = all topics; contains or MQTT wildcard").strip()
+    export_range = st.checkbox("Limit to a time range", value=False, key="export_range")
+    export_start = export_end = None
+    if export_range:
+        default_end = (datetime.now() + timedelta(minutes=1)).replace(second=0, microsecond=0)
+        er1, er2, er3 = st.columns(3)
+        with er1:
+            export_date = st.date_input("Date", value=default_end.date(), key="export_date")
+        with er2:
+            export_from = st.time_input("From", value=(default_end - timedelta(hours=1)).time(),
+                                        key="export_from", step=60)
+        with er3:
+            export_to = st.time_input("To", value=default_end.time(), key="export_to", step=60)
+        start_dt = datetime.combine(export_date, export_from)
+        end_dt = datetime.combine(export_date, export_to)
+        if end_dt <= start_dt:
+            end_dt += timedelta(days=1)
+        export_start, export_end = start_dt.timestamp(), end_dt.timestamp()
+
+    if st.button("Export", use_container_width=True):
+        source = export_sources[export_source]
+        if source == "history":
+            # The database applies the filter and range through its indexes
+            messages = history.iter_query(export_filter or None, export_start, export_end)
+        else:
+            messages = iter_segment_log(capture) if source == "capture" else iter_since(sub.get_messages_since)
+            messages = filter_messages(messages, export_filter or None, export_start, export_end)
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        export_path = os.path.join(EXPORT_DIR, f"mqtt-export-{datetime.now():%Y%m%d-%H%M%S}.{export_format}")
+        progress = st.empty()
+        try:
+            with open(export_path, "wb") as f:
+                result = export_messages(messages, export_format, f,
+                                         on_progress=lambda n: progress.caption(f"{n:,} rows written…"))
+        except (OSError, RuntimeError, ValueError) as e:
+            st.error(f"Export failed: {e}")
+        else:
+            progress.caption(
+                f"**{result.rows:,}** rows · {result.bytes_written / (1024 * 1024):.1f} MB · "
+                f"{result.rows_per_sec:,.0f} rows/s · saved to `{export_path}`"
+            )
+            if result.bytes_written <= EXPORT_DOWNLOAD_LIMIT:
+                with open(export_path, "rb") as f:
+                    st.download_button("Download", f, file_name=os.path.basename(export_path),
+                                       use_container_width=True)
+            else:
+                st.caption("File is too large to download through the browser; copy it from the path above.")
+
+# ---------------------------------------------------------------------------
+# Replay (collapsible)
+# ---------------------------------------------------------------------------
+REPLAY_SPEEDS = [0.5, 1.0, 2.0, 5.0, 10.0, 25.0, 50.0, 100.0, 0.0]
+
+with st.expander("🔁 Replay captured traffic"):
+    replayer = get_replayer()
+    replaying = replayer is not None and replayer.running
+    st.caption("Re-publishes captured messages to a broker (e.g. staging) with their original spacing, scaled "
+               "by the speed, over a pooled connection. Timing error is the delay between when each message was "
+               "scheduled and when it was actually sent.")
+    replay_sources = dict(export_sources)
+    replay_sources["Exported file"] = "file"
+    rp1, rp2 = st.columns(2)
+    with rp1:
+        replay_source = st.radio("Source", list(replay_sources), key="replay_source", horizontal=True,
+                                 disabled=replaying)
+    with rp2:
+        replay_speed = st.select_slider("Speed", REPLAY_SPEEDS, value=1.0, key="replay_speed", disabled=replaying,
+                                        format_func=lambda s: f"{s:g}×" if s else "As fast as possible")
+    replay_file = None
+    if replay_sources[replay_source] == "file":
+        replay_file = st.file_uploader("Exported messages", type=["csv", "ndjson", "jsonl", "parquet"],
+                                       key="replay_file", disabled=replaying)
+    else:
+        replay_filter = st.text_input("Topic filter", value="", key="replay_filter", disabled=replaying,
+                                      placeholder="blank = all topics; contains or MQTT wildcard").strip()
+    rt1, rt2, rt3 = st.columns(3)
+    with rt1:
+        replay_host = st.text_input("Target host", value=broker_host, key="replay_host", disabled=replaying)
+    with rt2:
+        replay_port = st.number_input("Target port", value=int(broker_port), min_value=1, max_value=65535,
+                                      key="replay_port", disabled=replaying)
+    with rt3:
+        replay_prefix = st.text_input("Topic prefix", value="", key="replay_prefix", disabled=replaying,
+                                      help="Prepended to every topic, e.g. `replay/`")
+    ro1, ro2, ro3 = st.columns(3)
+    with ro1:
+        replay_qos = st.selectbox("QoS", ["As recorded", 0, 1, 2], key="replay_qos", disabled=replaying)
+    with ro2:
+        replay_max_gap = st.number_input("Max gap (s)", value=0.0, min_value=0.0, step=1.0, key="replay_max_gap",
+                                         disabled=replaying, help="Shorten idle stretches longer than this; 0 = keep")
+    with ro3:
+        replay_retain = st.checkbox("Keep retain flags", value=False, key="replay_retain", disabled=replaying,
+                                    help="Off: replayed messages never overwrite retained state on the target")
+
+    if replaying:
+        if st.button("⏹ Stop replay", use_container_width=True):
+            stop_replay()
+            st.rerun()
+    elif st.button("▶ Start replay", type="primary", use_container_width=True):
+        source = replay_sources[replay_source]
+        messages = None
+        if source == "file":
+            if replay_file is None:
+                st.warning("Choose an exported file to replay.")
+            else:
+                try:
+                    messages = read_export(replay_file, format_from_name(replay_file.name))
+                except ValueError as e:
+                    st.error(str(e))
+        elif source == "history":
+            messages = history.iter_query(replay_filter or None)
+        else:
+            # The live buffer keeps growing; stop at what was captured when the replay started
+            messages = (iter_segment_log(capture) if source == "capture"
+                        else iter_since(sub.get_messages_since, until=sub.latest_seq))
+            messages = filter_messages(messages, replay_filter or None)
+        if messages is not None:
+            start_replay(messages, replay_host, int(replay_port), speed=replay_speed,
+                         max_gap=replay_max_gap or None,
+                         qos=None if replay_qos == "As recorded" else replay_qos,
+                         topic_prefix=replay_prefix, retain=replay_retain)
+            st.rerun()
+
+    if replayer is not None:
+        rstats = replayer.stats()
+        r1, r2, r3, r4 = st.columns(4)
+        r1.metric("Sent", f"{rstats.sent:,}", help=f"{rstats.replayed_span:,.1f} s of original traffic")
+        r2.metric("Rate", f"{rstats.msgs_per_sec:,.0f} msg/s")
+        r3.metric("Timing error p50 / p99",
+                  f"{rstats.error_p50_ms:.2f} / {rstats.error_p99_ms:.2f} ms" if rstats.error_count else "—",
+                  help=f"Mean {rstats.error_mean_ms:.2f} ms, max {rstats.error_max_ms:.2f} ms")
+        r4.metric("Failed", f"{rstats.failed:,}")
+        if rstats.error:
+            st.error(f"Replay failed: {rstats.error}")
+        if rstats.done and rstats.error_count:
+            st.markdown("**Timing error histogram**")
+            st.dataframe([{"Timing error": label, "Messages": count} for label, count in rstats.histogram_rows()],
+                         hide_index=True, use_container_width=True)
+        if replaying and st.button("↻ Refresh stats", use_container_width=True, key="replay_refresh"):
+            st.rerun()
 
 render_footer()
@@ -0,0 +1,108 @@
+"""
+Size-aware payload display for message cards and the payload inspector.
+Only a bounded slice of a payload is ever sniffed, decoded or escaped:
+cards show the first PREVIEW_BYTES, and the inspector shows one page of
+text or hex at a time. A multi-megabyte camera frame or firmware chunk
+therefore costs the same to list as a small sensor reading, and never
+reaches the browser in one piece.
+"""
+
+import codecs
+import json
+
+# Bytes of a payload shown on a message card
+PREVIEW_BYTES = 512
+# Bytes of a binary payload shown as hex on a card
+HEX_PREVIEW_BYTES = 32
+# Bytes looked at to tell text from binary
+SNIFF_BYTES = 1024
+# Payloads up to this size are parsed to confirm JSON; larger ones are judged by their brackets
+JSON_PARSE_BYTES = 16 * 1024
+HEX_ROW_BYTES = 16
+HEX_PAGE_BYTES = 1024
+TEXT_PAGE_BYTES = 64 * 1024
+
+JSON = "json"
+TEXT = "text"
+BINARY = "binary"
+KIND_LABELS = {JSON: "JSON", TEXT: "Text", BINARY: "Binary"}
+
+# C0 controls other than tab, newline, form feed and carriage return, plus DEL
+_CONTROL_BYTES = bytes(b for b in range(32) if b not in (9, 10, 12, 13)) + b"\x7f"
+# Printable ASCII stays, everything else becomes "." in the hex dump's text column
+_DUMP_TABLE = bytes(b if 32 <= b < 127 else ord(".") for b in range(256))
+
+
+def sniff(raw: bytes) -> str:
+    """Classify a payload as :data:`JSON`, :data:`TEXT` or :data:`BINARY` from its first bytes.
+
+    Text means valid UTF-8 with few control characters. JSON means an
+    object or array that parses (up to JSON_PARSE_BYTES) or, for larger
+    payloads, that starts and ends with matching brackets.
+    """
+    head = raw[:SNIFF_BYTES]
+    if b"\0" in head:
+        return BINARY
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=len(raw) <= SNIFF_BYTES)
+    except UnicodeDecodeError:
+        return BINARY
+    if (len(head) - len(head.translate(None, _CONTROL_BYTES))) * 10 > len(head):
+        return BINARY
+    opening = head.lstrip()[:1]
+    if opening in (b"{", b"["):
+        if len(raw) <= JSON_PARSE_BYTES:
+            try:
+                json.loads(raw)
+                return JSON
+            except ValueError:
+                return TEXT
+        if raw[-64:].rstrip()[-1:] == (b"}" if opening == b"{" else b"]"):
+            return JSON
+    return TEXT
+
+
+def decode_prefix(raw: bytes, limit: int) -> str:
+    """The first ``limit`` bytes decoded as UTF-8, without a character cut in half at the end."""
+    return codecs.getincrementaldecoder("utf-8")("replace").decode(raw[:limit], final=len(raw) <= limit)
+
+
+def preview(raw: bytes, kind: str, limit: int = PREVIEW_BYTES) -> tuple[str, bool]:
+    """Short display text for a payload and whether it was truncated.
+
+    Text and JSON show their first ``limit`` bytes; binary payloads show
+    their first HEX_PREVIEW_BYTES as hex.
+    """
+    if kind == BINARY:
+        return raw[:HEX_PREVIEW_BYTES].hex(" "), len(raw) > HEX_PREVIEW_BYTES
+    return decode_prefix(raw, limit), len(raw) > limit
+
+
+def page_count(nbytes: int, page_bytes: int) -> int:
+    return max(1, -(-nbytes // page_bytes))
+
+
+def _char_start(raw: bytes, pos: int) -> int:
+    """``pos`` moved forward past UTF-8 continuation bytes, so a page starts on a character."""
+    end = min(len(raw), pos + 3)
+    while pos < end and raw[pos] & 0xC0 == 0x80:
+        pos += 1
+    return pos
+
+
+def text_page(raw: bytes, page: int, page_bytes: int = TEXT_PAGE_BYTES) -> str:
+    """Page ``page`` (from 0) of a text payload, split on character boundaries."""
+    start = _char_start(raw, page * page_bytes)
+    end = _char_start(raw, (page + 1) * page_bytes)
+    return raw[start:end].decode("utf-8", errors="replace")
+
+
+def hex_dump(raw: bytes, offset: int = 0, length: int = HEX_PAGE_BYTES) -> str:
+    """``hexdump -C`` style lines for ``length`` bytes of ``raw`` from ``offset``."""
+    lines = []
+    for pos in range(offset, min(len(raw), offset + length), HEX_ROW_BYTES):
+        row = raw[pos:pos + HEX_ROW_BYTES]
+        half = HEX_ROW_BYTES // 2
+        hex_part = f"{row[:half].hex(' ')}  {row[half:].hex(' ')}".rstrip()
+        lines.append(f"{pos:08x}  {hex_part:<{HEX_ROW_BYTES * 3}} |{row.translate(_DUMP_TABLE).decode('ascii')}|")
+    return "\n".join(lines)
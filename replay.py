@@ -0,0 +1,263 @@
+"""
+Replay of captured traffic against a broker.
+Messages from the live buffer, the capture log, the history database or
+an exported file are re-published through a pooled connection with their
+original inter-arrival timing, scaled by a speed multiplier, or as fast
+as possible. Send times follow an absolute schedule (first message time
+plus scaled offset) with a coarse sleep followed by a short spin, so
+lateness never accumulates; every send's timing error is recorded into
+fixed-size histograms, so memory and the cost of reading the stats do
+not grow with the length of the replay.
+"""
+
+import threading
+import time
+from collections import deque
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from latency_probe import LatencyHistogram
+from message_store import MQTTMessage
+from mqtt_client import POOLED_MAX_INFLIGHT, get_publisher_pool
+
+# Sleep until this close to a send time, then spin; time.sleep overshoots by ~0.1 ms
+SPIN_THRESHOLD = 0.001
+# Unacknowledged sends allowed before the replay waits for the oldest; within the
+# pooled connection's in-flight window, so paho never queues (and reorders) them
+MAX_OUTSTANDING = POOLED_MAX_INFLIGHT
+# Upper bounds (ms) of the timing-error histogram buckets; the last bucket is open-ended
+ERROR_BUCKETS_MS = (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 50.0, 100.0, 500.0)
+
+
+def sleep_until(deadline: float, stop: threading.Event | None = None) -> bool:
+    """Sleep until ``time.perf_counter()`` reaches ``deadline``.
+
+    Sleeps coarsely to within :data:`SPIN_THRESHOLD`, then spins (yielding
+    the GIL) for the rest. Returns False if ``stop`` was set meanwhile.
+    """
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return True
+        if remaining > SPIN_THRESHOLD:
+            if stop is not None:
+                if stop.wait(remaining - SPIN_THRESHOLD):
+                    return False
+            else:
+                time.sleep(remaining - SPIN_THRESHOLD)
+        else:
+            time.sleep(0)
+
+
+@dataclass
+class ReplayStats:
+    sent: int
+    failed: int
+    elapsed: float
+    replayed_span: float              # seconds of original traffic covered so far
+    speed: float | None               # None = as fast as possible
+    error_count: int = 0
+    error_mean_ms: float = 0.0
+    error_p50_ms: float = 0.0
+    error_p99_ms: float = 0.0
+    error_max_ms: float = 0.0
+    # Counts per ERROR_BUCKETS_MS bucket, plus one for everything above the last bound
+    histogram: list[int] = field(default_factory=list)
+    done: bool = False
+    error: str | None = None
+
+    @property
+    def msgs_per_sec(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def histogram_rows(self) -> list[tuple[str, int]]:
+        """``(label, count)`` per bucket, e.g. ``("0.5–1 ms", 120)``."""
+        rows = []
+        lower = 0.0
+        for upper, count in zip(ERROR_BUCKETS_MS, self.histogram):
+            rows.append((f"{lower:g}–{upper:g} ms", count))
+            lower = upper
+        if len(self.histogram) > len(ERROR_BUCKETS_MS):
+            rows.append((f"≥ {lower:g} ms", self.histogram[-1]))
+        return rows
+
+
+class Replayer:
+    """Re-publish ``messages`` (oldest first) to a broker.
+
+    ``speed`` scales the original timing (2.0 replays twice as fast); None
+    or 0 sends as fast as the connection allows. ``max_gap`` caps any
+    single inter-arrival gap, in original seconds, so idle stretches of a
+    capture do not stall the replay. ``qos`` overrides the recorded QoS,
+    ``topic_prefix`` is prepended to every topic and ``retain=False``
+    clears recorded retain flags.
+
+    :meth:`run` replays on the calling thread; :meth:`start` runs it in the
+    background, with progress available from :meth:`stats`.
+    """
+
+    def __init__(
+        self,
+        messages: Iterable[MQTTMessage],
+        broker_host: str,
+        broker_port: int,
+        speed: float | None = 1.0,
+        max_gap: float | None = None,
+        qos: int | None = None,
+        topic_prefix: str = "",
+        retain: bool = True,
+        username: str | None = None,
+        password: str | None = None,
+        timeout: float = 10.0,
+    ):
+        if speed is not None and speed < 0:
+            raise ValueError("speed must be positive, or 0 for as fast as possible")
+        self.messages = messages
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.speed = speed or None
+        self.max_gap = max_gap
+        self.qos = qos
+        self.topic_prefix = topic_prefix
+        self.retain = retain
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._errors = LatencyHistogram()  # seconds late, per send
+        self._histogram = [0] * (len(ERROR_BUCKETS_MS) + 1)
+        self._sent = 0
+        self._failed = 0
+        self._span = 0.0
+        self._started = 0.0
+        self._finished: float | None = None
+        self._error: str | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "Replayer":
+        self._thread = threading.Thread(target=self.run, name="replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self) -> ReplayStats:
+        """Replay everything (or until :meth:`stop`); returns the final stats."""
+        self._started = time.perf_counter()
+        try:
+            self._replay()
+        except Exception as e:
+            self._error = f"{type(e).__name__}: {e}"
+        finally:
+            self._finished = time.perf_counter()
+        return self.stats()
+
+    def stats(self) -> ReplayStats:
+        end = self._finished if self._finished is not None else time.perf_counter()
+        stats = ReplayStats(
+            sent=self._sent,
+            failed=self._failed,
+            elapsed=end - self._started if self._started else 0.0,
+            replayed_span=self._span,
+            speed=self.speed,
+            histogram=list(self._histogram),
+            done=self._finished is not None,
+            error=self._error,
+        )
+        errors = self._errors
+        if errors.count:
+            stats.error_count = errors.count
+            stats.error_mean_ms = errors.mean * 1000
+            stats.error_p50_ms = errors.percentile(0.50) * 1000
+            stats.error_p99_ms = errors.percentile(0.99) * 1000
+            stats.error_max_ms = errors.max / 1000
+        return stats
+
+    def _record_error(self, late: float):
+        self._errors.record(late)
+        late_ms = late * 1000
+        for i, upper in enumerate(ERROR_BUCKETS_MS):
+            if late_ms < upper:
+                self._histogram[i] += 1
+                return
+        self._histogram[-1] += 1
+
+    def _replay(self):
+        publisher = get_publisher_pool().get(self.broker_host, self.broker_port, self.username, self.password)
+        outstanding: deque = deque()
+        speed, max_gap = self.speed, self.max_gap
+        first_ts = prev_ts = None
+        offset = 0.0  # scheduled position in original seconds, after gap capping
+        start = time.perf_counter()
+        for m in self.messages:
+            if self._stopping.is_set():
+                break
+            if first_ts is None:
+                first_ts = prev_ts = m.ts
+            gap = max(0.0, m.ts - prev_ts)
+            offset += min(gap, max_gap) if max_gap is not None else gap
+            prev_ts = m.ts
+            if speed is not None:
+                due = start + offset / speed
+                if not sleep_until(due, self._stopping):
+                    break
+                self._record_error(time.perf_counter() - due)
+            try:
+                info = publisher.publish(self.topic_prefix + m.topic, m.raw,
+                                         qos=m.qos if self.qos is None else self.qos,
+                                         retain=m.retain and self.retain, timeout=self.timeout, wait=False)
+            except ValueError:
+                self._failed += 1  # e.g. a topic the prefix made invalid
+                continue
+            outstanding.append(info)
+            self._sent += 1
+            self._span = m.ts - first_ts
+            while outstanding and (len(outstanding) >= MAX_OUTSTANDING or outstanding[0].is_published()):
+                self._settle(outstanding.popleft())
+        for info in outstanding:
+            self._settle(info)
+
+    def _settle(self, info):
+        if info.is_published():
+            return
+        try:
+            info.wait_for_publish(self.timeout)
+        except (RuntimeError, ValueError):
+            pass  # dropped by paho: the connection went away with it queued
+        if not info.is_published():
+            self._failed += 1
+
+
+# ---------------------------------------------------------------------------
+# Global singleton — one background replay per app, survives Streamlit reruns
+# ---------------------------------------------------------------------------
+_replayer: Replayer | None = None
+_replayer_lock = threading.Lock()
+
+
+def get_replayer() -> Replayer | None:
+    """Return the running (or last) background replay, if one was started."""
+    return _replayer
+
+
+def start_replay(*args, **kwargs) -> Replayer:
+    """Stop any running replay and start a new :class:`Replayer` in the background."""
+    global _replayer
+    with _replayer_lock:
+        if _replayer is not None:
+            _replayer.stop()
+        _replayer = Replayer(*args, **kwargs).start()
+        return _replayer
+
+
+def stop_replay():
+    with _replayer_lock:
+        if _replayer is not None:
+            _replayer.stop()
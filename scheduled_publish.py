@@ -0,0 +1,287 @@
+"""
+Rate-controlled background publishing for soak tests.
+A :class:`TokenBucket` paces sends against an absolute schedule, so sleep
+overshoot never accumulates into drift: each message has a due time of
+``start + k / rate``, late wakeups send every slot that has come due, and
+a backlog beyond the burst allowance is dropped rather than replayed as a
+spike. :class:`ScheduledPublisher` runs that loop on its own thread and
+connection and reports achieved rate and scheduling jitter.
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import paho.mqtt.client as mqtt
+
+from fleet_sim import compile_template
+
+# (send time, jitter) samples kept for the rolling rate and jitter percentiles
+JITTER_SAMPLES = 10_000
+RATE_WINDOW = 1.0
+# Publish results that only mean the connection is down for now; paho reconnects on its own
+TRANSIENT_ERRORS = frozenset({mqtt.MQTT_ERR_NO_CONN, mqtt.MQTT_ERR_CONN_LOST, mqtt.MQTT_ERR_QUEUE_SIZE})
+# Consecutive non-transient failures (e.g. a rejected topic or payload) that end the run
+MAX_CONSECUTIVE_FAILURES = 100
+
+
+class TokenBucket:
+    """Token bucket in its "theoretical arrival time" form.
+
+    Tokens accrue at ``rate`` per second up to ``burst``; :meth:`wait`
+    blocks until the next token is available and returns its due time.
+    Tracking the due time of the next token instead of a token count keeps
+    the schedule exact over hours of running. When the caller falls more
+    than ``burst`` tokens behind, the missed tokens are forfeited and
+    counted in :attr:`skipped`.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.interval = 1.0 / rate
+        # Default: absorb 50 ms of stalls (at least one token) without losing slots
+        self.burst = burst if burst is not None else max(1.0, rate * 0.05)
+        self.skipped = 0
+        self._next_due = time.perf_counter()
+
+    def wait(self, sleep: Callable[[float], object] = time.sleep) -> float:
+        """Block until the next token is due; returns its due time (perf_counter clock).
+
+        ``sleep`` can be swapped for e.g. ``threading.Event.wait`` so a long
+        gap between tokens stays interruptible.
+        """
+        now = time.perf_counter()
+        due = self._next_due
+        if due > now:
+            sleep(due - now)
+        elif now - due > self.burst * self.interval:
+            # Too far behind: forfeit the backlog instead of bursting through it
+            missed = int((now - due) * self.rate - self.burst)
+            self.skipped += missed
+            due += missed * self.interval
+        self._next_due = due + self.interval
+        return due
+
+    def reset(self):
+        self._next_due = time.perf_counter()
+
+
+@dataclass
+class ScheduleStats:
+    target_rate: float
+    achieved_rate: float        # over the whole run
+    recent_rate: float          # over the last RATE_WINDOW seconds
+    sent: int
+    acked: int
+    skipped: int                # schedule slots forfeited after falling behind
+    failed: int                 # sends paho refused, e.g. while reconnecting
+    elapsed: float
+    jitter_p50_ms: float
+    jitter_p99_ms: float
+    jitter_max_ms: float
+    running: bool
+    error: str | None           # why the run stopped early
+    last_failure: str | None = None
+
+
+class ScheduledPublisher:
+    """Publish ``payload`` to ``topic`` at ``rate`` msg/s on a background thread.
+
+    ``payload`` is a :func:`~fleet_sim.compile_template` template; ``{seq}``
+    (message number) and ``{ts}`` (send time) are the useful placeholders
+    here. Stops after ``count`` messages or ``duration`` seconds when either
+    is non-zero, or on :meth:`stop`.
+
+    A failed send is counted and the schedule carries on, so a soak test
+    rides out a broker restart while paho reconnects. Only
+    MAX_CONSECUTIVE_FAILURES non-transient failures in a row end the run.
+    """
+
+    def __init__(
+        self,
+        broker_host: str,
+        broker_port: int,
+        topic: str,
+        payload: str,
+        rate: float,
+        qos: int = 0,
+        retain: bool = False,
+        burst: float | None = None,
+        count: int = 0,
+        duration: float = 0.0,
+        window: int = 1000,
+        username: str | None = None,
+        password: str | None = None,
+    ):
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.topic = topic
+        self.qos = qos
+        self.retain = retain
+        self.count = count
+        self.duration = duration
+        self.window = window
+        self.username = username
+        self.password = password
+        self._render = compile_template(payload)
+        self._bucket = TokenBucket(rate, burst)
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._samples: deque[tuple[float, float]] = deque(maxlen=JITTER_SAMPLES)
+        self._started = 0.0
+        self._finished: float | None = None
+        self._sent = 0
+        self._acked = 0
+        self._failed = 0
+        self._last_failure: str | None = None
+        self._error: str | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "ScheduledPublisher":
+        self._thread = threading.Thread(target=self._run, name="scheduled-publisher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> ScheduleStats:
+        end = self._finished if self._finished is not None else time.perf_counter()
+        elapsed = end - self._started if self._started else 0.0
+        samples = list(self._samples)
+        recent = [t for t, _ in samples if t >= end - RATE_WINDOW]
+        span = recent[-1] - recent[0] if len(recent) > 1 else 0.0
+        recent_rate = (len(recent) - 1) / span if span > 0 else 0.0
+        jitter = sorted(j for _, j in samples)
+
+        def pct(p: float) -> float:
+            return jitter[min(len(jitter) - 1, int(len(jitter) * p))] * 1000 if jitter else 0.0
+
+        return ScheduleStats(
+            target_rate=self._bucket.rate,
+            achieved_rate=self._sent / elapsed if elapsed > 0 else 0.0,
+            recent_rate=recent_rate,
+            sent=self._sent,
+            acked=self._acked,
+            skipped=self._bucket.skipped,
+            failed=self._failed,
+            elapsed=elapsed,
+            jitter_p50_ms=pct(0.50),
+            jitter_p99_ms=pct(0.99),
+            jitter_max_ms=jitter[-1] * 1000 if jitter else 0.0,
+            running=self.running,
+            error=self._error,
+            last_failure=self._last_failure,
+        )
+
+    def _on_publish(self, _client, _userdata, _mid, _reason_code=None, _properties=None):
+        self._acked += 1
+
+    def _run(self):
+        connected = threading.Event()
+
+        def on_connect(_client, _userdata, _flags, reason_code, _properties=None):
+            if reason_code == 0 or str(reason_code) == "Success":
+                connected.set()
+            else:
+                self._error = f"Connect failed: {reason_code}"
+
+        client = mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            client_id=f"ad-scheduled-{uuid.uuid4().hex[:12]}",
+            clean_session=True,
+        )
+        if self.username:
+            client.username_pw_set(self.username, self.password)
+        client.max_inflight_messages_set(self.window)
+        client.on_connect = on_connect
+        client.on_publish = self._on_publish
+        try:
+            client.connect(self.broker_host, self.broker_port, keepalive=60)
+        except Exception as e:
+            self._error = f"Connection failed: {e}"
+            return
+        client.loop_start()
+        try:
+            if not connected.wait(10):
+                self._error = self._error or f"No CONNACK from {self.broker_host}:{self.broker_port}"
+                return
+            self._publish_loop(client)
+        finally:
+            self._finished = time.perf_counter()
+            client.disconnect()
+            client.loop_stop()
+
+    def _publish_loop(self, client: mqtt.Client):
+        bucket, render, samples = self._bucket, self._render, self._samples
+        topic, qos, retain = self.topic, self.qos, self.retain
+        self._started = time.perf_counter()
+        bucket.reset()
+        deadline = self._started + self.duration if self.duration else None
+        seq = 0
+        consecutive = 0
+        while not self._stopping.is_set():
+            if self.count and seq >= self.count:
+                break
+            due = bucket.wait(self._stopping.wait)
+            now = time.perf_counter()
+            if self._stopping.is_set() or (deadline is not None and now >= deadline):
+                break
+            payload = render(topic, 0, seq)
+            seq += 1
+            try:
+                rc = client.publish(topic, payload, qos=qos, retain=retain).rc
+                failure = None if rc == mqtt.MQTT_ERR_SUCCESS else mqtt.error_string(rc)
+            except ValueError as e:  # topic or payload paho rejects outright
+                rc, failure = mqtt.MQTT_ERR_INVAL, str(e)
+            if failure is None:
+                consecutive = 0
+                self._sent += 1
+                samples.append((now, now - due))
+                continue
+            self._failed += 1
+            self._last_failure = failure
+            if rc in TRANSIENT_ERRORS:
+                continue
+            consecutive += 1
+            if consecutive >= MAX_CONSECUTIVE_FAILURES:
+                self._error = f"{consecutive} consecutive failures, last: {failure}"
+                break
+
+
+# ---------------------------------------------------------------------------
+# Global singleton — survives Streamlit reruns and page navigation
+# ---------------------------------------------------------------------------
+_scheduled: ScheduledPublisher | None = None
+_scheduled_lock = threading.Lock()
+
+
+def get_scheduled_publisher() -> ScheduledPublisher | None:
+    """Return the running (or last) scheduled publisher, if one was started."""
+    return _scheduled
+
+
+def start_scheduled_publisher(*args, **kwargs) -> ScheduledPublisher:
+    """Stop any running schedule and start a new :class:`ScheduledPublisher`."""
+    global _scheduled
+    with _scheduled_lock:
+        if _scheduled is not None:
+            _scheduled.stop()
+        _scheduled = ScheduledPublisher(*args, **kwargs).start()
+        return _scheduled
+
+
+def stop_scheduled_publisher():
+    with _scheduled_lock:
+        if _scheduled is not None:
+            _scheduled.stop()
@@ -0,0 +1,356 @@
+"""
+Crash-safe on-disk capture of received messages.
+Messages are appended to rotating binary segment files by a background
+writer thread (batched writes, one fsync per batch) and read back through
+memory-mapped files, so millions of historical messages can be paged
+through without loading them into RAM.
+
+Record layout (little endian)::
+
+    crc32 u32 | body_len u32 | seq i64 | ts f64 | flags u8 | topic_len u16 | topic | payload
+
+The CRC covers the body. A torn or corrupt record at the end of the
+newest segment (power loss mid-write) is truncated away on open.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import deque
+from dataclasses import dataclass
+
+from message_store import MQTTMessage
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_RETAIN_BYTES = 1024 * 1024 * 1024
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_MAX_PENDING = 100_000
+_WAKE_AT = 4096  # pending messages that wake the writer before its flush interval
+
+_FRAME = struct.Struct("<II")
+_BODY = struct.Struct("<qdBH")
+_SUFFIX = ".seg"
+
+
+@dataclass
+class SegmentLogStats:
+    segments: int
+    total_bytes: int
+    written: int
+    dropped: int    # messages discarded because the writer fell too far behind
+    pending: int
+    error: str | None
+
+
+def encode_record(topic: str, payload: bytes, qos: int, retain: bool, ts: float, seq: int) -> bytes:
+    topic_bytes = topic.encode("utf-8")
+    body = _BODY.pack(seq, ts, qos | (4 if retain else 0), len(topic_bytes)) + topic_bytes + payload
+    return _FRAME.pack(zlib.crc32(body), len(body)) + body
+
+
+def _decode_record(buf, offset: int) -> MQTTMessage:
+    _crc, length = _FRAME.unpack_from(buf, offset)
+    start = offset + _FRAME.size
+    seq, ts, flags, topic_len = _BODY.unpack_from(buf, start)
+    topic_start = start + _BODY.size
+    payload_start = topic_start + topic_len
+    topic = str(buf[topic_start:payload_start], "utf-8")
+    return MQTTMessage(topic, bytes(buf[payload_start:start + length]), flags & 3, bool(flags & 4), ts, seq)
+
+
+def _scan(buf, offset: int, end: int, offsets: array, verify: bool) -> int:
+    """Append the offsets of complete records in ``buf[offset:end]``; return where scanning stopped."""
+    while offset + _FRAME.size <= end:
+        crc, length = _FRAME.unpack_from(buf, offset)
+        stop = offset + _FRAME.size + length
+        if length < _BODY.size or stop > end:
+            break
+        if verify and zlib.crc32(buf[offset + _FRAME.size:stop]) != crc:
+            break
+        offsets.append(offset)
+        offset = stop
+    return offset
+
+
+class SegmentLog:
+    """Append-only segment log with a background writer and retention.
+
+    :meth:`append` only pushes onto an in-memory deque, so it is safe to call
+    from the paho network thread. If the writer falls more than
+    ``max_pending`` messages behind, new messages are dropped and counted
+    rather than growing memory without bound.
+
+    Segments are named after the index of their first record, so the
+    global record index stays stable as old segments are deleted.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        retain_bytes: int | None = DEFAULT_RETAIN_BYTES,
+        retain_seconds: float | None = None,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        if segment_bytes < 1024:
+            raise ValueError("segment_bytes must be at least 1024")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retain_bytes = retain_bytes
+        self.retain_seconds = retain_seconds
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: deque[tuple] = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._accepted = 0
+        self._written = 0
+        self._dropped = 0
+        self._lost = 0  # accepted but lost to a failed disk write
+        self._last_retention = 0.0
+        self._error: str | None = None
+        self._readers: dict[str, _MappedSegment] = {}
+        self._reader_lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._next_index = self._recover()
+        self._file = None
+        self._file_size = 0
+        self._thread = threading.Thread(target=self._run, name="segment-log-writer", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def append(self, topic: str, payload: bytes, qos: int, retain: bool, ts: float, seq: int = 0):
+        if len(self._pending) >= self.max_pending:
+            self._dropped += 1
+            return
+        self._accepted += 1
+        self._pending.append((topic, payload, qos, retain, ts, seq))
+        if len(self._pending) == _WAKE_AT:
+            self._wakeup.set()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything appended so far is on disk (or dropped)."""
+        target = self._accepted
+        deadline = time.monotonic() + timeout
+        self._wakeup.set()
+        while self._written + self._lost < target:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout=10)
+
+    def stats(self) -> SegmentLogStats:
+        segments = self._segment_paths()
+        return SegmentLogStats(
+            segments=len(segments),
+            total_bytes=sum(os.path.getsize(p) for p in segments if os.path.exists(p)),
+            written=self._written,
+            dropped=self._dropped + self._lost,
+            pending=len(self._pending),
+            error=self._error,
+        )
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._write_pending()
+                if time.monotonic() - self._last_retention > 60:
+                    self._enforce_retention()
+            except OSError as e:
+                # Keep accepting messages; the next batch retries the disk
+                self._error = str(e)
+                self._close_file()
+            if self._stopping and not self._pending:
+                break
+        self._close_file()
+
+    def _write_pending(self):
+        pending = self._pending
+        while pending:
+            if self._file is None or self._file_size >= self.segment_bytes:
+                self._rotate()
+            chunk = []
+            size = self._file_size
+            while pending and size < self.segment_bytes:
+                record = encode_record(*pending.popleft())
+                chunk.append(record)
+                size += len(record)
+            try:
+                self._file.write(b"".join(chunk))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError:
+                self._lost += len(chunk)
+                # Cut off a partial batch so the segment stays readable
+                try:
+                    self._file.truncate(self._file_size)
+                except (OSError, ValueError):
+                    pass
+                raise
+            self._file_size = size
+            self._next_index += len(chunk)
+            self._written += len(chunk)
+        self._error = None
+
+    def _rotate(self):
+        self._close_file()
+        path = os.path.join(self.directory, f"{self._next_index:020d}{_SUFFIX}")
+        self._file = open(path, "ab")
+        self._file_size = self._file.tell()
+        self._enforce_retention()
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _enforce_retention(self):
+        self._last_retention = time.monotonic()
+        segments = self._segment_paths()
+        active = segments[-1] if segments else None
+        sizes = {p: os.path.getsize(p) for p in segments}
+        total = sum(sizes.values())
+        cutoff = time.time() - self.retain_seconds if self.retain_seconds else None
+        for path in segments:
+            if path == active:
+                break
+            too_big = self.retain_bytes is not None and total > self.retain_bytes
+            too_old = cutoff is not None and os.path.getmtime(path) < cutoff
+            if not (too_big or too_old):
+                break
+            os.remove(path)
+            total -= sizes[path]
+
+    def _recover(self) -> int:
+        """Truncate a torn tail off the newest segment; return the next record index."""
+        segments = self._segment_paths()
+        if not segments:
+            return 0
+        last = segments[-1]
+        first_index = int(os.path.basename(last)[:-len(_SUFFIX)])
+        size = os.path.getsize(last)
+        if size == 0:
+            return first_index
+        offsets = array("q")
+        with open(last, "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+            valid = _scan(data, 0, size, offsets, verify=True)
+        if valid < size:
+            with open(last, "r+b") as f:
+                f.truncate(valid)
+                os.fsync(f.fileno())
+        return first_index + len(offsets)
+
+    def _segment_paths(self) -> list[str]:
+        try:
+            names = sorted(n for n in os.listdir(self.directory) if n.endswith(_SUFFIX))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, n) for n in names]
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def count(self) -> int:
+        """Records currently on disk across all retained segments."""
+        segments = self._mapped_segments()
+        if not segments:
+            return 0
+        return segments[-1].first_index + len(segments[-1]) - segments[0].first_index
+
+    def first_index(self) -> int:
+        segments = self._mapped_segments()
+        return segments[0].first_index if segments else 0
+
+    def read(self, start: int, limit: int) -> list[MQTTMessage]:
+        """Up to ``limit`` records from global record index ``start``, oldest first."""
+        out: list[MQTTMessage] = []
+        for seg in self._mapped_segments():
+            if len(out) >= limit:
+                break
+            end_index = seg.first_index + len(seg)
+            if end_index <= start:
+                continue
+            i = max(start, seg.first_index) - seg.first_index
+            out.extend(seg.read(i, limit - len(out)))
+        return out
+
+    def tail(self, n: int) -> list[MQTTMessage]:
+        segments = self._mapped_segments()
+        if not segments:
+            return []
+        end = segments[-1].first_index + len(segments[-1])
+        return self.read(max(segments[0].first_index, end - n), n)
+
+    def _mapped_segments(self) -> list["_MappedSegment"]:
+        """Mapped views of every segment on disk, refreshed for files that grew."""
+        with self._reader_lock:
+            paths = self._segment_paths()
+            live = set(paths)
+            for path in [p for p in self._readers if p not in live]:
+                del self._readers[path]
+            out = []
+            for path in paths:
+                seg = self._readers.get(path)
+                if seg is None:
+                    seg = self._readers[path] = _MappedSegment(path)
+                try:
+                    seg.refresh()
+                except (FileNotFoundError, ValueError):
+                    continue  # deleted by retention between listing and mapping
+                out.append(seg)
+            return out
+
+
+class _MappedSegment:
+    """Read-only mmap of one segment plus the offsets of its records."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.first_index = int(os.path.basename(path)[:-len(_SUFFIX)])
+        self.offsets = array("q")
+        self._map: mmap.mmap | None = None
+        self._mapped_size = 0
+        self._scanned = 0
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def refresh(self):
+        size = os.path.getsize(self.path)
+        if size == self._mapped_size or size == 0:
+            return
+        # The writer only appends, so existing offsets stay valid after a remap.
+        # The old map is left to the garbage collector: another session may
+        # still be decoding from it.
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        self._mapped_size = size
+        self._scanned = _scan(self._map, self._scanned, size, self.offsets, verify=False)
+
+    def read(self, i: int, limit: int) -> list[MQTTMessage]:
+        # Offsets first: the map they point into is always published before them
+        offsets = self.offsets[i:i + limit]
+        buf = self._map
+        if buf is None:
+            return []
+        return [_decode_record(buf, off) for off in offsets]
@@ -0,0 +1,164 @@
+"""
+Secondary index from topic to the sequence numbers of retained messages.
+Maintained incrementally by the message store as messages are appended and
+evicted, so topic-filtered views cost time proportional to the matching
+messages instead of a scan of the whole buffer.
+
+Concrete topics are also kept in a level tree, which answers MQTT wildcard
+filters (``+``/``#``) by walking only the matching branches.
+"""
+
+from array import array
+
+from topic_trie import filter_matches
+
+
+class _Postings:
+    """Ascending seqs for one topic; evicted entries are skipped via ``start``."""
+
+    __slots__ = ("seqs", "start")
+
+    def __init__(self):
+        self.seqs = array("q")
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.seqs) - self.start
+
+
+class _Level:
+    __slots__ = ("children", "topic")
+
+    def __init__(self):
+        self.children: dict[str, _Level] = {}
+        self.topic: str | None = None
+
+
+def is_wildcard(pattern: str) -> bool:
+    return "+" in pattern or "#" in pattern
+
+
+def topic_matches_pattern(pattern: str, topic: str) -> bool:
+    """Single-topic version of :meth:`TopicIndex.match_topics` semantics."""
+    if not is_wildcard(pattern):
+        return pattern.lower() in topic.lower()
+    return filter_matches(pattern, topic)
+
+
+class TopicIndex:
+    """Topic → seq postings plus a topic-level tree.
+
+    Single writer (the store's append path) and lock-free readers: readers
+    only take atomic snapshots (slices, ``list(dict)``) and validate seqs
+    against the store, so a concurrent eviction just yields a stale seq the
+    store no longer returns.
+    """
+
+    def __init__(self):
+        self._postings: dict[str, _Postings] = {}
+        self._root = _Level()
+
+    def add(self, topic: str, seq: int):
+        postings = self._postings.get(topic)
+        if postings is None:
+            postings = _Postings()
+            node = self._root
+            for level in topic.split("/"):
+                node = node.children.setdefault(level, _Level())
+            node.topic = topic
+            self._postings[topic] = postings
+        postings.seqs.append(seq)
+
+    def evict(self, topic: str, seq: int):
+        """Drop ``seq``; stores evict FIFO so it is always the topic's oldest."""
+        postings = self._postings.get(topic)
+        if postings is None:
+            return
+        postings.start += 1
+        if postings.start >= len(postings.seqs):
+            self._remove_topic(topic)
+        elif postings.start > 1024 and postings.start * 2 > len(postings.seqs):
+            del postings.seqs[:postings.start]
+            postings.start = 0
+
+    def clear(self):
+        self._postings = {}
+        self._root = _Level()
+
+    def topics(self) -> list[str]:
+        return list(self._postings)
+
+    def match_topics(self, pattern: str) -> list[str]:
+        """Known topics matching an MQTT filter, or containing ``pattern`` as text."""
+        if not is_wildcard(pattern):
+            needle = pattern.lower()
+            return [t for t in list(self._postings) if needle in t.lower()]
+        return self.match_filter(pattern)
+
+    def match_filter(self, topic_filter: str) -> list[str]:
+        """Known topics matching ``topic_filter`` as an MQTT filter (exact levels, ``+``/``#``)."""
+        levels = topic_filter.split("/")
+        matched: list[str] = []
+        stack: list[tuple[_Level, int]] = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth == len(levels):
+                if node.topic is not None:
+                    matched.append(node.topic)
+                continue
+            level = levels[depth]
+            if level == "#":
+                # '#' also matches the parent level itself
+                if node.topic is not None and depth > 0:
+                    matched.append(node.topic)
+                matched.extend(self._subtree_topics(node, skip_system=depth == 0))
+            elif level == "+":
+                stack.extend((child, depth + 1) for name, child in list(node.children.items())
+                             if not (depth == 0 and name.startswith("$")))
+            else:
+                child = node.children.get(level)
+                if child is not None:
+                    stack.append((child, depth + 1))
+        return matched
+
+    def count(self, topics: list[str]) -> int:
+        postings = self._postings
+        return sum(len(p) for t in topics if (p := postings.get(t)) is not None)
+
+    def newest(self, topics: list[str], limit: int) -> list[int]:
+        """The newest ``limit`` seqs across ``topics``, newest first."""
+        candidates: list[int] = []
+        postings = self._postings
+        for t in topics:
+            p = postings.get(t)
+            if p is not None:
+                seqs = p.seqs
+                candidates.extend(seqs[max(p.start, len(seqs) - limit):])
+        candidates.sort(reverse=True)
+        return candidates[:limit]
+
+    def _subtree_topics(self, node: _Level, skip_system: bool) -> list[str]:
+        out: list[str] = []
+        stack = [(name, child) for name, child in list(node.children.items())
+                 if not (skip_system and name.startswith("$"))]
+        while stack:
+            _name, n = stack.pop()
+            if n.topic is not None:
+                out.append(n.topic)
+            stack.extend(list(n.children.items()))
+        return out
+
+    def _remove_topic(self, topic: str):
+        del self._postings[topic]
+        levels = topic.split("/")
+        path = [self._root]
+        for level in levels:
+            child = path[-1].children.get(level)
+            if child is None:
+                return
+            path.append(child)
+        path[-1].topic = None
+        for level, parent, node in zip(reversed(levels), reversed(path[:-1]), reversed(path[1:])):
+            if node.children or node.topic is not None:
+                break
+            del parent.children[level]
@@ -0,0 +1,121 @@
+"""
+MQTT topic-filter trie.
+Maps a concrete topic to every subscribed filter it matches by walking
+the topic levels once, instead of testing each filter in turn.
+"""
+
+
+def validate_filter(topic_filter: str):
+    """Raise ValueError if ``topic_filter`` is not a valid MQTT topic filter."""
+    if not topic_filter:
+        raise ValueError("Topic filter cannot be empty")
+    levels = topic_filter.split("/")
+    for i, level in enumerate(levels):
+        if "#" in level and (level != "#" or i != len(levels) - 1):
+            raise ValueError(f"'#' must be the last level on its own: {topic_filter}")
+        if "+" in level and level != "+":
+            raise ValueError(f"'+' must occupy a whole level: {topic_filter}")
+
+
+def filter_matches(topic_filter: str, topic: str) -> bool:
+    """True if ``topic`` matches ``topic_filter`` (single filter, no trie)."""
+    trie = TopicTrie()
+    trie.add(topic_filter)
+    return bool(trie.match(topic))
+
+
+class _Node:
+    __slots__ = ("children", "filter")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.filter: str | None = None
+
+
+class TopicTrie:
+    """Set of topic filters indexed by level.
+
+    ``match`` costs O(topic depth × wildcard branches) regardless of how
+    many filters are stored. Not thread-safe for concurrent mutation;
+    callers that match from another thread should swap in a new trie
+    rather than mutate a shared one.
+    """
+
+    MATCH_CACHE_SIZE = 10_000
+
+    def __init__(self, filters=()):
+        self._root = _Node()
+        self._filters: set[str] = set()
+        self._match_cache: dict[str, tuple[str, ...]] = {}
+        for f in filters:
+            self.add(f)
+
+    def __contains__(self, topic_filter: str) -> bool:
+        return topic_filter in self._filters
+
+    def __len__(self) -> int:
+        return len(self._filters)
+
+    def __iter__(self):
+        return iter(sorted(self._filters))
+
+    def add(self, topic_filter: str):
+        validate_filter(topic_filter)
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.children.setdefault(level, _Node())
+        node.filter = topic_filter
+        self._filters.add(topic_filter)
+        self._match_cache = {}
+
+    def remove(self, topic_filter: str):
+        if topic_filter not in self._filters:
+            return
+        self._filters.discard(topic_filter)
+        self._match_cache = {}
+        path = [self._root]
+        levels = topic_filter.split("/")
+        for level in levels:
+            path.append(path[-1].children[level])
+        path[-1].filter = None
+        # Prune empty branches bottom-up
+        for level, parent, node in zip(reversed(levels), reversed(path[:-1]), reversed(path[1:])):
+            if node.children or node.filter is not None:
+                break
+            del parent.children[level]
+
+    def match_cached(self, topic: str) -> tuple[str, ...]:
+        """Like :meth:`match`, but returns a tuple shared by every call for ``topic``."""
+        cache = self._match_cache
+        matched = cache.get(topic)
+        if matched is None:
+            if len(cache) >= self.MATCH_CACHE_SIZE:
+                cache.clear()
+            matched = cache[topic] = tuple(self.match(topic))
+        return matched
+
+    def match(self, topic: str) -> list[str]:
+        """Every stored filter that matches the concrete ``topic``."""
+        levels = topic.split("/")
+        # Wildcards at the first level never match $-prefixed system topics
+        system = topic.startswith("$")
+        matched: list[str] = []
+        stack: list[tuple[_Node, int]] = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            wild_ok = not (system and depth == 0)
+            hash_node = node.children.get("#") if wild_ok else None
+            if hash_node is not None and hash_node.filter is not None:
+                matched.append(hash_node.filter)
+            if depth == len(levels):
+                if node.filter is not None:
+                    matched.append(node.filter)
+                continue
+            child = node.children.get(levels[depth])
+            if child is not None:
+                stack.append((child, depth + 1))
+            if wild_ok:
+                plus = node.children.get("+")
+                if plus is not None:
+                    stack.append((plus, depth + 1))
+        return matched